@@ -0,0 +1,52 @@
+"""Comparison of two results of pipeline.py, e.g. before and after a commit.
+
+Configurations are matched on their parameters, and the median latency of each stage is compared.
+Exits with an error if a stage of a configuration is slower than --threshold times the baseline.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from pipeline import STAGES
+
+def config_key(config: dict) -> tuple:
+    return tuple(sorted((key, value) for key, value in config.items() if key != "repeat"))
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list:
+    """Prints the ratio of each stage, and returns the (configuration, stage, ratio) regressions."""
+    baseline_results = {config_key(result["config"]): result for result in baseline["results"]}
+
+    regressions = []
+    for result in candidate["results"]:
+        reference = baseline_results.get(config_key(result["config"]))
+        if reference is None:
+            continue
+
+        config = result["config"]
+        name = f"depth={config['depth']} n_trees={config['n_trees']} n_classes={config['n_classes']} degree={config['degree']}"
+        ratios = []
+        for stage in STAGES + ["total"]:
+            if stage == "total":
+                before, after = reference["total_seconds"], result["total_seconds"]
+            else:
+                before, after = reference["timings"][stage]["median"], result["timings"][stage]["median"]
+            ratio = after / before if before > 0 else float("inf")
+            ratios.append(f"{stage} x{ratio:.2f}")
+            if ratio > threshold:
+                regressions.append((name, stage, ratio))
+        print(f"{name}: " + ", ".join(ratios))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio considered a regression")
+    args = parser.parse_args()
+
+    regressions = compare(json.loads(args.baseline.read_text()), json.loads(args.candidate.read_text()),
+                          args.threshold)
+    if regressions:
+        sys.exit("Regressions: " + ", ".join(f"{name} {stage} x{ratio:.2f}" for name, stage, ratio in regressions))
@@ -0,0 +1,45 @@
+"""Import time benchmark of the inference path.
+
+Imports cryptotree.inference in fresh interpreters, reports the median import time, and fails
+if a heavy module such as torch is imported, or if the import takes longer than --max-seconds.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import cryptotree.inference
+duration = time.perf_counter() - start
+from cryptotree.inference import HEAVY_MODULES
+print(json.dumps({"seconds": duration, "heavy_modules": [m for m in HEAVY_MODULES if m in sys.modules]}))
+"""
+
+def measure(module_snippet: str = SNIPPET, repeat: int = 5) -> dict:
+    """Runs the snippet in repeat fresh interpreters, and returns the median time and the heavy modules."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", module_snippet], check=True,
+                                capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    seconds = sorted(run["seconds"] for run in runs)
+    heavy_modules = sorted(set(m for run in runs for m in run["heavy_modules"]))
+    return {"seconds": seconds[len(seconds) // 2], "heavy_modules": heavy_modules}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters")
+    parser.add_argument("--max-seconds", type=float, default=1., help="Maximum median import time")
+    args = parser.parse_args()
+
+    result = measure(repeat=args.repeat)
+    print(f"import cryptotree.inference: {result['seconds']:.3f}s")
+
+    if result["heavy_modules"]:
+        sys.exit(f"Heavy modules imported by the inference path: {result['heavy_modules']}")
+    if result["seconds"] > args.max_seconds:
+        sys.exit(f"Import took {result['seconds']:.3f}s, more than {args.max_seconds}s")
@@ -0,0 +1,181 @@
+"""Benchmark of the homomorphic pipeline.
+
+Builds synthetic random forests over a grid of depths, numbers of trees, numbers of classes and
+activation degrees, and evaluates them end to end with a HomomorphicTreeEvaluator. For each
+configuration, the encryption parameters are the ones of plan_encryption_parameters, and the
+latency of each stage (encrypt, compare, match, decide, reduce, decrypt), the sizes of the
+ciphertexts and the peak RSS are written to a JSON file, which compare.py can diff.
+
+Each configuration runs in its own process, so that the peak RSS is the one of that configuration.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing as mp
+import platform
+import resource
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+
+STAGES = ["encrypt", "compare", "match", "decide", "reduce", "decrypt"]
+
+def build_forest(depth: int, n_trees: int, n_classes: int, degree: int, dilatation_factor: float,
+                 n_features: int, n_samples: int, seed: int):
+    """Trains a random forest on synthetic data, and converts it to a homomorphic forest."""
+    from sklearn.datasets import make_classification
+    from sklearn.ensemble import RandomForestClassifier
+    from cryptotree.tree import SigmoidTreeMaker, NeuralRandomForest
+    from cryptotree.cryptotree import HomomorphicNeuralRandomForest
+
+    X, y = make_classification(n_samples, n_features, n_informative=min(n_features, max(2, n_classes)),
+                               n_redundant=0, n_classes=n_classes, random_state=seed)
+    X = (X - X.min(0)) / (X.max(0) - X.min(0))
+
+    rf = RandomForestClassifier(n_estimators=n_trees, max_depth=depth, random_state=seed).fit(X, y)
+    tree_maker = SigmoidTreeMaker(use_polynomial=True, dilatation_factor=dilatation_factor,
+                                  polynomial_degree=degree)
+    neural_rf = NeuralRandomForest(rf.estimators_, tree_maker, batched=True)
+    return X, HomomorphicNeuralRandomForest(neural_rf), tree_maker.coeffs
+
+def run_config(config: dict) -> dict:
+    """Benchmarks one configuration and returns its results."""
+    from cryptotree.cryptotree import (HomomorphicTreeEvaluator, HomomorphicTreeFeaturizer,
+                                       plan_encryption_parameters)
+    from cryptotree.seal_helper import (create_seal_globals, seal_to_bytes, mod_switch_to_last_inplace,
+                                        raw_size)
+    import cryptotree.polynomials as polynomials
+    import tenseal.sealapi as seal
+
+    X, h_rf, coeffs = build_forest(config["depth"], config["n_trees"], config["n_classes"], config["degree"],
+                                   config["dilatation_factor"], config["n_features"], config["n_samples"],
+                                   config["seed"])
+    polynomial_evaluator = getattr(polynomials, config["polynomial_evaluator"])
+
+    start = time.perf_counter()
+    plan = plan_encryption_parameters(h_rf, coeffs, polynomial_evaluator,
+                                      matrix_multiplication=config["matrix_multiplication"])
+    seal_globals = {}
+    create_seal_globals(seal_globals, plan)
+    keygen_seconds = time.perf_counter() - start
+
+    featurizer = HomomorphicTreeFeaturizer(h_rf.return_comparator(), seal_globals["encoder"],
+                                           seal_globals["encryptor"], seal_globals["scale"])
+    evaluator = HomomorphicTreeEvaluator.from_model(h_rf, coeffs, polynomial_evaluator,
+                                                    seal_globals["evaluator"], seal_globals["encoder"],
+                                                    seal_globals["relin_keys"], seal_globals["galois_keys"],
+                                                    seal_globals["scale"],
+                                                    matrix_multiplication=config["matrix_multiplication"])
+
+    start = time.perf_counter()
+    evaluator.compile(featurizer.encrypt(X[0]))
+    compile_seconds = time.perf_counter() - start
+
+    timings = {stage: [] for stage in STAGES}
+    for i in range(config["repeat"]):
+        x = X[i % len(X)]
+
+        start = time.perf_counter()
+        ctx = featurizer.encrypt(x)
+        timings["encrypt"].append(time.perf_counter() - start)
+
+        output = ctx
+        for stage in ["compare", "match", "decide", "reduce"]:
+            start = time.perf_counter()
+            output = getattr(evaluator, stage)(output)
+            timings[stage].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ptx = seal.Plaintext()
+        seal_globals["decryptor"].decrypt(output, ptx)
+        seal_globals["encoder"].decode_double(ptx)
+        timings["decrypt"].append(time.perf_counter() - start)
+
+    mod_switch_to_last_inplace(output, seal_globals["evaluator"], seal_globals["context"])
+    seeded_featurizer = HomomorphicTreeFeaturizer(h_rf.return_comparator(), seal_globals["encoder"],
+                                                  seal.Encryptor(seal_globals["context"], seal_globals["secret_key"]),
+                                                  seal_globals["scale"], use_symmetric_key=True)
+    sizes = {
+        "input_bytes": len(seal_to_bytes(ctx)),
+        "input_raw_bytes": raw_size(ctx),
+        "input_seeded_bytes": len(seal_to_bytes(seeded_featurizer.encrypt(X[0], seeded=True))),
+        "output_bytes": len(seal_to_bytes(output)),
+        "output_raw_bytes": raw_size(output),
+        "galois_keys_bytes": len(seal_to_bytes(seal_globals["galois_keys"])),
+        "relin_keys_bytes": len(seal_to_bytes(seal_globals["relin_keys"])),
+    }
+
+    timings = {stage: {"median": float(np.median(values)), "min": float(np.min(values)), "runs": values}
+               for stage, values in timings.items()}
+    total = sum(timings[stage]["median"] for stage in STAGES)
+
+    return {
+        "config": config,
+        "parameters": {"poly_modulus_degree": plan.poly_modulus_degree, "moduli": plan.moduli,
+                       "depth": plan.depth, "slots": plan.slots, "galois_steps": plan.galois_steps},
+        "model": {"n_slot": evaluator.n_slot, "n_diagonals": evaluator.n_diagonals, "use_bsgs": evaluator.use_bsgs},
+        "keygen_seconds": keygen_seconds,
+        "compile_seconds": compile_seconds,
+        "timings": timings,
+        "total_seconds": total,
+        "sizes": sizes,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def environment() -> dict:
+    """Describes the commit and the machine, to compare results across commits."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = None
+    import tenseal
+    return {"commit": commit, "date": datetime.datetime.now().isoformat(), "python": platform.python_version(),
+            "tenseal": getattr(tenseal, "__version__", None), "platform": platform.platform(),
+            "cpu_count": mp.cpu_count()}
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",")]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depths", type=int_list, default=[3, 5], help="Comma separated max depths")
+    parser.add_argument("--n-trees", type=int_list, default=[1, 4], help="Comma separated numbers of trees")
+    parser.add_argument("--n-classes", type=int_list, default=[2], help="Comma separated numbers of classes")
+    parser.add_argument("--degrees", type=int_list, default=[16], help="Comma separated activation degrees")
+    parser.add_argument("--dilatation-factor", type=float, default=16)
+    parser.add_argument("--n-features", type=int, default=8)
+    parser.add_argument("--n-samples", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5, help="Number of evaluations per configuration")
+    parser.add_argument("--polynomial-evaluator", default="polyeval_odd_even",
+                        choices=["polyeval_tree", "polyeval_paterson_stockmeyer", "polyeval_odd_even"])
+    parser.add_argument("--matrix-multiplication", default="auto", choices=["auto", "diagonal", "bsgs"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"))
+    args = parser.parse_args()
+
+    configs = [dict(depth=depth, n_trees=n_trees, n_classes=n_classes, degree=degree,
+                    dilatation_factor=args.dilatation_factor, n_features=args.n_features,
+                    n_samples=args.n_samples, repeat=args.repeat,
+                    polynomial_evaluator=args.polynomial_evaluator,
+                    matrix_multiplication=args.matrix_multiplication, seed=args.seed)
+               for depth, n_trees, n_classes, degree
+               in itertools.product(args.depths, args.n_trees, args.n_classes, args.degrees)]
+
+    results = []
+    # A fresh process per configuration, for independent peak RSS and no warm caches
+    with mp.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        for result in pool.imap(run_config, configs):
+            config = result["config"]
+            print(f"depth={config['depth']} n_trees={config['n_trees']} n_classes={config['n_classes']} "
+                  f"degree={config['degree']}: {result['total_seconds']:.3f}s, "
+                  f"{result['peak_rss_mb']:.0f} MB peak RSS", flush=True)
+            results.append(result)
+
+    args.output.write_text(json.dumps({"environment": environment(), "results": results}, indent=2))
+    print(f"Results saved at {args.output}")
@@ -14,10 +14,17 @@ index = {"compute_leaves": "00_activations.ipynb",
          "sigmoid_path_to_linear": "00_activations.ipynb",
          "sigmoid_linear_leaf_matcher": "00_activations.ipynb",
          "sigmoid_classification_head": "00_activations.ipynb",
+         "sigmoid_classification_head_weights": "00_activations.ipynb",
          "tanh_path_to_weight": "00_activations.ipynb",
          "tanh_path_to_linear": "00_activations.ipynb",
          "tanh_linear_leaf_matcher": "00_activations.ipynb",
          "tanh_classification_head": "00_activations.ipynb",
+         "tanh_classification_head_weights": "00_activations.ipynb",
+         "tree_paths": "00_activations.ipynb",
+         "linear_node_comparator_weights": "00_activations.ipynb",
+         "sigmoid_tree_weights": "00_activations.ipynb",
+         "tanh_tree_weights": "00_activations.ipynb",
+         "PolynomialActivation": "01_tree.ipynb",
          "NeuralTreeMaker": "01_tree.ipynb",
          "NeuralDecisionTree": "01_tree.ipynb",
          "DEFAULT_POLYNOMIAL_DEGREE": "01_tree.ipynb",
@@ -30,8 +37,12 @@ index = {"compute_leaves": "00_activations.ipynb",
          "register_output_check": "01_tree.ipynb",
          "pad_tensor": "01_tree.ipynb",
          "pad_neural_tree": "01_tree.ipynb",
+         "make_trees_weights": "01_tree.ipynb",
          "NeuralRandomForest": "01_tree.ipynb",
+         "SparseNeuralRandomForest": "01_tree.ipynb",
          "CrossEntropyLabelSmoothing": "01_tree.ipynb",
+         "test_batched_forest": "01_tree.ipynb",
+         "test_sparse_forest": "01_tree.ipynb",
          "print_vector": "02_seal_helper.ipynb",
          "print_ptx": "02_seal_helper.ipynb",
          "print_ctx": "02_seal_helper.ipynb",
@@ -39,10 +50,21 @@ index = {"compute_leaves": "00_activations.ipynb",
          "print_range_ctx": "02_seal_helper.ipynb",
          "float_to_ctx": "02_seal_helper.ipynb",
          "vrep": "02_seal_helper.ipynb",
+         "EncryptionPlan": "02_seal_helper.ipynb",
+         "galois_elements": "02_seal_helper.ipynb",
          "create_seal_globals": "02_seal_helper.ipynb",
          "append_globals_to_builtins": "02_seal_helper.ipynb",
          "save_seal_globals": "02_seal_helper.ipynb",
          "load_seal_globals": "02_seal_helper.ipynb",
+         "PlaintextCache": "02_seal_helper.ipynb",
+         "seal_to_bytes": "02_seal_helper.ipynb",
+         "seal_from_bytes": "02_seal_helper.ipynb",
+         "mod_switch_to_last_inplace": "02_seal_helper.ipynb",
+         "compression_mode": "02_seal_helper.ipynb",
+         "raw_size": "02_seal_helper.ipynb",
+         "serialization_report": "02_seal_helper.ipynb",
+         "print_serialization_report": "02_seal_helper.ipynb",
+         "COMPRESSION_MODES": "02_seal_helper.ipynb",
          "chebyshev_approximation": "03_polynomials.ipynb",
          "polynomial_approximation_coefficients": "03_polynomials.ipynb",
          "plot_graph_function_approximation": "03_polynomials.ipynb",
@@ -50,26 +72,104 @@ index = {"compute_leaves": "00_activations.ipynb",
          "compute_all_powers": "03_polynomials.ipynb",
          "multiply_and_add_coeffs": "03_polynomials.ipynb",
          "polyeval_tree": "03_polynomials.ipynb",
+         "polyeval_tree_depth": "03_polynomials.ipynb",
+         "paterson_stockmeyer_cost": "03_polynomials.ipynb",
+         "choose_baby_step": "03_polynomials.ipynb",
+         "PowerLadder": "03_polynomials.ipynb",
+         "polyeval_paterson_stockmeyer": "03_polynomials.ipynb",
+         "polynomial_parity": "03_polynomials.ipynb",
+         "polyeval_odd_even": "03_polynomials.ipynb",
+         "polynomial_evaluator_depth": "03_polynomials.ipynb",
          "eval_polynomial": "03_polynomials.ipynb",
          "test_polynomial": "03_polynomials.ipynb",
+         "test_polynomial_evaluators": "03_polynomials.ipynb",
          "pad_along_axis": "04_linear.ipynb",
          "arrays_to_ptx": "04_linear.ipynb",
          "extract_diagonals": "04_linear.ipynb",
          "matrix_multiply_diagonals": "04_linear.ipynb",
+         "bsgs_dimensions": "04_linear.ipynb",
+         "bsgs_rotation_count": "04_linear.ipynb",
+         "diagonal_rotation_count": "04_linear.ipynb",
+         "bsgs_rotation_steps": "04_linear.ipynb",
+         "diagonal_rotation_steps": "04_linear.ipynb",
+         "prerotate_diagonals": "04_linear.ipynb",
+         "matrix_multiply_bsgs": "04_linear.ipynb",
          "sum_reduce": "04_linear.ipynb",
+         "sum_reduce_rotation_steps": "04_linear.ipynb",
          "dot_product_plain": "04_linear.ipynb",
          "test_sum": "04_linear.ipynb",
          "test_dot_product_plain": "04_linear.ipynb",
+         "test_matrix_multiply_bsgs": "04_linear.ipynb",
          "to_list_and_duplicate": "05_cryptotree.ipynb",
          "to_list_and_pad": "05_cryptotree.ipynb",
+         "batch_stride": "05_cryptotree.ipynb",
+         "tile_to_batch": "05_cryptotree.ipynb",
          "HomomorphicModel": "05_cryptotree.ipynb",
          "HomomorphicDecisionTree": "05_cryptotree.ipynb",
          "HomomorphicNeuralRandomForest": "05_cryptotree.ipynb",
+         "ShardedHomomorphicNeuralRandomForest": "05_cryptotree.ipynb",
+         "use_bsgs_for": "05_cryptotree.ipynb",
+         "evaluator_rotation_steps": "05_cryptotree.ipynb",
          "HomomorphicTreeEvaluator": "05_cryptotree.ipynb",
+         "COMPILED_EVALUATOR_VERSION": "05_cryptotree.ipynb",
+         "MATRIX_MULTIPLICATIONS": "05_cryptotree.ipynb",
+         "ShardedHomomorphicTreeEvaluator": "05_cryptotree.ipynb",
          "HomomorphicTreeFeaturizer": "05_cryptotree.ipynb",
+         "ShardedHomomorphicTreeFeaturizer": "05_cryptotree.ipynb",
+         "model_output_bound": "05_cryptotree.ipynb",
+         "model_rotation_steps": "05_cryptotree.ipynb",
+         "plan_encryption_parameters": "05_cryptotree.ipynb",
+         "POLY_MODULUS_DEGREES": "05_cryptotree.ipynb",
+         "test_encrypt_batch": "05_cryptotree.ipynb",
+         "test_sharded": "05_cryptotree.ipynb",
+         "test_encryption_plan": "05_cryptotree.ipynb",
+         "test_evaluate_container": "05_cryptotree.ipynb",
+         "test_compiled_evaluator": "05_cryptotree.ipynb",
          "ColumnSelector": "06_preprocessing.ipynb",
          "Reshaper": "06_preprocessing.ipynb",
-         "Featurizer": "06_preprocessing.ipynb"}
+         "Featurizer": "06_preprocessing.ipynb",
+         "read_chunks": "06_preprocessing.ipynb",
+         "ColumnarFeaturizer": "06_preprocessing.ipynb",
+         "FeatureLookup": "06_preprocessing.ipynb",
+         "compile_featurizer": "06_preprocessing.ipynb",
+         "test_columnar_featurizer": "06_preprocessing.ipynb",
+         "test_feature_lookup": "06_preprocessing.ipynb",
+         "EvaluationServer": "07_serving.ipynb",
+         "write_frame": "07_serving.ipynb",
+         "read_frame": "07_serving.ipynb",
+         "STATUS_OK": "07_serving.ipynb",
+         "STATUS_ERROR": "07_serving.ipynb",
+         "AsyncEvaluationServer": "07_serving.ipynb",
+         "EvaluationClient": "07_serving.ipynb",
+         "CONTAINER_MAGIC": "08_container.ipynb",
+         "CONTAINER_VERSION": "08_container.ipynb",
+         "CiphertextWriter": "08_container.ipynb",
+         "CiphertextReader": "08_container.ipynb",
+         "test_container": "08_container.ipynb",
+         "HEAVY_MODULES": "09_inference.ipynb",
+         "OperationProfile": "10_profiling.ipynb",
+         "CountingEvaluator": "10_profiling.ipynb",
+         "CountingEncoder": "10_profiling.ipynb",
+         "CKKSSimulator": "11_simulator.ipynb",
+         "SimulatedEncoder": "11_simulator.ipynb",
+         "SimulatedEncryptor": "11_simulator.ipynb",
+         "SimulatedDecryptor": "11_simulator.ipynb",
+         "SimulatedEvaluator": "11_simulator.ipynb",
+         "test_simulator": "11_simulator.ipynb",
+         "chunk_slices": "12_training.ipynb",
+         "row_chunk_size_for_memory": "12_training.ipynb",
+         "chunked_forward": "12_training.ipynb",
+         "chunked_backward": "12_training.ipynb",
+         "fit_streaming": "12_training.ipynb",
+         "StreamingDataset": "12_training.ipynb",
+         "test_chunked": "12_training.ipynb",
+         "forest_graph_weights": "13_export.ipynb",
+         "ForestGraph": "13_export.ipynb",
+         "export_torchscript": "13_export.ipynb",
+         "chebyshev_clenshaw": "13_export.ipynb",
+         "NumpyForest": "13_export.ipynb",
+         "export_numpy": "13_export.ipynb",
+         "test_export": "13_export.ipynb"}
 
 modules = ["activations.py",
            "tree.py",
@@ -77,7 +177,14 @@ modules = ["activations.py",
            "polynomials.py",
            "linear.py",
            "cryptotree.py",
-           "preprocessing.py"]
+           "preprocessing.py",
+           "serving.py",
+           "container.py",
+           "inference.py",
+           "profiling.py",
+           "simulator.py",
+           "training.py",
+           "export.py"]
 
 doc_url = "https://dhuynh95.github.io/cryptotree/"
 
@@ -3,7 +3,9 @@
 __all__ = ['compute_leaves', 'create_linear_node_comparator', 'create_parent_of', 'create_leaf_to_path',
            'shift_bit_eps', 'create_base_vectors', 'create_linear_system', 'BitComparison', 'sigmoid_path_to_weight',
            'sigmoid_path_to_linear', 'sigmoid_linear_leaf_matcher', 'sigmoid_classification_head',
-           'tanh_path_to_weight', 'tanh_path_to_linear', 'tanh_linear_leaf_matcher', 'tanh_classification_head']
+           'sigmoid_classification_head_weights', 'tanh_path_to_weight', 'tanh_path_to_linear',
+           'tanh_linear_leaf_matcher', 'tanh_classification_head', 'tanh_classification_head_weights', 'tree_paths',
+           'linear_node_comparator_weights', 'sigmoid_tree_weights', 'tanh_tree_weights']
 
 # Cell
 import numpy as np
@@ -236,7 +238,17 @@ def sigmoid_classification_head(tree: BaseDecisionTree) -> nn.Linear:
 
     leaves = [i for i,isLeaf in enumerate(is_leaves) if isLeaf]
 
-    values = tree.tree_.value[[0] + leaves]
+    weight, bias = sigmoid_classification_head_weights(tree, leaves)
+
+    head = nn.Linear(weight.shape[1], weight.shape[0])
+    head.weight.data = weight
+    head.bias.data = bias
+
+    return head
+
+def sigmoid_classification_head_weights(tree: BaseDecisionTree, leaves: List[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Weight and bias of the classification head, given the leaves of the tree."""
+    values = tree.tree_.value[[0] + list(leaves)]
     values = torch.tensor(values).float()
     values = values.squeeze(1)
 
@@ -246,11 +258,7 @@ def sigmoid_classification_head(tree: BaseDecisionTree) -> nn.Linear:
     leaf_values = (leaf_values - root_values.unsqueeze(0)) / root_values.max()
     root_values = root_values / root_values.max()
 
-    head = nn.Linear(*leaf_values.shape)
-    head.weight.data = leaf_values.T
-    head.bias.data = root_values
-
-    return head
+    return leaf_values.T, root_values
 
 # Cell
 def tanh_path_to_weight(path, nodes2idx, node_depth, leaf, eps=0.5):
@@ -320,7 +328,17 @@ def tanh_classification_head(tree: BaseDecisionTree) -> nn.Linear:
 
     leaves = [i for i,isLeaf in enumerate(is_leaves) if isLeaf]
 
-    leaf_values = tree.tree_.value[leaves]
+    weight, bias = tanh_classification_head_weights(tree, leaves)
+
+    head = nn.Linear(weight.shape[1], weight.shape[0])
+    head.weight.data = weight
+    head.bias.data = bias
+
+    return head
+
+def tanh_classification_head_weights(tree: BaseDecisionTree, leaves: List[int]) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Weight and bias of the classification head, given the leaves of the tree."""
+    leaf_values = tree.tree_.value[list(leaves)]
     leaf_values = torch.tensor(leaf_values).float()
 
     leaf_values = leaf_values.squeeze(1) / tree.tree_.value[0].max()
@@ -329,8 +347,90 @@ def tanh_classification_head(tree: BaseDecisionTree) -> nn.Linear:
     bias = leaf_values.sum(dim=0) / 2
     leaf_values = leaf_values / 2
 
-    head = nn.Linear(*leaf_values.shape)
-    head.weight.data = leaf_values.T
-    head.bias.data = bias
+    return leaf_values.T, bias
+
+# Cell
+def tree_paths(tree: BaseDecisionTree) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized version of compute_leaves and create_leaf_to_path, which walks up every leaf at once.
+
+    Returns the internal nodes and the leaves in increasing order, then for each leaf the nodes of its path,
+    from its parent to the root, and the bit taken at each of them, 0 for left and 1 for right.
+    Paths are arrays of shape (n_leaves, max_depth), padded with -1."""
+    children_left = tree.tree_.children_left
+    children_right = tree.tree_.children_right
 
-    return head
\ No newline at end of file
+    is_leaves = children_left == children_right
+    internal_nodes = np.flatnonzero(~is_leaves)
+    leaves = np.flatnonzero(is_leaves)
+
+    parent = np.full(tree.tree_.node_count, -1)
+    bit = np.zeros(tree.tree_.node_count, dtype=np.int64)
+    parent[children_left[internal_nodes]] = internal_nodes
+    parent[children_right[internal_nodes]] = internal_nodes
+    bit[children_right[internal_nodes]] = 1
+
+    # The root is the node 0, and each step moves all the leaves which have not reached it yet
+    path_nodes, path_bits = [], []
+    nodes = leaves
+    while (nodes > 0).any():
+        has_parent = nodes > 0
+        path_nodes.append(np.where(has_parent, parent[nodes], -1))
+        path_bits.append(np.where(has_parent, bit[nodes], -1))
+        nodes = np.where(has_parent, parent[nodes], 0)
+
+    return internal_nodes, leaves, np.stack(path_nodes, axis=1), np.stack(path_bits, axis=1)
+
+def linear_node_comparator_weights(tree: BaseDecisionTree, internal_nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized weight and bias of create_linear_node_comparator."""
+    W = np.zeros((len(internal_nodes), tree.n_features_), dtype=np.float32)
+    W[np.arange(len(internal_nodes)), tree.tree_.feature[internal_nodes]] = 1
+    B = (-tree.tree_.threshold[internal_nodes]).astype(np.float32)
+    return W, B
+
+def _path_matrix(internal_nodes: np.ndarray, path_nodes: np.ndarray, path_values: np.ndarray, n_nodes: int) -> np.ndarray:
+    """Puts the value of each node of the path of each leaf in a (n_leaves, n_internal_nodes) matrix."""
+    nodes2idx = np.full(n_nodes, -1)
+    nodes2idx[internal_nodes] = np.arange(len(internal_nodes))
+
+    on_path = path_nodes >= 0
+    W = np.zeros((len(path_nodes), len(internal_nodes)))
+    W[np.nonzero(on_path)[0], nodes2idx[path_nodes[on_path]]] = path_values[on_path]
+    return W
+
+def sigmoid_tree_weights(tree: BaseDecisionTree, eps=0.5) -> Tuple[np.ndarray, ...]:
+    """Weights of the neural tree built by SigmoidTreeMaker, computed with arrays instead of one BitComparison per leaf.
+
+    The linear system of BitComparison has a closed form solution: the weight of each node of the path
+    is 2 * bit - 1 and the bias is 1 - eps minus the number of right turns. As sigmoid_linear_leaf_matcher,
+    eps is 0.5 by default. Returns w0, b0, w1, b1, w2, b2 like NeuralDecisionTree.return_weights."""
+    internal_nodes, leaves, path_nodes, path_bits = tree_paths(tree)
+    K = len(internal_nodes)
+
+    w0, b0 = linear_node_comparator_weights(tree, internal_nodes)
+
+    on_path = path_nodes >= 0
+    w1 = _path_matrix(internal_nodes, path_nodes, 2 * path_bits - 1, tree.tree_.node_count)
+    b1 = (1 - eps) - np.where(on_path, path_bits, 0).sum(axis=1)
+    w1 = w1.astype(np.float32) / np.float32(K)
+    b1 = b1.astype(np.float32) / np.float32(K)
+
+    w2, b2 = sigmoid_classification_head_weights(tree, leaves)
+    return w0, b0, w1, b1, w2.numpy(), b2.numpy()
+
+def tanh_tree_weights(tree: BaseDecisionTree, eps=0.5) -> Tuple[np.ndarray, ...]:
+    """Weights of the neural tree built by TanhTreeMaker, computed with arrays instead of one path per leaf.
+
+    Returns w0, b0, w1, b1, w2, b2 like NeuralDecisionTree.return_weights."""
+    internal_nodes, leaves, path_nodes, path_bits = tree_paths(tree)
+    K = len(internal_nodes)
+
+    w0, b0 = linear_node_comparator_weights(tree, internal_nodes)
+
+    depth = (path_nodes >= 0).sum(axis=1)
+    w1 = _path_matrix(internal_nodes, path_nodes, 2 * path_bits - 1, tree.tree_.node_count)
+    b1 = -depth + eps
+    w1 = w1.astype(np.float32) / np.float32(2 * K)
+    b1 = b1.astype(np.float32) / np.float32(2 * K)
+
+    w2, b2 = tanh_classification_head_weights(tree, leaves)
+    return w0, b0, w1, b1, w2.numpy(), b2.numpy()
\ No newline at end of file
@@ -0,0 +1,203 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/08_container.ipynb (unless otherwise specified).
+
+__all__ = ['CONTAINER_MAGIC', 'CONTAINER_VERSION', 'CiphertextWriter', 'CiphertextReader', 'test_container']
+
+# Cell
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Callable, Iterator, List, Tuple, Union
+
+import tenseal.sealapi as seal
+
+from .seal_helper import seal_to_bytes, seal_from_bytes
+
+# Cell
+CONTAINER_MAGIC = b"CTCT"
+CONTAINER_VERSION = 1
+
+# The file starts with a header (magic, version, reserved), followed by records made of a
+# record header (length of the request id, length of the payload), the request id and the payload
+_FILE_HEADER = struct.Struct("<4sHH")
+_RECORD_HEADER = struct.Struct("<HQ")
+
+# Cell
+class CiphertextWriter:
+    """Appends serialized ciphertexts, each with a request id, to a container file.
+
+    The file is created with its header if it does not exist, otherwise records are appended to it.
+    Each record is written in one go and flushed, so that a CiphertextReader following the file only
+    sees complete records.
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        is_new = not self.path.exists() or self.path.stat().st_size == 0
+        self.file = open(self.path, "ab")
+        if is_new:
+            self.file.write(_FILE_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, 0))
+            self.file.flush()
+
+    def append(self, request_id: str, ctx):
+        """Appends a ciphertext, or any SEAL object with a save method, or already serialized bytes."""
+        data = ctx if isinstance(ctx, (bytes, bytearray, memoryview)) else seal_to_bytes(ctx)
+        request_id = str(request_id).encode()
+
+        self.file.write(_RECORD_HEADER.pack(len(request_id), len(data)) + request_id + bytes(data))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Cell
+class CiphertextReader:
+    """Random access to the ciphertexts of a container file, through mmap.
+
+    The offsets of the records are indexed when the file is opened, and refresh indexes the
+    records appended since, so that a file can be consumed while it is being written.
+    If a request id appears several times, the last record is returned by its id.
+    """
+    def __init__(self, path: Union[str, Path], context: seal.SEALContext = None):
+        self.path = Path(path)
+        self.context = context
+        self.file = open(self.path, "rb")
+        self.mmap = None
+
+        # Offsets and lengths of the request ids and payloads of each record
+        self.records: List[Tuple[str, int, int]] = []
+        self.index = {}
+        self.end = _FILE_HEADER.size
+
+        self.refresh()
+
+    def _check_header(self):
+        magic, version, _ = _FILE_HEADER.unpack_from(self.mmap)
+        assert magic == CONTAINER_MAGIC, f"{self.path} is not a ciphertext container"
+        assert version == CONTAINER_VERSION, f"Unsupported container version {version}"
+
+    def refresh(self) -> int:
+        """Indexes the records appended since the last refresh, and returns how many were found.
+
+        A file without its full header yet, e.g. just created by a writer, has no records."""
+        size = os.fstat(self.file.fileno()).st_size
+        if size < _FILE_HEADER.size:
+            return 0
+        # The previous map is not closed, as records read from it may still be in use
+        if self.mmap is None or size > len(self.mmap):
+            is_first_map = self.mmap is None
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if is_first_map:
+                self._check_header()
+
+        n_records = len(self.records)
+        while self.end + _RECORD_HEADER.size <= len(self.mmap):
+            id_length, length = _RECORD_HEADER.unpack_from(self.mmap, self.end)
+            start = self.end + _RECORD_HEADER.size
+            # The last record may still be being written
+            if start + id_length + length > len(self.mmap):
+                break
+            request_id = bytes(self.mmap[start:start + id_length]).decode()
+            self.index[request_id] = len(self.records)
+            self.records.append((request_id, start + id_length, length))
+            self.end = start + id_length + length
+        return len(self.records) - n_records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, request_id: str):
+        return str(request_id) in self.index
+
+    def ids(self) -> List[str]:
+        return [request_id for request_id, _, _ in self.records]
+
+    def read(self, key: Union[str, int]) -> memoryview:
+        """Returns the serialized ciphertext of a request id, or of a position if key is an int,
+        without copying it."""
+        position = key if isinstance(key, int) else self.index[str(key)]
+        _, offset, length = self.records[position]
+        return memoryview(self.mmap)[offset:offset + length]
+
+    def load(self, key: Union[str, int]) -> seal.Ciphertext:
+        """Loads the ciphertext of a request id, or of a position if key is an int.
+
+        Unlike read, this copies the record, as SEAL loads objects from a path: the bytes are
+        written to the in-memory file of seal_from_bytes, then parsed into a new ciphertext."""
+        assert self.context is not None, "A SEAL context is needed to load ciphertexts"
+        return seal_from_bytes(seal.Ciphertext, self.context, bytes(self.read(key)))
+
+    def __getitem__(self, key: Union[str, int]) -> seal.Ciphertext:
+        return self.load(key)
+
+    def __iter__(self) -> Iterator[Tuple[str, memoryview]]:
+        """Iterates over the (request id, serialized ciphertext) pairs indexed so far."""
+        for position in range(len(self.records)):
+            yield self.records[position][0], self.read(position)
+
+    def follow(self, poll_interval: float = 0.1, stop: Callable[[], bool] = None) -> Iterator[Tuple[str, memoryview]]:
+        """Streams the records of the file, including the ones appended while iterating.
+
+        Waits for new records until stop returns True, by default until no record is appended
+        during a poll interval."""
+        position = 0
+        while True:
+            while position < len(self.records):
+                yield self.records[position][0], self.read(position)
+                position += 1
+
+            if self.refresh() > 0:
+                continue
+            if stop is None:
+                time.sleep(poll_interval)
+                if self.refresh() == 0:
+                    return
+            elif stop():
+                # Records may have been appended before the producer stopped
+                if self.refresh() == 0:
+                    return
+            else:
+                time.sleep(poll_interval)
+
+    def close(self):
+        self.mmap = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Cell
+def test_container(path: Union[str, Path], ctxs: List[seal.Ciphertext], context: seal.SEALContext):
+    """Tests if the ciphertexts appended to a new container are read back with the same bytes, by request id
+    or by position, including the ones appended after the reader was opened once it is refreshed"""
+    from fastcore.test import test_eq
+
+    datas = [seal_to_bytes(ctx) for ctx in ctxs]
+    half = len(ctxs) // 2
+
+    with CiphertextWriter(path) as writer:
+        for i, ctx in enumerate(ctxs[:half]):
+            writer.append(i, ctx)
+
+    with CiphertextReader(path, context) as reader:
+        test_eq(reader.ids(), [str(i) for i in range(half)])
+
+        with CiphertextWriter(path) as writer:
+            for i, data in enumerate(datas[half:], half):
+                writer.append(i, data)
+        test_eq(reader.refresh(), len(ctxs) - half)
+        test_eq(reader.ids(), [str(i) for i in range(len(ctxs))])
+
+        for i, data in enumerate(datas):
+            test_eq(bytes(reader.read(i)), data)
+            test_eq(bytes(reader.read(str(i))), data)
+            test_eq(seal_to_bytes(reader[str(i)]), data)
\ No newline at end of file
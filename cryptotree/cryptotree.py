@@ -1,19 +1,28 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/05_cryptotree.ipynb (unless otherwise specified).
 
-__all__ = ['to_list_and_duplicate', 'to_list_and_pad', 'HomomorphicModel', 'HomomorphicDecisionTree',
-           'HomomorphicNeuralRandomForest', 'HomomorphicTreeEvaluator', 'HomomorphicTreeFeaturizer']
+__all__ = ['to_list_and_duplicate', 'to_list_and_pad', 'batch_stride', 'tile_to_batch', 'HomomorphicModel',
+           'HomomorphicDecisionTree', 'HomomorphicNeuralRandomForest', 'ShardedHomomorphicNeuralRandomForest',
+           'use_bsgs_for', 'evaluator_rotation_steps', 'HomomorphicTreeEvaluator', 'COMPILED_EVALUATOR_VERSION',
+           'MATRIX_MULTIPLICATIONS', 'ShardedHomomorphicTreeEvaluator', 'HomomorphicTreeFeaturizer',
+           'ShardedHomomorphicTreeFeaturizer', 'model_output_bound', 'model_rotation_steps',
+           'plan_encryption_parameters', 'POLY_MODULUS_DEGREES', 'test_encrypt_batch', 'test_sharded',
+           'test_encryption_plan', 'test_evaluate_container', 'test_compiled_evaluator']
 
 # Cell
 from .seal_helper import *
+from .profiling import OperationProfile, CountingEvaluator, CountingEncoder
 from .polynomials import polyeval_tree
 from .linear import arrays_to_ptx, extract_diagonals, matrix_multiply_diagonals, pad_along_axis
+from .linear import (matrix_multiply_bsgs, prerotate_diagonals,
+                     bsgs_rotation_count, diagonal_rotation_count,
+                     bsgs_rotation_steps, diagonal_rotation_steps, sum_reduce_rotation_steps)
 
 import tenseal.sealapi as seal
 
 import numpy as np
-import torch
-from typing import List, Callable
+from typing import List, Callable, Tuple, TYPE_CHECKING
 
+import copy
 import pickle
 
 # Cell
@@ -38,7 +47,23 @@ def to_list_and_pad(array):
     return array
 
 # Cell
-from .tree import NeuralDecisionTree
+def batch_stride(n_slot: int) -> int:
+    """Number of slots used by each sample of a batch, which is the next power of two of n_slot.
+
+    sum_reduce sums the next power of two of n_slot slots, so samples must be that far apart
+    for their sums not to overlap.
+    """
+    return int(2**np.ceil(np.log2(n_slot)))
+
+def tile_to_batch(array, stride: int, batch_size: int) -> np.ndarray:
+    """Pads an array to the stride, and repeats it for each sample of the batch."""
+    array = pad_along_axis(np.array(array, dtype=np.float64), stride)
+    return np.tile(array, batch_size)
+
+# Cell
+# The neural models are only needed to build homomorphic models, and import torch and sklearn
+if TYPE_CHECKING:
+    from .tree import NeuralDecisionTree, NeuralRandomForest
 
 class HomomorphicModel:
     """Base class for Homormorphic Decision Trees and Random Forest.
@@ -90,18 +115,21 @@ class HomomorphicDecisionTree(HomomorphicModel):
         self.b2 = [to_list_and_pad(([b2[c] / self.n_leaves]) * self.n_leaves) for c in range(len(b2))]
 
     @classmethod
-    def from_neural_tree(cls, neural_tree: NeuralDecisionTree):
+    def from_neural_tree(cls, neural_tree: "NeuralDecisionTree"):
         return cls(neural_tree.return_weights())
 
 # Cell
-from .tree import NeuralRandomForest
-
 class HomomorphicNeuralRandomForest(HomomorphicModel):
-    """"""
-    def __init__(self, neural_rf: NeuralRandomForest):
+    """Homomorphic Random Forest, which concatenates the weights of its trees in a single ciphertext.
+
+    If trees is given, only the trees with these indices are used."""
+    def __init__(self, neural_rf: "NeuralRandomForest", trees: List[int] = None):
 
-        homomorphic_trees = [HomomorphicDecisionTree(w0, b0, w1, b1, w2, b2)
-                             for (w0, b0, w1, b1, w2, b2) in zip(*neural_rf.return_weights())]
+        if trees is None:
+            trees = list(range(neural_rf.n_trees))
+        tree_weights = list(zip(*neural_rf.return_weights()))
+
+        homomorphic_trees = [HomomorphicDecisionTree(*tree_weights[i]) for i in trees]
 
         B0, W1, B1, W2, B2 = [], [], [], [], []
         comparator = []
@@ -122,7 +150,7 @@ class HomomorphicNeuralRandomForest(HomomorphicModel):
         B2 = list(np.concatenate(B2, axis=-1))
 
         # We will multiply each class vector with the corresponding weight for each tree
-        weights = neural_rf.weights
+        weights = neural_rf.weights[trees]
         block_size = neural_rf.n_leaves_max * 2 - 1
         weights = [[weight.item()] * block_size for weight in weights]
         weights = np.concatenate(weights)
@@ -136,11 +164,81 @@ class HomomorphicNeuralRandomForest(HomomorphicModel):
         self.w2 = W2
         self.b2 = B2
 
+    def return_comparator(self) -> np.ndarray:
+        """Returns the comparator, which is already repeated for each tree."""
+        return np.array(self.comparator)
+
+# Cell
+class ShardedHomomorphicNeuralRandomForest:
+    """Homomorphic Random Forest whose trees are split across several ciphertexts.
+
+    Each shard is a HomomorphicNeuralRandomForest with as many trees as fit in slot_count slots,
+    so that forests bigger than a ciphertext can be used without increasing the ring size.
+    """
+    def __init__(self, neural_rf: "NeuralRandomForest", slot_count: int, n_trees_per_shard: int = None):
+        block_size = neural_rf.n_leaves_max * 2 - 1
+        if n_trees_per_shard is None:
+            n_trees_per_shard = slot_count // block_size
+        assert 0 < n_trees_per_shard * block_size <= slot_count, \
+            f"Shards of {n_trees_per_shard} trees of {block_size} slots do not fit in {slot_count} slots"
+
+        trees = list(range(neural_rf.n_trees))
+        self.shards = [HomomorphicNeuralRandomForest(neural_rf, trees[i:i + n_trees_per_shard])
+                       for i in range(0, len(trees), n_trees_per_shard)]
+
+        # Shards share the same stride so that their outputs can be added sample by sample
+        self.stride = max(batch_stride(len(shard.w2[0])) for shard in self.shards)
+
+    def return_weights(self):
+        return [shard.return_weights() for shard in self.shards]
+
+    def return_comparators(self) -> List[np.ndarray]:
+        return [shard.return_comparator() for shard in self.shards]
+
 # Cell
 from typing import List
 from functools import partial
-from .tree import NeuralDecisionTree
+from concurrent.futures import ThreadPoolExecutor
+import inspect
 from .linear import sum_reduce
+from .container import CiphertextReader, CiphertextWriter
+from pathlib import Path
+
+def use_bsgs_for(n_diagonals: int, matrix_multiplication: str = "auto") -> bool:
+    """Whether the match step of an evaluator uses the baby-step giant-step multiplication."""
+    if matrix_multiplication == "auto":
+        return bsgs_rotation_count(n_diagonals) < diagonal_rotation_count(n_diagonals)
+    else:
+        return matrix_multiplication == "bsgs"
+
+def evaluator_rotation_steps(n_diagonals: int, n_classes: int, stride: int,
+                             use_bsgs: bool, do_reduction=True) -> List[int]:
+    """Rotation steps done by an evaluator: the ones of the matrix multiplication and, if
+    do_reduction, the ones of sum_reduce and the ones putting class i in slot i."""
+    steps = bsgs_rotation_steps(n_diagonals) if use_bsgs else diagonal_rotation_steps(n_diagonals)
+    if do_reduction:
+        steps += sum_reduce_rotation_steps(stride)
+        steps += [-i for i in range(1, n_classes)]
+    return sorted(set(steps))
+
+import importlib
+
+def _function_spec(f: Callable) -> Tuple[str, str, dict]:
+    """Returns the module, the name and the keyword arguments of a function, possibly a partial."""
+    keywords = {}
+    if isinstance(f, partial):
+        f, keywords = f.func, dict(f.keywords)
+    return f.__module__, f.__qualname__, keywords
+
+def _load_function(spec: Tuple[str, str, dict]) -> Callable:
+    module, name, keywords = spec
+    f = getattr(importlib.import_module(module), name)
+    return partial(f, **keywords) if keywords else f
+
+# Version of the files written by HomomorphicTreeEvaluator.save
+COMPILED_EVALUATOR_VERSION = 1
+
+MATRIX_MULTIPLICATIONS = ["auto", "diagonal", "bsgs"]
 
 class HomomorphicTreeEvaluator:
     """Evaluator which will perform homomorphic computation"""
@@ -149,34 +247,127 @@ class HomomorphicTreeEvaluator:
                  activation_coeffs: List[float], polynomial_evaluator: Callable,
                  evaluator: seal.Evaluator, encoder: seal.CKKSEncoder,
                  relin_keys: seal.RelinKeys, galois_keys: seal.GaloisKeys, scale: float,
-                 do_reduction=True):
+                 do_reduction=True, matrix_multiplication: str = "auto", batch_size: int = None,
+                 stride: int = None, n_threads: int = 1):
         """Initializes with the weights used during computation.
 
         Args:
             b0: bias of the comparison step
-
+            matrix_multiplication: algorithm used by the match step, either "diagonal"
+                (one rotation per diagonal), "bsgs" (baby-step giant-step with pre-rotated
+                diagonals) or "auto" to pick the one which needs the fewest rotations.
+            batch_size: number of samples packed in a ciphertext by HomomorphicTreeFeaturizer.encrypt_batch.
+                By default, as many as fit in the slots. As plaintexts have the same size whatever
+                their content, this costs nothing when a single sample is encrypted.
+            stride: number of slots used by each sample, by default the next power of two of the model size.
+            n_threads: if bigger than 1, the independent operations of a request, i.e. the diagonals of the
+                match step and the classes of the decide and reduce steps, are run in a thread pool.
+                Each thread works on its own ciphertexts, and results are summed in a fixed order.
+
+        Plaintexts are not encoded here but in a PlaintextCache, at the exact level where they
+        are consumed, either during the first request or when calling compile.
         """
+        assert matrix_multiplication in MATRIX_MULTIPLICATIONS, \
+            f"Unknown matrix multiplication {matrix_multiplication}, must be one of {MATRIX_MULTIPLICATIONS}"
+
+        # The arguments are kept to save the evaluator
+        self.weights = (b0, w1, b1, w2, b2)
+        self.activation_coeffs = activation_coeffs
+        self.polynomial_evaluator = polynomial_evaluator
+        self.matrix_multiplication = matrix_multiplication
+
         self.slot_count = encoder.slot_count()
 
-        self.evaluator = evaluator
-        self.encoder = encoder
+        self.n_slot = len(w2[0])
+        self.stride = stride if stride else batch_stride(self.n_slot)
+        assert self.stride >= self.n_slot, f"Stride {self.stride} is smaller than the model size {self.n_slot}"
+        if batch_size is None:
+            batch_size = self.slot_count // self.stride
+        assert batch_size * self.stride <= self.slot_count, \
+            f"Batch of {batch_size} samples of {self.stride} slots does not fit in {self.slot_count} slots"
+        self.batch_size = batch_size
+
+        # Every weight is repeated for each sample of the batch
+        tile = partial(tile_to_batch, stride=self.stride, batch_size=batch_size)
+        b0, b1 = tile(b0), tile(b1)
+        w1 = [tile(w) for w in w1]
+        w2 = [tile(w) for w in w2]
+        b2 = [tile(b) for b in b2]
+
         self.relin_keys = relin_keys
         self.galois_keys = galois_keys
         self.scale = scale
 
-        self.activation = partial(polynomial_evaluator, coeffs=activation_coeffs,
-                                            evaluator=evaluator, encoder=encoder,
-                                            relin_keys=relin_keys, scale=scale)
+        self._set_backend(evaluator, encoder, PlaintextCache(encoder, evaluator, scale))
 
-        self.b0_ptx = self.to_ptx(b0)
-        self.w1_ptx = [self.to_ptx(w) for w in w1]
-        self.b1_ptx = self.to_ptx(b1)
-        self.w2_ptx = [self.to_ptx(w) for w in w2]
-        self.b2_ptx = [self.to_ptx(b) for b in b2]
+        self.n_diagonals = len(w1)
+        self.use_bsgs = use_bsgs_for(self.n_diagonals, matrix_multiplication)
+
+        self.b0 = np.array(b0, dtype=np.float64)
+        if self.use_bsgs:
+            self.w1 = prerotate_diagonals(w1, self.slot_count)
+        else:
+            self.w1 = [np.array(w, dtype=np.float64) for w in w1]
+        self.b1 = np.array(b1, dtype=np.float64)
+        self.w2 = [np.array(w, dtype=np.float64) for w in w2]
+        self.b2 = [np.array(b, dtype=np.float64) for b in b2]
+
+        # The mask keeps the first slot of each sample
+        self.mask = tile([1])
 
-        self.n_slot = len(w2[0])
         self.do_reduction = do_reduction
 
+        self.n_threads = n_threads
+        self.executor = ThreadPoolExecutor(n_threads) if n_threads > 1 else None
+
+    def _set_backend(self, evaluator: seal.Evaluator, encoder: seal.CKKSEncoder, plaintext_cache: PlaintextCache):
+        """Sets the SEAL evaluator and encoder used by every step, including the activation."""
+        self.evaluator = evaluator
+        self.encoder = encoder
+        self.plaintext_cache = plaintext_cache
+
+        # Polynomial evaluators which do not support the cache encode their coefficients at each call
+        activation_kwargs = {}
+        if "plaintext_cache" in inspect.signature(self.polynomial_evaluator).parameters:
+            activation_kwargs["plaintext_cache"] = plaintext_cache
+
+        self.activation = partial(self.polynomial_evaluator, coeffs=self.activation_coeffs,
+                                            evaluator=evaluator, encoder=encoder,
+                                            relin_keys=self.relin_keys, scale=self.scale, **activation_kwargs)
+
+    def instrumented(self, profile: OperationProfile) -> "HomomorphicTreeEvaluator":
+        """Returns a copy of the evaluator which records its operations in profile.
+
+        The copy shares the weights and the plaintext cache, but its SEAL evaluator and encoder are
+        wrapped, so that only the requests evaluated by the copy are instrumented."""
+        instrumented = copy.copy(self)
+        evaluator, encoder = CountingEvaluator(self.evaluator, profile), CountingEncoder(self.encoder, profile)
+        instrumented._set_backend(evaluator, encoder, self.plaintext_cache.view(encoder, evaluator))
+
+        for stage in ["compare", "match", "decide", "reduce"]:
+            setattr(instrumented, stage, profile.wrap_stage(stage, getattr(instrumented, stage)))
+        return instrumented
+
+    def profile(self, ctx: seal.Ciphertext) -> Tuple[seal.Ciphertext, OperationProfile]:
+        """Evaluates a ciphertext, and returns the output with the profile of its operations.
+
+        Other requests, including concurrent ones, are not instrumented and do not pay for it."""
+        profile = OperationProfile()
+        outputs = self.instrumented(profile)(ctx)
+        return outputs, profile
+
+    def map(self, f: Callable, iterable) -> List:
+        """Maps f on the thread pool if there is one, keeping the order of the inputs."""
+        if self.executor is None:
+            return list(map(f, iterable))
+        else:
+            return list(self.executor.map(f, iterable))
+
+    def rotation_steps(self) -> List[int]:
+        """Returns the rotation steps used by the evaluator, which are the only Galois keys it needs."""
+        return evaluator_rotation_steps(self.n_diagonals, len(self.w2), self.stride,
+                                        self.use_bsgs, self.do_reduction)
+
     def __call__(self, ctx: seal.Ciphertext):
 
         # First we add the first bias to do the comparisons
@@ -193,8 +384,10 @@ class HomomorphicTreeEvaluator:
 
         It first adds the thresholds, then compute the activation.
         """
+        b0_ptx = self.plaintext_cache.get("b0", ctx.parms_id(), self.b0)
+
         output = seal.Ciphertext()
-        self.evaluator.add_plain(ctx, self.b0_ptx, output)
+        self.evaluator.add_plain(ctx, b0_ptx, output)
         output = self.activation(output)
         return output
 
@@ -203,11 +396,19 @@ class HomomorphicTreeEvaluator:
 
         First it does the matrix multiplication with diagonals, then activate it.
         """
-        output = matrix_multiply_diagonals(self.w1_ptx, ctx, self.evaluator, self.galois_keys)
+        # Rotations do not change the level, so all the diagonals are consumed at the level of the input
+        parms_id = ctx.parms_id()
+        if self.use_bsgs:
+            w1_ptx = [[self.plaintext_cache.get(("w1", g, b), parms_id, w) for b, w in enumerate(group)]
+                      for g, group in enumerate(self.w1)]
+            output = matrix_multiply_bsgs(w1_ptx, ctx, self.evaluator, self.galois_keys, self.executor)
+        else:
+            w1_ptx = [self.plaintext_cache.get(("w1", i), parms_id, w) for i, w in enumerate(self.w1)]
+            output = matrix_multiply_diagonals(w1_ptx, ctx, self.evaluator, self.galois_keys, self.executor)
 
-        self.evaluator.mod_switch_to_inplace(self.b1_ptx, output.parms_id())
+        b1_ptx = self.plaintext_cache.get("b1", output.parms_id(), self.b1)
         output.scale = self.scale
-        self.evaluator.add_plain_inplace(output, self.b1_ptx)
+        self.evaluator.add_plain_inplace(output, b1_ptx)
 
         output = self.activation(output)
         return output
@@ -218,53 +419,137 @@ class HomomorphicTreeEvaluator:
         For each class, multiply the ciphertext with the corresponding weight of that class and
         add the bias afterwards.
         """
-        outputs = []
-        for w_ptx,b_ptx in zip(self.w2_ptx, self.b2_ptx):
+        def decide_class(c):
             output = seal.Ciphertext()
 
-            self.evaluator.mod_switch_to_inplace(w_ptx, ctx.parms_id())
+            w_ptx = self.plaintext_cache.get(("w2", c), ctx.parms_id(), self.w2[c])
 
             self.evaluator.multiply_plain(ctx, w_ptx, output)
             self.evaluator.rescale_to_next_inplace(output)
 
-            self.evaluator.mod_switch_to_inplace(b_ptx, output.parms_id())
+            b_ptx = self.plaintext_cache.get(("b2", c), output.parms_id(), self.b2[c])
             output.scale = self.scale
 
             self.evaluator.add_plain_inplace(output, b_ptx)
-            outputs.append(output)
+            return output
+
+        outputs = self.map(decide_class, range(len(self.w2)))
         return outputs
 
     def reduce(self, outputs: List[seal.Ciphertext]):
 
-        scores = seal.Ciphertext()
-        n = self.encoder.slot_count()
-
-        for i, output in enumerate(outputs):
+        def reduce_class(i):
             # We reduce each output
-            output = sum_reduce(output, self.evaluator, self.galois_keys, self.n_slot)
+            output = sum_reduce(outputs[i], self.evaluator, self.galois_keys, self.stride)
 
-            # We create the masks
-            mask = np.zeros(n)
-            mask[0] = 1
-            mask_ptx = seal.Plaintext()
+            # The mask only keeps the first slot, where the sum is
+            mask_ptx = self.plaintext_cache.get("mask", output.parms_id(), self.mask)
 
             temp = seal.Ciphertext()
+            self.evaluator.multiply_plain(output, mask_ptx, temp)
+            self.evaluator.rescale_to_next_inplace(temp)
+            temp.scale = self.scale
+
+            # The score of class i is put in the slot i
+            if i > 0:
+                self.evaluator.rotate_vector_inplace(temp, -i, self.galois_keys)
+            return temp
 
-            self.encoder.encode(mask, self.scale, mask_ptx)
-            self.evaluator.mod_switch_to_inplace(mask_ptx, output.parms_id())
+        scores = seal.Ciphertext()
 
+        for i, temp in enumerate(self.map(reduce_class, range(len(outputs)))):
             if i == 0:
-                self.evaluator.multiply_plain(output, mask_ptx, scores)
-                self.evaluator.rescale_to_next_inplace(scores)
-                scores.scale = self.scale
+                scores = temp
             else:
-                self.evaluator.multiply_plain(output, mask_ptx, temp)
-                self.evaluator.rescale_to_next_inplace(temp)
-                temp.scale = self.scale
-                self.evaluator.rotate_vector_inplace(temp, -i, self.galois_keys)
                 self.evaluator.add_inplace(scores, temp)
         return scores
 
+    def compile(self, ctx: seal.Ciphertext):
+        """Encodes every plaintext at the level where it is consumed, by evaluating a first ciphertext,
+        for instance an encryption of zeros, so that the next requests do no encoding."""
+        self(ctx)
+        return self
+
+    def save(self, path, context: seal.SEALContext):
+        """Saves the evaluator and its encoded plaintexts in a single versioned file.
+
+        The evaluator should be compiled first, so that load rebuilds it without encoding anything.
+        The file is a container whose first record holds the metadata, i.e. the weights, the
+        activation, the options and the rotation steps, and the next ones the plaintexts."""
+        items = self.plaintext_cache.items()
+        b0, w1, b1, w2, b2 = self.weights
+        as_array = partial(np.asarray, dtype=np.float64)
+        metadata = {
+            "version": COMPILED_EVALUATOR_VERSION,
+            "parms_id": tuple(context.first_parms_id()),
+            "scale": self.scale,
+            "weights": (as_array(b0), [as_array(w) for w in w1], as_array(b1),
+                        [as_array(w) for w in w2], [as_array(b) for b in b2]),
+            "activation_coeffs": list(self.activation_coeffs),
+            "polynomial_evaluator": _function_spec(self.polynomial_evaluator),
+            "matrix_multiplication": self.matrix_multiplication,
+            "do_reduction": self.do_reduction,
+            "batch_size": self.batch_size,
+            "stride": self.stride,
+            "rotation_steps": self.rotation_steps(),
+            "plaintexts": [key for key, _ in items],
+        }
+
+        path = Path(path)
+        if path.exists():
+            path.unlink()
+        with CiphertextWriter(path) as writer:
+            writer.append("metadata", pickle.dumps(metadata))
+            for i, (_, ptx) in enumerate(items):
+                writer.append(i, ptx)
+
+    @classmethod
+    def load(cls, path, context: seal.SEALContext, evaluator: seal.Evaluator, encoder: seal.CKKSEncoder,
+             relin_keys: seal.RelinKeys, galois_keys: seal.GaloisKeys, n_threads: int = 1):
+        """Loads an evaluator saved with save, with its plaintexts already encoded.
+
+        Neither the model nor the activation approximation are needed, and no plaintext is encoded."""
+        with CiphertextReader(path, context) as reader:
+            metadata = pickle.loads(reader.read("metadata"))
+            assert metadata["version"] == COMPILED_EVALUATOR_VERSION, \
+                f"Unsupported compiled evaluator version {metadata['version']}"
+            assert metadata["parms_id"] == tuple(context.first_parms_id()), \
+                "The evaluator was compiled for other encryption parameters"
+
+            tree_evaluator = cls(*metadata["weights"], metadata["activation_coeffs"],
+                                 _load_function(metadata["polynomial_evaluator"]),
+                                 evaluator, encoder, relin_keys, galois_keys, metadata["scale"],
+                                 do_reduction=metadata["do_reduction"],
+                                 matrix_multiplication=metadata["matrix_multiplication"],
+                                 batch_size=metadata["batch_size"], stride=metadata["stride"], n_threads=n_threads)
+
+            for i, (key, parms_id) in enumerate(metadata["plaintexts"]):
+                ptx = seal_from_bytes(seal.Plaintext, context, bytes(reader.read(str(i))))
+                tree_evaluator.plaintext_cache.add(key, parms_id, ptx)
+        return tree_evaluator
+
+    def evaluate_container(self, input_path, output_path, context: seal.SEALContext, follow=False) -> int:
+        """Evaluates the ciphertexts of a container file, and appends the outputs to another one
+        with the same request ids, mod switched to the last level.
+
+        Requests already in the output container are skipped, so that an interrupted run can be
+        resumed. If follow, records appended to the input while evaluating are processed too.
+        Returns the number of evaluated requests."""
+        done = set()
+        if Path(output_path).exists():
+            with CiphertextReader(output_path) as output_reader:
+                done = set(output_reader.ids())
+
+        n_evaluated = 0
+        with CiphertextReader(input_path, context) as reader, CiphertextWriter(output_path) as writer:
+            for request_id, data in (reader.follow() if follow else reader):
+                if request_id in done:
+                    continue
+                output = self(seal_from_bytes(seal.Ciphertext, context, bytes(data)))
+                writer.append(request_id, mod_switch_to_last_inplace(output, self.evaluator, context))
+                n_evaluated += 1
+        return n_evaluated
+
     def to_ptx(self, array):
         """Pads an array and convert it to a plaintext"""
         array = list(array)
@@ -277,33 +562,125 @@ class HomomorphicTreeEvaluator:
     def from_model(cls, model: HomomorphicModel,
                   activation_coeffs: List[float], polynomial_evaluator: Callable,
                   evaluator: seal.Evaluator, encoder: seal.CKKSEncoder,
-                  relin_keys: seal.RelinKeys, galois_keys: seal.GaloisKeys, scale: float):
+                  relin_keys: seal.RelinKeys, galois_keys: seal.GaloisKeys, scale: float,
+                  do_reduction=True, matrix_multiplication: str = "auto", batch_size: int = None,
+                  stride: int = None, n_threads: int = 1):
         """Creates an Homomorphic Tree Evaluator from a model, i.e a neural tree or
         a neural random forest. """
         b0, w1, b1, w2, b2 = model.return_weights()
 
         return cls(b0, w1, b1, w2, b2, activation_coeffs, polynomial_evaluator,
-                   evaluator, encoder, relin_keys, galois_keys, scale)
+                   evaluator, encoder, relin_keys, galois_keys, scale,
+                   do_reduction=do_reduction, matrix_multiplication=matrix_multiplication,
+                   batch_size=batch_size, stride=stride, n_threads=n_threads)
+
+# Cell
+class ShardedHomomorphicTreeEvaluator:
+    """Evaluator of a ShardedHomomorphicNeuralRandomForest, which takes one ciphertext per shard.
+
+    Shards are evaluated independently up to the decision step, then the class scores of all
+    shards are added homomorphically, so the reduction is only done once. If n_threads is
+    bigger than 1, shards are evaluated concurrently and added in the order of the shards.
+    """
+    def __init__(self, evaluators: List[HomomorphicTreeEvaluator], do_reduction=True, n_threads: int = 1):
+        assert len(set(e.stride for e in evaluators)) == 1, "All shards must have the same stride"
+        self.evaluators = evaluators
+        self.evaluator = evaluators[0].evaluator
+        self.do_reduction = do_reduction
+        self.executor = ThreadPoolExecutor(n_threads) if n_threads > 1 else None
+
+    def __call__(self, ctxs: List[seal.Ciphertext]):
+        assert len(ctxs) == len(self.evaluators), f"Expected {len(self.evaluators)} ciphertexts, got {len(ctxs)}"
+
+        def evaluate_shard(i):
+            evaluator, ctx = self.evaluators[i], ctxs[i]
+            ctx = evaluator.compare(ctx)
+            ctx = evaluator.match(ctx)
+            return evaluator.decide(ctx)
+
+        if self.executor is None:
+            shards_outputs = map(evaluate_shard, range(len(ctxs)))
+        else:
+            shards_outputs = self.executor.map(evaluate_shard, range(len(ctxs)))
+
+        outputs = None
+        for shard_outputs in shards_outputs:
+            if outputs is None:
+                outputs = shard_outputs
+            else:
+                for output, shard_output in zip(outputs, shard_outputs):
+                    self.evaluator.add_inplace(output, shard_output)
+
+        if self.do_reduction:
+            outputs = self.evaluators[0].reduce(outputs)
+        return outputs
+
+    def rotation_steps(self) -> List[int]:
+        """Returns the rotation steps used by all the shards, and by the reduction."""
+        steps = set()
+        for evaluator in self.evaluators:
+            steps.update(evaluator_rotation_steps(evaluator.n_diagonals, len(evaluator.w2), evaluator.stride,
+                                                  evaluator.use_bsgs, self.do_reduction))
+        return sorted(steps)
+
+    def compile(self, ctxs: List[seal.Ciphertext]):
+        """Encodes the plaintexts of every shard, see HomomorphicTreeEvaluator.compile."""
+        self(ctxs)
+        return self
+
+    @classmethod
+    def from_model(cls, model: ShardedHomomorphicNeuralRandomForest,
+                  activation_coeffs: List[float], polynomial_evaluator: Callable,
+                  evaluator: seal.Evaluator, encoder: seal.CKKSEncoder,
+                  relin_keys: seal.RelinKeys, galois_keys: seal.GaloisKeys, scale: float,
+                  do_reduction=True, matrix_multiplication: str = "auto", batch_size: int = None,
+                  n_threads: int = 1):
+        """Creates an evaluator for each shard of the model."""
+        evaluators = [HomomorphicTreeEvaluator.from_model(shard, activation_coeffs, polynomial_evaluator,
+                                                          evaluator, encoder, relin_keys, galois_keys, scale,
+                                                          matrix_multiplication=matrix_multiplication,
+                                                          batch_size=batch_size, stride=model.stride,
+                                                          n_threads=n_threads)
+                      for shard in model.shards]
+        return cls(evaluators, do_reduction, n_threads)
 
 # Cell
 class HomomorphicTreeFeaturizer:
     """Featurizer used by the client to encode and encrypt data."""
     def __init__(self, comparator: np.ndarray,
-                 encoder: seal.CKKSEncoder, encryptor: seal.Encryptor, scale: float, use_symmetric_key=False):
+                 encoder: seal.CKKSEncoder, encryptor: seal.Encryptor, scale: float, use_symmetric_key=False,
+                 stride: int = None):
         self.comparator = comparator
         self.encryptor = encryptor
         self.encoder = encoder
         self.scale = scale
         self.use_symmetric_key = use_symmetric_key
 
-    def encrypt(self, x: np.ndarray):
-        features = x[self.comparator]
-        features[self.comparator == -1] = 0
-        features = list(features)
+        self.stride = stride if stride else batch_stride(len(comparator))
+        self.batch_size = encoder.slot_count() // self.stride
+
+    def featurize(self, x: np.ndarray) -> np.ndarray:
+        """Permutes the features of a sample, or of each row of a 2-D array, into the slots expected by the evaluator."""
+        features = x[..., self.comparator]
+        features[..., self.comparator == -1] = 0
+        return features
 
+    def encrypt(self, x: np.ndarray, seeded=False):
+        features = list(self.featurize(x))
+        return self.encrypt_features(features, seeded)
+
+    def encrypt_features(self, features: List[float], seeded=False) -> seal.Ciphertext:
+        """Encodes and encrypts features.
+
+        If seeded and the key is symmetric, half of the ciphertext is replaced by the seed used to
+        generate it, which halves its size once saved. The returned Serializable can only be saved,
+        e.g. with its save method or seal_to_bytes, and is loaded as a regular ciphertext."""
         ptx = seal.Plaintext()
         self.encoder.encode(features, self.scale, ptx)
 
+        if seeded and self.use_symmetric_key:
+            return self.encryptor.encrypt_symmetric(ptx)
+
         ctx = seal.Ciphertext()
         if self.use_symmetric_key:
             self.encryptor.encrypt_symmetric(ptx, ctx)
@@ -311,6 +688,39 @@ class HomomorphicTreeFeaturizer:
             self.encryptor.encrypt(ptx, ctx)
         return ctx
 
+    def encrypt_batch(self, X: np.ndarray, seeded=False) -> List[seal.Ciphertext]:
+        """Encrypts the rows of X, packing batch_size rows in each ciphertext.
+
+        Each row uses stride slots, and the last ciphertext may contain fewer rows."""
+        ctxs = []
+        for start in range(0, len(X), self.batch_size):
+            rows = X[start:start + self.batch_size]
+            features = np.zeros(len(rows) * self.stride)
+            for i, x in enumerate(rows):
+                features[i * self.stride:i * self.stride + len(self.comparator)] = self.featurize(x)
+            ctxs.append(self.encrypt_features(list(features), seeded))
+        return ctxs
+
+    def encrypt_to_container(self, X: np.ndarray, path, request_ids: List[str] = None, seeded=False) -> List[str]:
+        """Encrypts the rows of X batch by batch, and appends each ciphertext to a container file.
+
+        request_ids gives the id of each batch, by default its index. Returns the ids."""
+        starts = range(0, len(X), self.batch_size)
+        request_ids = request_ids if request_ids is not None else [str(i) for i in range(len(starts))]
+        assert len(request_ids) == len(starts), f"Expected {len(starts)} request ids, got {len(request_ids)}"
+
+        with CiphertextWriter(path) as writer:
+            for request_id, start in zip(request_ids, starts):
+                ctx = self.encrypt_batch(X[start:start + self.batch_size], seeded)[0]
+                writer.append(request_id, ctx)
+        return request_ids
+
+    def decode_batch(self, values: List[float], n_classes: int, n_samples: int) -> np.ndarray:
+        """Splits the decrypted scores of a batched ciphertext into an array of shape (n_samples, n_classes)."""
+        values = np.array(values)
+        idx = np.arange(n_samples)[:, None] * self.stride + np.arange(n_classes)[None, :]
+        return values[idx]
+
     def save(self, path:str):
         pickle.dump(self.comparator, open(path, "wb"))
 
@@ -318,4 +728,225 @@ class HomomorphicTreeFeaturizer:
     def load(cls, path:str, encoder: seal.CKKSEncoder,
              encryptor: seal.Encryptor, scale: float, use_symmetric_key=False):
         comparator = pickle.load(open(path, "rb"))
-        return cls(comparator, encoder, encryptor, scale, use_symmetric_key)
\ No newline at end of file
+        return cls(comparator, encoder, encryptor, scale, use_symmetric_key)
+
+# Cell
+class ShardedHomomorphicTreeFeaturizer:
+    """Featurizer of a ShardedHomomorphicNeuralRandomForest, which encrypts one ciphertext per shard."""
+    def __init__(self, comparators: List[np.ndarray], stride: int,
+                 encoder: seal.CKKSEncoder, encryptor: seal.Encryptor, scale: float, use_symmetric_key=False):
+        self.comparators = comparators
+        self.stride = stride
+        self.featurizers = [HomomorphicTreeFeaturizer(comparator, encoder, encryptor, scale,
+                                                      use_symmetric_key, stride=stride)
+                            for comparator in comparators]
+        self.batch_size = self.featurizers[0].batch_size
+
+    def encrypt(self, x: np.ndarray, seeded=False) -> List[seal.Ciphertext]:
+        return [featurizer.encrypt(x, seeded) for featurizer in self.featurizers]
+
+    def encrypt_batch(self, X: np.ndarray, seeded=False) -> List[List[seal.Ciphertext]]:
+        """Encrypts the rows of X, and returns for each batch the list of ciphertexts of each shard."""
+        shards = [featurizer.encrypt_batch(X, seeded) for featurizer in self.featurizers]
+        return [list(ctxs) for ctxs in zip(*shards)]
+
+    def decode_batch(self, values: List[float], n_classes: int, n_samples: int) -> np.ndarray:
+        return self.featurizers[0].decode_batch(values, n_classes, n_samples)
+
+    def save(self, path:str):
+        pickle.dump((self.comparators, self.stride), open(path, "wb"))
+
+    @classmethod
+    def load(cls, path:str, encoder: seal.CKKSEncoder,
+             encryptor: seal.Encryptor, scale: float, use_symmetric_key=False):
+        comparators, stride = pickle.load(open(path, "rb"))
+        return cls(comparators, stride, encoder, encryptor, scale, use_symmetric_key)
+
+# Cell
+from .polynomials import polynomial_evaluator_depth
+
+# Ring sizes supported by SEAL for CKKS
+POLY_MODULUS_DEGREES = [1024, 2048, 4096, 8192, 16384, 32768]
+
+def model_output_bound(model) -> float:
+    """Bound on the absolute value of the class scores, assuming activations stay in [-1, 1]."""
+    if isinstance(model, ShardedHomomorphicNeuralRandomForest):
+        return sum(model_output_bound(shard) for shard in model.shards)
+
+    _, _, _, w2, b2 = model.return_weights()
+    return max(np.abs(w).sum() + np.abs(b).sum() for w, b in zip(w2, b2))
+
+def model_rotation_steps(model, matrix_multiplication: str = "auto", do_reduction=True) -> List[int]:
+    """Rotation steps of the HomomorphicTreeEvaluator of model, i.e. the Galois keys to generate."""
+    if isinstance(model, ShardedHomomorphicNeuralRandomForest):
+        steps = set()
+        for shard in model.shards:
+            _, w1, _, w2, _ = shard.return_weights()
+            steps.update(evaluator_rotation_steps(len(w1), len(w2), model.stride,
+                                                  use_bsgs_for(len(w1), matrix_multiplication), do_reduction))
+        return sorted(steps)
+
+    _, w1, _, w2, _ = model.return_weights()
+    return evaluator_rotation_steps(len(w1), len(w2), batch_stride(len(w2[0])),
+                                    use_bsgs_for(len(w1), matrix_multiplication), do_reduction)
+
+def plan_encryption_parameters(model, activation_coeffs: List[float], polynomial_evaluator: Callable = polyeval_tree,
+                               PRECISION_BITS: int = 28, UPPER_BITS: int = None,
+                               do_reduction=True, batch_size: int = 1,
+                               matrix_multiplication: str = "auto") -> EncryptionPlan:
+    """Returns the smallest CKKS parameters for which the HomomorphicTreeEvaluator of model is secure under TC128.
+
+    The depth is the one of each step: two activations, the matrix multiplication of the match
+    step, the multiplication of the decide step and, if do_reduction, the mask of the reduction.
+    The first prime holds UPPER_BITS bits for the integer part of the outputs, by default enough
+    for model_output_bound. The ring must also have slots for batch_size samples.
+    The plan also lists the rotation steps of the evaluator, so that only their Galois keys are generated.
+    """
+    activation_depth = polynomial_evaluator_depth(activation_coeffs, polynomial_evaluator)
+    depth = 2 * activation_depth + 2 + int(do_reduction)
+
+    if isinstance(model, ShardedHomomorphicNeuralRandomForest):
+        stride = model.stride
+    else:
+        stride = batch_stride(len(model.return_weights()[3][0]))
+    slots = stride * batch_size
+
+    if UPPER_BITS is None:
+        # One more bit for the sign
+        UPPER_BITS = int(np.ceil(np.log2(model_output_bound(model) + 1))) + 1
+    assert PRECISION_BITS + UPPER_BITS <= 60, f"SEAL primes are at most 60 bits, got {PRECISION_BITS + UPPER_BITS}"
+
+    moduli = [PRECISION_BITS + UPPER_BITS] + depth * [PRECISION_BITS] + [PRECISION_BITS + UPPER_BITS]
+
+    for poly_modulus_degree in POLY_MODULUS_DEGREES:
+        max_bits = seal.CoeffModulus.MaxBitCount(poly_modulus_degree, seal.SEC_LEVEL_TYPE.TC128)
+        if sum(moduli) <= max_bits and slots <= poly_modulus_degree // 2:
+            galois_steps = model_rotation_steps(model, matrix_multiplication, do_reduction)
+            return EncryptionPlan(poly_modulus_degree, moduli, PRECISION_BITS, depth, slots, galois_steps)
+
+    raise ValueError(f"No ring fits {slots} slots and a {sum(moduli)} bits modulus under TC128, "
+                     "consider a ShardedHomomorphicNeuralRandomForest or a lower degree activation")
+
+# Cell
+def _decode_scores(outputs: List, featurizer, decryptor: seal.Decryptor, encoder: seal.CKKSEncoder,
+                   n_classes: int, n_samples: int) -> np.ndarray:
+    """Decrypts the outputs of each batch, and stacks their scores in an array of shape (n_samples, n_classes)."""
+    scores = []
+    for i, output in enumerate(outputs):
+        ptx = seal.Plaintext()
+        decryptor.decrypt(output, ptx)
+        batch_size = min(featurizer.batch_size, n_samples - i * featurizer.batch_size)
+        scores.append(featurizer.decode_batch(encoder.decode_double(ptx), n_classes, batch_size))
+    return np.concatenate(scores)
+
+def test_encrypt_batch(X: np.ndarray, tree_evaluator, featurizer, decryptor: seal.Decryptor,
+                       encoder: seal.CKKSEncoder, n_classes: int, eps=1e-2) -> np.ndarray:
+    """Tests if encrypting X with encrypt_batch, evaluating and decoding the outputs with decode_batch gives
+    one row of scores per sample, the same as evaluating the first and last samples alone. Returns the scores."""
+    from fastcore.test import test_close, test_eq
+
+    outputs = [tree_evaluator(ctx) for ctx in featurizer.encrypt_batch(X)]
+    test_eq(len(outputs), int(np.ceil(len(X) / featurizer.batch_size)))
+
+    scores = _decode_scores(outputs, featurizer, decryptor, encoder, n_classes, len(X))
+    test_eq(scores.shape, (len(X), n_classes))
+
+    for i in [0, len(X) - 1]:
+        output = tree_evaluator(featurizer.encrypt(X[i]))
+        test_close(scores[i], _decode_scores([output], featurizer, decryptor, encoder, n_classes, 1)[0], eps)
+    return scores
+
+# Cell
+def test_sharded(X: np.ndarray, scores: np.ndarray, sharded_evaluator, sharded_featurizer,
+                 decryptor: seal.Decryptor, encoder: seal.CKKSEncoder, eps=1e-2):
+    """Tests if a sharded forest gives the same scores, computed by test_encrypt_batch, as the whole forest"""
+    from fastcore.test import test_close
+
+    sharded_scores = test_encrypt_batch(X, sharded_evaluator, sharded_featurizer, decryptor, encoder,
+                                        scores.shape[1], eps)
+    test_close(sharded_scores, scores, eps)
+
+# Cell
+def test_encryption_plan(model, activation_coeffs: List[float], polynomial_evaluator: Callable, X: np.ndarray,
+                         expected: np.ndarray, matrix_multiplication: str = "auto", PRECISION_BITS: int = 28,
+                         eps=1e-2):
+    """Tests if the rotation steps of plan_encryption_parameters are the ones of the evaluator, and if the
+    evaluator gives the expected scores of X with the keys of the plan, i.e. only the Galois keys of these steps"""
+    from fastcore.test import test_close, test_eq
+
+    plan = plan_encryption_parameters(model, activation_coeffs, polynomial_evaluator, PRECISION_BITS=PRECISION_BITS,
+                                      batch_size=len(X), matrix_multiplication=matrix_multiplication)
+    keys = {}
+    create_seal_globals(keys, plan)
+
+    tree_evaluator = HomomorphicTreeEvaluator.from_model(model, activation_coeffs, polynomial_evaluator,
+                                                         keys["evaluator"], keys["encoder"], keys["relin_keys"],
+                                                         keys["galois_keys"], keys["scale"],
+                                                         matrix_multiplication=matrix_multiplication)
+    test_eq(plan.galois_steps, tree_evaluator.rotation_steps())
+
+    featurizer = HomomorphicTreeFeaturizer(model.return_comparator(), keys["encoder"], keys["encryptor"],
+                                           keys["scale"])
+    ctx, = featurizer.encrypt_batch(X)
+    output = tree_evaluator(ctx)
+
+    ptx = seal.Plaintext()
+    keys["decryptor"].decrypt(output, ptx)
+    scores = featurizer.decode_batch(keys["encoder"].decode_double(ptx), expected.shape[1], len(X))
+    test_close(scores, expected, eps)
+
+# Cell
+import tempfile
+
+def test_evaluate_container(X: np.ndarray, scores: np.ndarray, tree_evaluator: HomomorphicTreeEvaluator,
+                            featurizer: HomomorphicTreeFeaturizer, context: seal.SEALContext,
+                            decryptor: seal.Decryptor, encoder: seal.CKKSEncoder, eps=1e-2):
+    """Tests if evaluate_container gives the scores of X, computed by test_encrypt_batch, and if evaluating
+    the container again after more requests were appended to it only evaluates the new ones"""
+    from fastcore.test import test_close, test_eq
+
+    n_batches = int(np.ceil(len(X) / featurizer.batch_size))
+    assert n_batches > 1, "X must hold more than one batch"
+    request_ids = [str(i) for i in range(n_batches)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_path, output_path = Path(directory) / "input.ctct", Path(directory) / "output.ctct"
+
+        featurizer.encrypt_to_container(X[:featurizer.batch_size], input_path, request_ids[:1])
+        test_eq(tree_evaluator.evaluate_container(input_path, output_path, context), 1)
+
+        featurizer.encrypt_to_container(X[featurizer.batch_size:], input_path, request_ids[1:])
+        test_eq(tree_evaluator.evaluate_container(input_path, output_path, context), n_batches - 1)
+        test_eq(tree_evaluator.evaluate_container(input_path, output_path, context), 0)
+
+        with CiphertextReader(output_path, context) as reader:
+            test_eq(reader.ids(), request_ids)
+            outputs = [reader[request_id] for request_id in request_ids]
+
+    container_scores = _decode_scores(outputs, featurizer, decryptor, encoder, scores.shape[1], len(X))
+    test_close(container_scores, scores, eps)
+
+# Cell
+def test_compiled_evaluator(tree_evaluator: HomomorphicTreeEvaluator, ctx: seal.Ciphertext, context: seal.SEALContext,
+                            evaluator: seal.Evaluator, encoder: seal.CKKSEncoder, relin_keys: seal.RelinKeys,
+                            galois_keys: seal.GaloisKeys, decryptor: seal.Decryptor, eps=1e-2):
+    """Tests if an evaluator compiled, saved and loaded back gives the same output as the original one on ctx,
+    without encoding any plaintext"""
+    from fastcore.test import test_close, test_eq
+
+    tree_evaluator.compile(ctx)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "evaluator.ctct"
+        tree_evaluator.save(path, context)
+        loaded_evaluator = HomomorphicTreeEvaluator.load(path, context, evaluator, encoder, relin_keys, galois_keys)
+    test_eq(loaded_evaluator.rotation_steps(), tree_evaluator.rotation_steps())
+
+    output, profile = loaded_evaluator.profile(ctx)
+    test_eq(profile.totals().get("encode", [0])[0], 0)
+
+    values = []
+    for ctx_output in [tree_evaluator(ctx), output]:
+        ptx = seal.Plaintext()
+        decryptor.decrypt(ctx_output, ptx)
+        values.append(encoder.decode_double(ptx))
+    test_close(values[1], values[0], eps)
\ No newline at end of file
@@ -0,0 +1,141 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/13_export.ipynb (unless otherwise specified).
+
+__all__ = ['forest_graph_weights', 'ForestGraph', 'export_torchscript', 'chebyshev_clenshaw', 'NumpyForest',
+           'export_numpy', 'test_export']
+
+# Cell
+from pathlib import Path
+from typing import Dict, List, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from .tree import NeuralRandomForest, PolynomialActivation
+
+# Cell
+def forest_graph_weights(neural_rf: NeuralRandomForest) -> Dict[str, np.ndarray]:
+    """Returns the weights of a forest laid out for batched matrix products over the trees.
+
+    The comparator is one (n_features, n_trees * n_nodes) matrix, the matcher and the head are stacks of
+    per tree matrices of shapes (n_trees, n_nodes, n_leaves) and (n_trees, n_leaves, n_classes). The
+    weights of the trees are folded in the head, and the bias of the forest in the head bias."""
+    W0, B0, W1, B1, W2, B2 = [np.stack(w) for w in neural_rf.return_weights()]
+    weights = neural_rf.weights.detach().numpy()
+    bias = neural_rf.bias.detach().numpy()
+
+    n_trees, n_nodes, n_features = W0.shape
+    return {
+        "comparator": W0.transpose(2, 0, 1).reshape(n_features, n_trees * n_nodes),
+        "comparator_bias": B0.reshape(n_trees * n_nodes),
+        "matcher": W1.transpose(0, 2, 1),
+        "matcher_bias": B1[:, np.newaxis, :],
+        "head": W2.transpose(0, 2, 1) * weights[:, np.newaxis, np.newaxis],
+        "head_bias": weights @ B2 + bias,
+    }
+
+# Cell
+class ForestGraph(nn.Module):
+    """Plaintext inference graph of a forest with a polynomial activation, which TorchScript can compile.
+
+    It computes the same outputs as the forest with three matrix products, without the padding logic
+    or the parameters needed for training."""
+    def __init__(self, neural_rf: NeuralRandomForest):
+        super(ForestGraph, self).__init__()
+        assert isinstance(neural_rf.activation, PolynomialActivation), \
+            "Only forests with a polynomial activation, i.e. use_polynomial=True, can be exported"
+        self.activation = neural_rf.activation
+
+        for name, weight in forest_graph_weights(neural_rf).items():
+            self.register_buffer(name, torch.from_numpy(np.ascontiguousarray(weight, dtype=np.float32)))
+
+    def forward(self, x):
+        n_trees, n_nodes, _ = self.matcher.shape
+        comparisons = self.activation(x @ self.comparator + self.comparator_bias)
+        comparisons = comparisons.view(-1, n_trees, n_nodes).transpose(0, 1)
+
+        matches = self.activation(torch.bmm(comparisons, self.matcher) + self.matcher_bias)
+        outputs = torch.bmm(matches, self.head).sum(dim=0) + self.head_bias
+        return outputs
+
+def export_torchscript(neural_rf: NeuralRandomForest, path: Union[str, Path] = None) -> torch.jit.ScriptModule:
+    """Compiles the ForestGraph of a forest with TorchScript, and saves it to path if given."""
+    graph = torch.jit.script(ForestGraph(neural_rf).eval())
+    if path is not None:
+        graph.save(str(path))
+    return graph
+
+# Cell
+def chebyshev_clenshaw(x: np.ndarray, coef: List[float], offset: float = 0., scale: float = 1.) -> np.ndarray:
+    """Evaluates a Chebyshev series on an array with the Clenshaw recurrence, as PolynomialActivation does."""
+    x = offset + scale * x
+    b1 = np.zeros_like(x)
+    b2 = np.zeros_like(x)
+    for c in coef[:0:-1]:
+        b1, b2 = 2 * x * b1 - b2 + c, b1
+    return x * b1 - b2 + coef[0]
+
+class NumpyForest:
+    """Pure numpy version of ForestGraph, with no dependency on torch at inference."""
+    def __init__(self, weights: Dict[str, np.ndarray], coef: List[float], offset: float, scale: float,
+                 dtype=np.float32):
+        for name, weight in weights.items():
+            setattr(self, name, np.ascontiguousarray(weight, dtype=dtype))
+        self.coef = list(coef)
+        self.offset = offset
+        self.scale = scale
+        self.dtype = dtype
+
+    def activation(self, x: np.ndarray) -> np.ndarray:
+        return chebyshev_clenshaw(x, self.coef, self.offset, self.scale)
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        n_trees, n_nodes, _ = self.matcher.shape
+        comparisons = self.activation(np.asarray(X, dtype=self.dtype) @ self.comparator + self.comparator_bias)
+        comparisons = comparisons.reshape(-1, n_trees, n_nodes).transpose(1, 0, 2)
+
+        matches = self.activation(comparisons @ self.matcher + self.matcher_bias)
+        outputs = (matches @ self.head).sum(axis=0) + self.head_bias
+        return outputs
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self(X).argmax(axis=1)
+
+    def save(self, path: Union[str, Path]):
+        np.savez(path, coef=self.coef, offset=self.offset, scale=self.scale,
+                 **{name: getattr(self, name) for name in ["comparator", "comparator_bias", "matcher",
+                                                           "matcher_bias", "head", "head_bias"]})
+
+    @classmethod
+    def load(cls, path: Union[str, Path], dtype=np.float32) -> "NumpyForest":
+        arrays = dict(np.load(path))
+        coef, offset, scale = arrays.pop("coef"), arrays.pop("offset"), arrays.pop("scale")
+        return cls(arrays, coef.tolist(), float(offset), float(scale), dtype)
+
+def export_numpy(neural_rf: NeuralRandomForest, dtype=np.float32) -> NumpyForest:
+    """Converts a forest with a polynomial activation to a NumpyForest."""
+    activation = neural_rf.activation
+    assert isinstance(activation, PolynomialActivation), \
+        "Only forests with a polynomial activation, i.e. use_polynomial=True, can be exported"
+    return NumpyForest(forest_graph_weights(neural_rf), activation.coef, activation.offset, activation.scale, dtype)
+
+# Cell
+def test_export(neural_rf: NeuralRandomForest, X: np.ndarray, path: Union[str, Path], eps=1e-4):
+    """Tests if the TorchScript graph and the NumpyForest of a forest, once saved in the directory path and
+    loaded back, give the outputs of the forest on X"""
+    from fastcore.test import test_close, test_eq
+
+    path = Path(path)
+    with torch.no_grad():
+        outputs = neural_rf(torch.tensor(X).float()).numpy()
+
+    export_torchscript(neural_rf, path / "forest.pt")
+    graph = torch.jit.load(str(path / "forest.pt"))
+    with torch.no_grad():
+        test_close(graph(torch.tensor(X).float()).numpy(), outputs, eps)
+
+    for dtype in [np.float32, np.float64]:
+        export_numpy(neural_rf, dtype).save(path / "forest.npz")
+        numpy_forest = NumpyForest.load(path / "forest.npz", dtype)
+        test_close(numpy_forest(X), outputs, eps)
+        test_eq(numpy_forest.predict(X), outputs.argmax(axis=1))
\ No newline at end of file
@@ -0,0 +1,25 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/09_inference.ipynb (unless otherwise specified).
+
+__all__ = ['HEAVY_MODULES', 'HomomorphicTreeEvaluator', 'ShardedHomomorphicTreeEvaluator', 'HomomorphicTreeFeaturizer',
+           'ShardedHomomorphicTreeFeaturizer', 'polyeval_tree', 'polyeval_paterson_stockmeyer', 'polyeval_odd_even',
+           'PowerLadder', 'matrix_multiply_diagonals', 'matrix_multiply_bsgs', 'sum_reduce', 'load_seal_globals',
+           'seal_to_bytes', 'seal_from_bytes', 'mod_switch_to_last_inplace', 'PlaintextCache', 'CiphertextReader',
+           'CiphertextWriter', 'EvaluationServer', 'AsyncEvaluationServer', 'EvaluationClient', 'OperationProfile']
+
+# Cell
+# Everything needed to encrypt, evaluate and serve, which only imports numpy and tenseal.
+# Building models from sklearn trees, training and plotting import torch, sklearn and matplotlib,
+# and live in tree, activations, preprocessing and in the helpers of polynomials.
+from .cryptotree import (HomomorphicTreeEvaluator, ShardedHomomorphicTreeEvaluator,
+                         HomomorphicTreeFeaturizer, ShardedHomomorphicTreeFeaturizer)
+from .polynomials import polyeval_tree, polyeval_paterson_stockmeyer, polyeval_odd_even, PowerLadder
+from .linear import matrix_multiply_diagonals, matrix_multiply_bsgs, sum_reduce
+from .seal_helper import (load_seal_globals, seal_to_bytes, seal_from_bytes, mod_switch_to_last_inplace,
+                          PlaintextCache)
+from .container import CiphertextReader, CiphertextWriter
+from .serving import EvaluationServer, AsyncEvaluationServer, EvaluationClient
+from .profiling import OperationProfile
+#nbdev_comment _all_ = ['HomomorphicTreeEvaluator', 'ShardedHomomorphicTreeEvaluator', 'HomomorphicTreeFeaturizer', 'ShardedHomomorphicTreeFeaturizer', 'polyeval_tree', 'polyeval_paterson_stockmeyer', 'polyeval_odd_even', 'PowerLadder', 'matrix_multiply_diagonals', 'matrix_multiply_bsgs', 'sum_reduce', 'load_seal_globals', 'seal_to_bytes', 'seal_from_bytes', 'mod_switch_to_last_inplace', 'PlaintextCache', 'CiphertextReader', 'CiphertextWriter', 'EvaluationServer', 'AsyncEvaluationServer', 'EvaluationClient', 'OperationProfile']
+
+# Modules which must not be imported by the inference path, see benchmarks/import_time.py
+HEAVY_MODULES = ["torch", "sklearn", "matplotlib", "fastcore", "pandas"]
\ No newline at end of file
@@ -1,12 +1,15 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/04_linear.ipynb (unless otherwise specified).
 
-__all__ = ['pad_along_axis', 'arrays_to_ptx', 'extract_diagonals', 'matrix_multiply_diagonals', 'sum_reduce',
-           'dot_product_plain', 'test_sum', 'test_dot_product_plain']
+__all__ = ['pad_along_axis', 'arrays_to_ptx', 'extract_diagonals', 'matrix_multiply_diagonals', 'bsgs_dimensions',
+           'bsgs_rotation_count', 'diagonal_rotation_count', 'bsgs_rotation_steps', 'diagonal_rotation_steps',
+           'prerotate_diagonals', 'matrix_multiply_bsgs', 'sum_reduce', 'sum_reduce_rotation_steps',
+           'dot_product_plain', 'test_sum', 'test_dot_product_plain', 'test_matrix_multiply_bsgs']
 
 # Cell
 import numpy as np
 import tenseal.sealapi as seal
-from typing import List
+from typing import List, Tuple
+from concurrent.futures import Executor
 
 # Cell
 def pad_along_axis(array: np.ndarray, target_length, axis=0):
@@ -52,20 +55,32 @@ def extract_diagonals(matrix: np.ndarray) -> List[np.ndarray]:
 
 # Cell
 def matrix_multiply_diagonals(diagonals: List[seal.Plaintext], ctx: seal.Ciphertext,
-                              evaluator: seal.Evaluator, galois_keys: seal.GaloisKeys):
-    output = seal.Ciphertext()
-
-    for i in range(len(diagonals)):
+                              evaluator: seal.Evaluator, galois_keys: seal.GaloisKeys,
+                              executor: Executor = None):
+    """Multiplies a ciphertext by a matrix given by its diagonals, with one rotation per diagonal.
 
+    If an executor is given, the products with each diagonal are computed concurrently, each
+    in its own ciphertext, and summed in the order of the diagonals."""
+    def multiply_diagonal(i):
         temp = seal.Ciphertext()
         diagonal = diagonals[i]
 
         evaluator.rotate_vector(ctx, i, galois_keys, temp)
 
-        evaluator.mod_switch_to_inplace(diagonal, temp.parms_id())
+        if diagonal.parms_id() != temp.parms_id():
+            evaluator.mod_switch_to_inplace(diagonal, temp.parms_id())
         evaluator.multiply_plain_inplace(temp, diagonal)
         evaluator.rescale_to_next_inplace(temp)
+        return temp
+
+    if executor is None:
+        terms = map(multiply_diagonal, range(len(diagonals)))
+    else:
+        terms = executor.map(multiply_diagonal, range(len(diagonals)))
+
+    output = seal.Ciphertext()
 
+    for i, temp in enumerate(terms):
         if i == 0:
             output = temp
         else:
@@ -73,6 +88,108 @@ def matrix_multiply_diagonals(diagonals: List[seal.Plaintext], ctx: seal.Ciphert
 
     return output
 
+# Cell
+def bsgs_dimensions(n_diagonals: int) -> Tuple[int, int]:
+    """Returns the number of baby steps and giant steps used to multiply by a matrix
+    with n_diagonals diagonals, such that n1 * n2 >= n_diagonals."""
+    n1 = int(np.ceil(np.sqrt(n_diagonals)))
+    n2 = int(np.ceil(n_diagonals / n1))
+    return n1, n2
+
+def bsgs_rotation_count(n_diagonals: int) -> int:
+    """Number of rotations needed by the baby-step giant-step matrix multiplication."""
+    n1, n2 = bsgs_dimensions(n_diagonals)
+    return (n1 - 1) + (n2 - 1)
+
+def diagonal_rotation_count(n_diagonals: int) -> int:
+    """Number of rotations needed by the regular diagonal matrix multiplication."""
+    return n_diagonals - 1
+
+def bsgs_rotation_steps(n_diagonals: int) -> List[int]:
+    """Rotation steps used by matrix_multiply_bsgs, i.e. the Galois keys it needs."""
+    n1, n2 = bsgs_dimensions(n_diagonals)
+    return list(range(1, n1)) + [g * n1 for g in range(1, n2)]
+
+def diagonal_rotation_steps(n_diagonals: int) -> List[int]:
+    """Rotation steps used by matrix_multiply_diagonals, i.e. the Galois keys it needs."""
+    return list(range(1, n_diagonals))
+
+def prerotate_diagonals(diagonals: List[np.ndarray], slot_count: int) -> List[List[np.ndarray]]:
+    """Prepares the diagonals for the baby-step giant-step multiplication.
+
+    The diagonals are grouped by giant step, and the diagonal i = g * n1 + b is rotated
+    to the right by g * n1, so that the giant step rotation can be done once on the sum
+    of the baby steps. The arrays are padded to slot_count because rotations are cyclic
+    over all the slots.
+    """
+    n1, n2 = bsgs_dimensions(len(diagonals))
+
+    groups = []
+    for g in range(n2):
+        group = []
+        for b in range(n1):
+            i = g * n1 + b
+            if i >= len(diagonals):
+                break
+            diagonal = pad_along_axis(np.array(diagonals[i], dtype=np.float64), slot_count)
+            group.append(np.roll(diagonal, g * n1))
+        groups.append(group)
+    return groups
+
+def matrix_multiply_bsgs(diagonals: List[List[seal.Plaintext]], ctx: seal.Ciphertext,
+                         evaluator: seal.Evaluator, galois_keys: seal.GaloisKeys,
+                         executor: Executor = None):
+    """Baby-step giant-step (Halevi-Shoup) version of matrix_multiply_diagonals.
+
+    The diagonals must have been prepared with prerotate_diagonals. Only n1 - 1 baby step
+    rotations of the input and n2 - 1 giant step rotations of the partial sums are done,
+    instead of one rotation per diagonal. If an executor is given, the baby steps and the
+    giant steps are computed concurrently, and summed in order.
+    """
+    n1 = len(diagonals[0])
+    _map = map if executor is None else executor.map
+
+    # Baby steps: rotations of the input, shared by all the giant steps
+    def rotate(b):
+        if b == 0:
+            return ctx
+        temp = seal.Ciphertext()
+        evaluator.rotate_vector(ctx, b, galois_keys, temp)
+        return temp
+
+    rotations = list(_map(rotate, range(n1)))
+
+    def giant_step(g):
+        group = diagonals[g]
+        inner = seal.Ciphertext()
+        temp = seal.Ciphertext()
+
+        for b, diagonal in enumerate(group):
+            if diagonal.parms_id() != ctx.parms_id():
+                evaluator.mod_switch_to_inplace(diagonal, ctx.parms_id())
+            if b == 0:
+                evaluator.multiply_plain(rotations[b], diagonal, inner)
+            else:
+                evaluator.multiply_plain(rotations[b], diagonal, temp)
+                evaluator.add_inplace(inner, temp)
+
+        evaluator.rescale_to_next_inplace(inner)
+
+        # Giant step: a single rotation of the sum of the baby steps
+        if g > 0:
+            evaluator.rotate_vector_inplace(inner, g * n1, galois_keys)
+        return inner
+
+    output = seal.Ciphertext()
+
+    for g, inner in enumerate(_map(giant_step, range(len(diagonals)))):
+        if g == 0:
+            output = inner
+        else:
+            evaluator.add_inplace(output, inner)
+
+    return output
+
 # Cell
 def sum_reduce(ctx: seal.Ciphertext, evaluator: seal.Evaluator,
                galois_keys: seal.GaloisKeys, n_slot: int):
@@ -92,6 +209,11 @@ def sum_reduce(ctx: seal.Ciphertext, evaluator: seal.Evaluator,
             evaluator.add_inplace(output, temp)
     return output
 
+def sum_reduce_rotation_steps(n_slot: int) -> List[int]:
+    """Rotation steps used by sum_reduce, i.e. the Galois keys it needs."""
+    n = int(np.ceil(np.log2(n_slot)))
+    return [2**i for i in range(n)]
+
 def dot_product_plain(ctx: seal.Ciphertext, ptx: seal.Plaintext,
                       evaluator: seal.Evaluator, galois_keys: seal.GaloisKeys, n_slot: int):
     """Computes the dot product between a ciphertext and a plaintext"""
@@ -103,11 +225,10 @@ def dot_product_plain(ctx: seal.Ciphertext, ptx: seal.Plaintext,
     return output
 
 # Cell
-from fastcore.test import test_close
-
 def test_sum(x: List[float], evaluator, encoder, encryptor, decryptor, scale, eps=1e-2):
     """Tests if the output of the polynomial, defined by the coeffs, is the same
     between the homomorphic evaluation and the regular one"""
+    from fastcore.test import test_close
     n_slot = len(x)
 
     ptx = seal.Plaintext()
@@ -132,6 +253,7 @@ def test_dot_product_plain(x: List[float], y: List[float],
                            scale, eps=1e-2):
     """Tests if the output of the polynomial, defined by the coeffs, is the same
     between the homomorphic evaluation and the regular one"""
+    from fastcore.test import test_close
     assert len(x) == len(y), f"x and y must have same length {len(x)} != {len(y)}"
     n_slot = len(x)
 
@@ -152,4 +274,43 @@ def test_dot_product_plain(x: List[float], y: List[float],
     homomorphic_output = values[0]
     expected_output = np.dot(x, y)
 
-    test_close(homomorphic_output, expected_output, eps)
\ No newline at end of file
+    test_close(homomorphic_output, expected_output, eps)
+
+# Cell
+def test_matrix_multiply_bsgs(matrix: np.ndarray, x: List[float], evaluator, encoder, encryptor, decryptor,
+                              galois_keys, scale, eps=1e-2):
+    """Tests if the baby-step giant-step multiplication, on diagonals prepared with prerotate_diagonals,
+    gives the same output as matrix_multiply_diagonals, and as the regular matrix product"""
+    from fastcore.test import test_close
+    matrix = np.array(matrix, dtype=np.float64)
+    n_slot = len(x)
+    slot_count = encoder.slot_count()
+    assert slot_count % n_slot == 0, f"The size of x must divide the number of slots {slot_count}"
+
+    # Rotations are cyclic over all the slots, so x is repeated in all of them
+    ptx = seal.Plaintext()
+    encoder.encode(list(np.tile(x, slot_count // n_slot)), scale, ptx)
+
+    ctx = seal.Ciphertext()
+    encryptor.encrypt(ptx, ctx)
+
+    def encode(array):
+        ptx = seal.Plaintext()
+        encoder.encode(list(array), scale, ptx)
+        return ptx
+
+    diagonals = extract_diagonals(matrix)
+    output = matrix_multiply_diagonals([encode(diagonal) for diagonal in diagonals], ctx, evaluator, galois_keys)
+
+    groups = prerotate_diagonals(diagonals, slot_count)
+    bsgs_output = matrix_multiply_bsgs([[encode(diagonal) for diagonal in group] for group in groups], ctx,
+                                       evaluator, galois_keys)
+
+    def decrypt(ctx):
+        ptx = seal.Plaintext()
+        decryptor.decrypt(ctx, ptx)
+        return np.array(encoder.decode_double(ptx)[:n_slot])
+
+    homomorphic_output = decrypt(bsgs_output)
+    test_close(homomorphic_output, decrypt(output), eps)
+    test_close(homomorphic_output, matrix @ np.array(x), eps)
\ No newline at end of file
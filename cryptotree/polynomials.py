@@ -1,8 +1,10 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/03_polynomials.ipynb (unless otherwise specified).
 
 __all__ = ['chebyshev_approximation', 'polynomial_approximation_coefficients', 'plot_graph_function_approximation',
-           'coeffs_to_plaintext', 'compute_all_powers', 'multiply_and_add_coeffs', 'polyeval_tree', 'eval_polynomial',
-           'test_polynomial']
+           'coeffs_to_plaintext', 'compute_all_powers', 'multiply_and_add_coeffs', 'polyeval_tree',
+           'polyeval_tree_depth', 'paterson_stockmeyer_cost', 'choose_baby_step', 'PowerLadder',
+           'polyeval_paterson_stockmeyer', 'polynomial_parity', 'polyeval_odd_even', 'polynomial_evaluator_depth',
+           'eval_polynomial', 'test_polynomial', 'test_polynomial_evaluators']
 
 # Cell
 import tenseal.sealapi as seal
@@ -10,15 +12,14 @@ import numpy as np
 from numpy.polynomial import Polynomial
 from numpy.polynomial.chebyshev import Chebyshev
 
-import matplotlib.pyplot as plt
-import torch
 
-from typing import List, Union
+from typing import List, Tuple, Union, Callable
 
 # Cell
 def chebyshev_approximation(f, dilatation_factor=50, polynomial_degree=25, bound=1, convertToTensor=True):
     """Polynomial approximation of f using Chebyshev approximation."""
     if convertToTensor:
+        import torch
         f_a = lambda x: f(torch.tensor(x*dilatation_factor))
     else:
         f_a = lambda x: f(x*dilatation_factor)
@@ -38,6 +39,7 @@ def polynomial_approximation_coefficients(f, dilatation_factor=50, polynomial_de
 
 def plot_graph_function_approximation(f, dilatation_factor=50, polynomial_degree=25, bound=1, convertToTensor=True):
     """Provides visualization of polynomial approximation."""
+    import matplotlib.pyplot as plt
 
     p, f_a = chebyshev_approximation(f, dilatation_factor, polynomial_degree, bound, convertToTensor)
 
@@ -120,36 +122,44 @@ def multiply_and_add_coeffs(powers: List[seal.Ciphertext], plain_coeffs: List[se
                             coeffs: List[float],
                             evaluator: seal.Evaluator,
                             scale: float,
-                            tol=1e-6) -> Union[seal.Ciphertext]:
-    assert len(powers) == len(plain_coeffs), f"Mismatch between length between powers {len(powers)} and coeffs {len(coeffs)}"
+                            tol=1e-6, plaintext_cache=None) -> Union[seal.Ciphertext]:
+    assert len(powers) == len(coeffs), f"Mismatch between length between powers {len(powers)} and coeffs {len(coeffs)}"
 
     """Multiplies the coefficients with the corresponding powers andd adds everything.
 
     If the polynomial is non-constant, returns the ciphertext of the polynomial evaluation.
     Else if the polynomials is constant, the plaintext of the constant term is returned.
+    If a plaintext cache is given, plain_coeffs is not used and the coefficients are taken
+    from the cache at the right level.
     """
     output = seal.Ciphertext()
-    a0 = plain_coeffs[0]
+    a0 = plain_coeffs[0] if plaintext_cache is None else None
     a0_added = False
 
     temp = seal.Ciphertext()
 
-    for i in range(1, len(plain_coeffs)):
+    for i in range(1, len(coeffs)):
         # We first check if the coefficient is not too small otherwise we skip it
         coef = coeffs[i]
         if np.abs(coef) < tol:
             continue
 
-        plain_coeff = plain_coeffs[i]
         power = powers[i]
 
-        evaluator.mod_switch_to_inplace(plain_coeff, power.parms_id())
+        if plaintext_cache is None:
+            plain_coeff = plain_coeffs[i]
+            evaluator.mod_switch_to_inplace(plain_coeff, power.parms_id())
+        else:
+            plain_coeff = plaintext_cache.get(coef, power.parms_id())
 
         evaluator.multiply_plain(power, plain_coeff, temp)
         evaluator.rescale_to_next_inplace(temp)
 
         if not a0_added:
-            evaluator.mod_switch_to_inplace(a0, temp.parms_id())
+            if plaintext_cache is None:
+                evaluator.mod_switch_to_inplace(a0, temp.parms_id())
+            else:
+                a0 = plaintext_cache.get(coeffs[0], temp.parms_id())
 
             temp.scale = scale
             evaluator.add_plain(temp, a0, output)
@@ -162,6 +172,8 @@ def multiply_and_add_coeffs(powers: List[seal.Ciphertext], plain_coeffs: List[se
             evaluator.add_inplace(output, temp)
     if a0_added:
         return output
+    elif a0 is None:
+        return coeffs_to_plaintext(coeffs[:1], plaintext_cache.encoder, scale)[0]
     else:
         return a0
 
@@ -169,18 +181,427 @@ def multiply_and_add_coeffs(powers: List[seal.Ciphertext], plain_coeffs: List[se
 def polyeval_tree(ctx : seal.Ciphertext, coeffs: List[float],
                   evaluator: seal.Evaluator, encoder : seal.Encryptor,
                   relin_keys: seal.RelinKeys,
-                  scale: float):
+                  scale: float, plaintext_cache=None):
+    """Evaluates a polynomial by multiplying each power with its coefficient, and adding everything.
+
+    Only the powers of non negligible coefficients are computed, lazily, by a PowerLadder."""
+    if plaintext_cache is None:
+        plain_coeffs = coeffs_to_plaintext(coeffs, encoder, scale)
+    else:
+        plain_coeffs = None
+    exponents = [i for i in range(1, len(coeffs)) if np.abs(coeffs[i]) >= 1e-6]
+    powers = PowerLadder(ctx, exponents, evaluator, relin_keys, scale, len(coeffs))
+    output = multiply_and_add_coeffs(powers, plain_coeffs, coeffs, evaluator, scale,
+                                     plaintext_cache=plaintext_cache)
+
+    return output
+
+def polyeval_tree_depth(degree: int) -> int:
+    """Multiplicative depth consumed by polyeval_tree for a polynomial of a given degree."""
+    if degree < 1:
+        return 0
+    return int(np.ceil(np.log2(degree))) + 1
+
+# Cell
+def _trim_coeffs(coeffs: List[float], tol: float) -> List[float]:
+    """Removes the trailing coefficients which are below the tolerance."""
+    coeffs = list(coeffs)
+    while len(coeffs) > 1 and np.abs(coeffs[-1]) < tol:
+        coeffs.pop()
+    return coeffs
+
+def _n_giant_steps(n_coeffs: int, k: int) -> int:
+    """Number of giant steps x^k, x^2k, x^4k, ... needed for n_coeffs coefficients."""
+    m = 0
+    while k * 2**m < n_coeffs:
+        m += 1
+    return m
+
+def _power_depth(i: int) -> int:
+    """Minimal depth of x^i, which is reached by compute_all_powers and _compute_powers."""
+    return int(np.ceil(np.log2(i))) if i > 1 else 0
+
+def _power_closure(exponents: List[int]) -> List[int]:
+    """Returns the exponents needed to compute the given powers with minimal depth.
+
+    Each x^i is computed as x^a * x^(i-a), where a is the biggest power of two below i."""
+    closure = set()
+    stack = [i for i in exponents if i >= 1]
+    while stack:
+        i = stack.pop()
+        if i in closure:
+            continue
+        closure.add(i)
+        if i > 1:
+            a = 2**(_power_depth(i) - 1)
+            stack += [a, i - a]
+    return sorted(closure)
+
+def _ps_exponents(n_coeffs: int, k: int, m: int, stride: int, shift: int) -> Tuple[List[int], List[int]]:
+    """Returns the exponents of the baby steps and of the giant steps."""
+    n_baby = k if m > 0 else n_coeffs
+    baby = [shift + stride * b for b in range(n_baby)]
+    giant = [stride * k * 2**j for j in range(m)]
+    return baby, giant
+
+def _ps_cost(coeffs: List[float], k: int, tol: float, stride: int, shift: int):
+    """Returns the number of combining multiplications and the depth of the recursion.
+
+    The depth is None when the polynomial is constant."""
+    coeffs = _trim_coeffs(coeffs, tol)
+    m = _n_giant_steps(len(coeffs), k)
+
+    if m == 0:
+        depths = [_power_depth(shift + stride * b) + 1 for b in range(len(coeffs))
+                  if np.abs(coeffs[b]) >= tol and shift + stride * b > 0]
+        return 0, (max(depths) if depths else None)
+
+    h = k * 2**(m-1)
+    n_r, d_r = _ps_cost(coeffs[:h], k, tol, stride, shift)
+    n_q, d_q = _ps_cost(coeffs[h:], k, tol, stride, shift)
+    d_g = _power_depth(stride * h)
+
+    if d_q is None:
+        n, depth = n_r + n_q, d_g + 1
+    else:
+        n, depth = n_r + n_q + 1, max(d_q, d_g) + 1
+
+    if d_r is not None:
+        depth = max(depth, d_r)
+    return n, depth
+
+def paterson_stockmeyer_cost(coeffs: List[float], k: int, tol=1e-6, stride: int = 1, shift: int = 0) -> Tuple[int, int]:
+    """Returns the number of non-scalar multiplications and the depth of the Paterson-Stockmeyer
+    evaluation of a polynomial with baby step k.
+
+    The coefficients are the ones of the basis x^(shift + stride * i), which is x^i by default."""
+    coeffs = _trim_coeffs(coeffs, tol)
+    m = _n_giant_steps(len(coeffs), k)
+
+    baby, giant = _ps_exponents(len(coeffs), k, m, stride, shift)
+    n_powers = len(_power_closure(baby + giant)) - 1
+
+    n_combine, depth = _ps_cost(coeffs, k, tol, stride, shift)
+    return n_powers + n_combine, (depth if depth is not None else 0)
+
+def choose_baby_step(coeffs: List[float], tol=1e-6, stride: int = 1, shift: int = 0) -> int:
+    """Chooses the baby step which minimizes the number of non-scalar multiplications,
+    without using more levels than polyeval_tree."""
+    degree = shift + stride * (len(_trim_coeffs(coeffs, tol)) - 1)
+    max_depth = polyeval_tree_depth(degree)
+
+    best_k, best_cost = 1, None
+    k = 1
+    while k <= len(coeffs):
+        n, depth = paterson_stockmeyer_cost(coeffs, k, tol, stride, shift)
+        if depth <= max_depth and (best_cost is None or (n, depth) < best_cost):
+            best_k, best_cost = k, (n, depth)
+        k *= 2
+    return best_k
 
-    degree = len(coeffs) - 1
-    plain_coeffs = coeffs_to_plaintext(coeffs, encoder, scale)
-    powers = compute_all_powers(ctx, degree, evaluator, relin_keys)
-    output = multiply_and_add_coeffs(powers, plain_coeffs, coeffs, evaluator, scale)
+# Cell
+from collections import Counter
+
+class PowerLadder:
+    """Powers of a ciphertext, computed on demand with minimal depth.
+
+    Only the requested exponents, and the ones needed to get them, are computed, each x^i being
+    x^a * x^(i-a) where a is the biggest power of two below i. Each requested power can be read
+    once, and every power is dropped as soon as its last consumer has read it, so that only the
+    powers still needed are kept alive.
+    """
+    def __init__(self, ctx: seal.Ciphertext, exponents: List[int], evaluator: seal.Evaluator,
+                 relin_keys: seal.RelinKeys, scale: float = None, length: int = None):
+        self.evaluator = evaluator
+        self.relin_keys = relin_keys
+        self.scale = scale
+        self.exponents = sorted(set(i for i in exponents if i >= 1))
+        self.length = length if length is not None else max(self.exponents, default=0) + 1
+
+        # Number of pending reads of each power, by the caller and by the powers computed from it
+        self.uses = Counter(self.exponents)
+        for i in _power_closure(self.exponents):
+            if i > 1:
+                a = 2**(_power_depth(i) - 1)
+                self.uses[a] += 1
+                if i - a != a:
+                    self.uses[i - a] += 1
+
+        self.powers = {1: (ctx, 0)}
+
+    def _read(self, i: int):
+        """Returns the (ciphertext, depth) pair of x^i and drops it after its last read."""
+        if i not in self.powers:
+            a = 2**(_power_depth(i) - 1)
+
+            output = seal.Ciphertext()
+            if a == i - a:
+                ctx_a, depth = self._read(a)
+                self.evaluator.square(ctx_a, output)
+            else:
+                (ctx_a, depth), (ctx_b, _) = _match_levels(self._read(a), self._read(i - a), self.evaluator)
+                self.evaluator.multiply(ctx_a, ctx_b, output)
+            self.evaluator.relinearize_inplace(output, self.relin_keys)
+            self.evaluator.rescale_to_next_inplace(output)
+            if self.scale is not None:
+                output.scale = self.scale
+            self.powers[i] = (output, depth + 1)
+
+        power = self.powers[i]
+        self.uses[i] -= 1
+        if self.uses[i] <= 0:
+            del self.powers[i]
+        return power
+
+    def __getitem__(self, i: int) -> seal.Ciphertext:
+        assert i in self.exponents, f"x^{i} was not requested"
+        return self._read(i)[0]
+
+    def __len__(self):
+        return self.length
+
+def _compute_powers(ctx: seal.Ciphertext, exponents: List[int], evaluator: seal.Evaluator,
+                    relin_keys: seal.RelinKeys, scale: float) -> dict:
+    """Computes only the given powers of a ciphertext, with minimal depth, and frees the
+    intermediate ones. Returns a dictionnary from exponents to (ciphertext, depth) pairs."""
+    ladder = PowerLadder(ctx, exponents, evaluator, relin_keys, scale)
+    return {i: (ladder[i], _power_depth(i)) for i in ladder.exponents}
+
+def _match_levels(x, y, evaluator: seal.Evaluator):
+    """Mod switches the shallowest of two (ciphertext, depth) pairs to the level of the other."""
+    (ctx_x, depth_x), (ctx_y, depth_y) = x, y
+
+    if depth_x < depth_y:
+        temp = seal.Ciphertext()
+        evaluator.mod_switch_to(ctx_x, ctx_y.parms_id(), temp)
+        ctx_x = temp
+    elif depth_y < depth_x:
+        temp = seal.Ciphertext()
+        evaluator.mod_switch_to(ctx_y, ctx_x.parms_id(), temp)
+        ctx_y = temp
+
+    depth = max(depth_x, depth_y)
+    return (ctx_x, depth), (ctx_y, depth)
+
+def _encode_at(coef: float, parms_id, evaluator: seal.Evaluator, encoder: seal.CKKSEncoder,
+               scale: float, plaintext_cache=None) -> seal.Plaintext:
+    """Returns the plaintext of a coefficient at a given level, from the cache if there is one."""
+    if plaintext_cache is not None:
+        return plaintext_cache.get(coef, parms_id)
+
+    plain_coeff = seal.Plaintext()
+    encoder.encode(coef, scale, plain_coeff)
+    evaluator.mod_switch_to_inplace(plain_coeff, parms_id)
+    return plain_coeff
 
+def _multiply_constant(x, coef: float, evaluator: seal.Evaluator, encoder: seal.CKKSEncoder, scale: float,
+                       plaintext_cache=None):
+    """Multiplies a (ciphertext, depth) pair by a scalar, which consumes one level."""
+    ctx, depth = x
+
+    plain_coeff = _encode_at(coef, ctx.parms_id(), evaluator, encoder, scale, plaintext_cache)
+
+    output = seal.Ciphertext()
+    evaluator.multiply_plain(ctx, plain_coeff, output)
+    evaluator.rescale_to_next_inplace(output)
+    output.scale = scale
+    return output, depth + 1
+
+def _add(x, y, evaluator: seal.Evaluator, encoder: seal.CKKSEncoder, scale: float, tol: float,
+         plaintext_cache=None):
+    """Adds two values, which are either (ciphertext, depth) pairs or constants."""
+    if not isinstance(x, tuple):
+        x, y = y, x
+    if not isinstance(x, tuple):
+        return x + y
+    if not isinstance(y, tuple):
+        if np.abs(y) < tol:
+            return x
+        ctx, depth = x
+
+        plain_coeff = _encode_at(y, ctx.parms_id(), evaluator, encoder, scale, plaintext_cache)
+
+        output = seal.Ciphertext()
+        ctx.scale = scale
+        evaluator.add_plain(ctx, plain_coeff, output)
+        return output, depth
+
+    (ctx_x, depth), (ctx_y, _) = _match_levels(x, y, evaluator)
+    ctx_x.scale = scale
+    ctx_y.scale = scale
+
+    output = seal.Ciphertext()
+    evaluator.add(ctx_x, ctx_y, output)
+    return output, depth
+
+def _ps_baby_step(coeffs: List[float], basis: List, evaluator: seal.Evaluator,
+                  encoder: seal.CKKSEncoder, scale: float, tol: float, plaintext_cache=None):
+    """Evaluates a polynomial of degree lower than the baby step with scalar multiplications only.
+
+    The basis element is None when it is the constant 1."""
+    output = 0.
+    for b in range(len(coeffs)):
+        if np.abs(coeffs[b]) < tol:
+            continue
+        if basis[b] is None:
+            term = coeffs[b]
+        else:
+            term = _multiply_constant(basis[b], coeffs[b], evaluator, encoder, scale, plaintext_cache)
+        output = _add(term, output, evaluator, encoder, scale, tol, plaintext_cache)
     return output
 
+def _ps_recurse(coeffs: List[float], k: int, basis: List, giants: List, evaluator: seal.Evaluator,
+                encoder: seal.CKKSEncoder, relin_keys: seal.RelinKeys, scale: float, tol: float,
+                plaintext_cache=None):
+    """Evaluates p = q * x^(k*2^(m-1)) + r, recursively on q and r."""
+    coeffs = _trim_coeffs(coeffs, tol)
+    m = _n_giant_steps(len(coeffs), k)
+
+    if m == 0:
+        return _ps_baby_step(coeffs, basis, evaluator, encoder, scale, tol, plaintext_cache)
+
+    h = k * 2**(m-1)
+    r = _ps_recurse(coeffs[:h], k, basis, giants, evaluator, encoder, relin_keys, scale, tol, plaintext_cache)
+    q = _ps_recurse(coeffs[h:], k, basis, giants, evaluator, encoder, relin_keys, scale, tol, plaintext_cache)
+    giant = giants[m-1]
+
+    if isinstance(q, tuple):
+        (ctx_q, depth), (ctx_g, _) = _match_levels(q, giant, evaluator)
+        ctx_q.scale = scale
+        ctx_g.scale = scale
+
+        output = seal.Ciphertext()
+        evaluator.multiply(ctx_q, ctx_g, output)
+        evaluator.relinearize_inplace(output, relin_keys)
+        evaluator.rescale_to_next_inplace(output)
+        output.scale = scale
+        qg = (output, depth + 1)
+    else:
+        qg = _multiply_constant(giant, q, evaluator, encoder, scale, plaintext_cache)
+
+    return _add(qg, r, evaluator, encoder, scale, tol, plaintext_cache)
+
+def _paterson_stockmeyer(ctx : seal.Ciphertext, coeffs: List[float],
+                         evaluator: seal.Evaluator, encoder : seal.CKKSEncoder,
+                         relin_keys: seal.RelinKeys, scale: float,
+                         baby_step: int, tol: float, stride: int, shift: int, plaintext_cache=None):
+    """Paterson-Stockmeyer evaluation in the basis x^(shift + stride * i).
+
+    Returns either a (ciphertext, depth) pair or a constant."""
+    coeffs = _trim_coeffs(coeffs, tol)
+    k = baby_step if baby_step else choose_baby_step(coeffs, tol, stride, shift)
+    m = _n_giant_steps(len(coeffs), k)
+
+    baby, giant = _ps_exponents(len(coeffs), k, m, stride, shift)
+    powers = _compute_powers(ctx, baby + giant, evaluator, relin_keys, scale)
+
+    basis = [powers[i] if i > 0 else None for i in baby]
+    giants = [powers[i] for i in giant]
+
+    return _ps_recurse(coeffs, k, basis, giants, evaluator, encoder, relin_keys, scale, tol, plaintext_cache)
+
+def _to_ciphertext_or_plaintext(output, encoder: seal.CKKSEncoder, scale: float):
+    """Returns the ciphertext of the evaluation, or the plaintext of the constant if the polynomial is constant."""
+    if isinstance(output, tuple):
+        return output[0]
+    else:
+        plain_coeff = seal.Plaintext()
+        encoder.encode(output, scale, plain_coeff)
+        return plain_coeff
+
+def polyeval_paterson_stockmeyer(ctx : seal.Ciphertext, coeffs: List[float],
+                                 evaluator: seal.Evaluator, encoder : seal.CKKSEncoder,
+                                 relin_keys: seal.RelinKeys,
+                                 scale: float, baby_step: int = None, tol=1e-6, plaintext_cache=None):
+    """Evaluates a polynomial with the Paterson-Stockmeyer algorithm.
+
+    The baby powers x^1..x^k and the giant powers x^k, x^2k, x^4k, ... are computed, then the
+    polynomial is split recursively on the giant powers, so that only polynomials of degree lower
+    than k are evaluated with scalar multiplications. It has the same signature as polyeval_tree,
+    and the baby step is chosen by default to use no more levels than polyeval_tree.
+    If a plaintext cache is given, the coefficients are encoded only once per level.
+    """
+    output = _paterson_stockmeyer(ctx, coeffs, evaluator, encoder, relin_keys, scale,
+                                  baby_step, tol, stride=1, shift=0, plaintext_cache=plaintext_cache)
+    return _to_ciphertext_or_plaintext(output, encoder, scale)
+
+# Cell
+def polynomial_parity(coeffs: List[float], tol=1e-6) -> Union[str, None]:
+    """Detects the symmetry of a polynomial.
+
+    Returns "even" if p(x) = q(x^2), "odd" if p(x) = c + x * q(x^2), i.e. the polynomial is odd
+    up to its constant term, like the sigmoid, and None otherwise."""
+    coeffs = np.abs(np.array(coeffs))
+
+    if np.all(coeffs[1::2] < tol):
+        return "even"
+    elif np.all(coeffs[2::2] < tol):
+        return "odd"
+    else:
+        return None
+
+def polyeval_odd_even(ctx : seal.Ciphertext, coeffs: List[float],
+                      evaluator: seal.Evaluator, encoder : seal.CKKSEncoder,
+                      relin_keys: seal.RelinKeys,
+                      scale: float, baby_step: int = None, tol=1e-6, plaintext_cache=None):
+    """Evaluates a polynomial using its symmetry.
+
+    Even polynomials are evaluated as q(x^2), and odd ones as c + x * q(x^2). The multiplication by x
+    is folded in the baby steps of the Paterson-Stockmeyer evaluation of q, so that only the odd
+    (resp. even) powers are computed, without using more levels than polyeval_tree.
+    Polynomials without symmetry are evaluated with polyeval_paterson_stockmeyer.
+    If a plaintext cache is given, the coefficients are encoded only once per level.
+    """
+    parity = polynomial_parity(coeffs, tol)
+
+    if parity == "even":
+        output = _paterson_stockmeyer(ctx, coeffs[0::2], evaluator, encoder, relin_keys, scale,
+                                      baby_step, tol, stride=2, shift=0, plaintext_cache=plaintext_cache)
+    elif parity == "odd":
+        output = _paterson_stockmeyer(ctx, coeffs[1::2], evaluator, encoder, relin_keys, scale,
+                                      baby_step, tol, stride=2, shift=1, plaintext_cache=plaintext_cache)
+        output = _add(output, coeffs[0], evaluator, encoder, scale, tol, plaintext_cache)
+    else:
+        output = _paterson_stockmeyer(ctx, coeffs, evaluator, encoder, relin_keys, scale,
+                                      baby_step, tol, stride=1, shift=0, plaintext_cache=plaintext_cache)
+
+    return _to_ciphertext_or_plaintext(output, encoder, scale)
+
 # Cell
-from fastcore.test import test_close
+from functools import partial
+
+def polynomial_evaluator_depth(coeffs: List[float], polynomial_evaluator: Callable, tol=1e-6) -> int:
+    """Multiplicative depth consumed by polynomial_evaluator on coeffs.
+
+    polynomial_evaluator is one of polyeval_tree, polyeval_paterson_stockmeyer or polyeval_odd_even,
+    possibly wrapped in a partial setting its baby_step or tol."""
+    baby_step = None
+    if isinstance(polynomial_evaluator, partial):
+        baby_step = polynomial_evaluator.keywords.get("baby_step")
+        tol = polynomial_evaluator.keywords.get("tol", tol)
+        polynomial_evaluator = polynomial_evaluator.func
+
+    def ps_depth(coeffs, stride, shift):
+        coeffs = _trim_coeffs(coeffs, tol)
+        k = baby_step if baby_step else choose_baby_step(coeffs, tol, stride, shift)
+        return paterson_stockmeyer_cost(coeffs, k, tol, stride, shift)[1]
+
+    if polynomial_evaluator is polyeval_tree:
+        return polyeval_tree_depth(len(coeffs) - 1)
+    elif polynomial_evaluator is polyeval_paterson_stockmeyer:
+        return ps_depth(coeffs, 1, 0)
+    elif polynomial_evaluator is polyeval_odd_even:
+        parity = polynomial_parity(coeffs, tol)
+        if parity == "even":
+            return ps_depth(coeffs[0::2], 2, 0)
+        elif parity == "odd":
+            return ps_depth(coeffs[1::2], 2, 1)
+        else:
+            return ps_depth(coeffs, 1, 0)
+    else:
+        raise ValueError(f"Unknown polynomial evaluator {polynomial_evaluator}")
 
+# Cell
 def eval_polynomial(x: float, coeffs):
     output = 0.
     for power,coeff in enumerate(coeffs):
@@ -190,6 +611,7 @@ def eval_polynomial(x: float, coeffs):
 def test_polynomial(x: float, coeffs, evaluator, encoder, encryptor, decryptor, relin_keys, scale, eps=1e-2):
     """Tests if the output of the polynomial, defined by the coeffs, is the same
     between the homomorphic evaluation and the regular one"""
+    from fastcore.test import test_close
 
     ptx = seal.Plaintext()
     encoder.encode(x, scale, ptx)
@@ -205,4 +627,34 @@ def test_polynomial(x: float, coeffs, evaluator, encoder, encryptor, decryptor,
     homomorphic_output = values[0]
     expected_output = eval_polynomial(x, coeffs)
 
-    test_close(homomorphic_output, expected_output, eps)
\ No newline at end of file
+    test_close(homomorphic_output, expected_output, eps)
+
+# Cell
+def test_polynomial_evaluators(x: float, coeffs, evaluator, encoder, encryptor, decryptor, relin_keys, scale,
+                               context: seal.SEALContext, eps=1e-2):
+    """Tests if polyeval_paterson_stockmeyer and polyeval_odd_even give the same output as polyeval_tree,
+    and consume the depth given by polynomial_evaluator_depth, which is at most the one of polyeval_tree"""
+    from fastcore.test import test_close, test_eq
+
+    ptx = seal.Plaintext()
+    encoder.encode(x, scale, ptx)
+
+    ctx = seal.Ciphertext()
+    encryptor.encrypt(ptx, ctx)
+
+    def level(ctx):
+        return context.get_context_data(ctx.parms_id()).chain_index()
+
+    outputs, depths = [], []
+    for polynomial_evaluator in [polyeval_tree, polyeval_paterson_stockmeyer, polyeval_odd_even]:
+        output = polynomial_evaluator(ctx, coeffs, evaluator, encoder, relin_keys, scale)
+        decryptor.decrypt(output, ptx)
+        outputs.append(encoder.decode_double(ptx)[0])
+
+        depths.append(level(ctx) - level(output))
+        test_eq(depths[-1], polynomial_evaluator_depth(coeffs, polynomial_evaluator))
+
+    test_close(outputs[0], eval_polynomial(x, coeffs), eps)
+    for output, depth in zip(outputs[1:], depths[1:]):
+        test_close(output, outputs[0], eps)
+        assert depth <= depths[0], f"Depth {depth} is bigger than the one of polyeval_tree {depths[0]}"
\ No newline at end of file
@@ -1,6 +1,7 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/06_preprocessing.ipynb (unless otherwise specified).
 
-__all__ = ['ColumnSelector', 'Reshaper', 'Featurizer']
+__all__ = ['ColumnSelector', 'Reshaper', 'Featurizer', 'read_chunks', 'ColumnarFeaturizer', 'FeatureLookup',
+           'compile_featurizer', 'test_columnar_featurizer', 'test_feature_lookup']
 
 # Cell
 from sklearn.base import BaseEstimator, TransformerMixin
@@ -64,4 +65,254 @@ class Featurizer(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, df):
-        return self.pipelines.transform(df)
\ No newline at end of file
+        return self.pipelines.transform(df)
+
+# Cell
+from pathlib import Path
+from typing import Iterable, Iterator, List, Union
+
+import numpy as np
+
+def read_chunks(path: Union[str, Path], chunk_size: int = 100000, columns: List[str] = None,
+                **read_kwargs) -> Iterator:
+    """Yields the DataFrame chunks of a CSV or Parquet file, so that only chunk_size rows are in memory.
+    Parquet files need pyarrow."""
+    import pandas as pd
+
+    path = Path(path)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=columns, **read_kwargs)
+
+def _min_max_parameters(data_min: np.ndarray, data_max: np.ndarray):
+    """Computes the scale and min of MinMaxScaler, in the precision of data_min, constant columns having a scale of 1."""
+    data_range = data_max - data_min
+    data_range[data_range < 10 * np.finfo(data_range.dtype).eps] = 1
+    scale = 1 / data_range
+    return scale, 0 - data_min * scale
+
+class ColumnarFeaturizer(BaseEstimator, TransformerMixin):
+    """Featurizer giving the same output as Featurizer, fitted incrementally and transforming whole blocks.
+
+    Instead of one pipeline per column, it keeps the sorted categories of each categorical column, as
+    LabelEncoder does, and the minimum and maximum of each column, as MinMaxScaler does. partial_fit can
+    thus be called on chunks of a dataset too big for memory, e.g. from read_chunks, and transform labels
+    all the columns of a block in a preallocated array, then scales it in one pass."""
+    def __init__(self, categorical_columns, dtype=np.float64):
+        self.categorical_columns = categorical_columns
+        self.dtype = dtype
+
+    def _reset(self):
+        for attribute in ["columns_", "classes_", "scale_dtypes_", "data_min_", "data_max_", "scale_", "min_"]:
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+
+    def fit(self, df):
+        self._reset()
+        return self.partial_fit(df)
+
+    def fit_chunks(self, chunks: Iterable):
+        """Fits the featurizer on an iterable of DataFrame chunks."""
+        self._reset()
+        for df in chunks:
+            self.partial_fit(df)
+        return self
+
+    def partial_fit(self, df):
+        import pandas as pd
+
+        if not hasattr(self, "columns_"):
+            self.columns_ = list(df.columns.values)
+            self.classes_ = {col: df[col].to_numpy()[:0] for col in self.columns_ if col in self.categorical_columns}
+            # MinMaxScaler is fitted on float32 and float16 columns in their own precision, on the others in float64
+            self.scale_dtypes_ = [self._scale_dtype(df, col) for col in self.columns_]
+            self.data_min_ = np.full(len(self.columns_), np.inf)
+            self.data_max_ = np.full(len(self.columns_), -np.inf)
+        assert list(df.columns.values) == self.columns_, "Chunks must have the columns of the first one"
+
+        for j, col in enumerate(self.columns_):
+            values = df[col].to_numpy()
+            if col in self.classes_:
+                self.classes_[col] = np.union1d(self.classes_[col], pd.unique(values))
+            elif len(values):
+                self.data_min_[j] = min(self.data_min_[j], np.nanmin(values))
+                self.data_max_[j] = max(self.data_max_[j], np.nanmax(values))
+
+        # The label codes of categorical columns range from 0 to the number of categories minus 1
+        for j, col in enumerate(self.columns_):
+            if col in self.classes_:
+                self.data_min_[j], self.data_max_[j] = 0, len(self.classes_[col]) - 1
+
+        # scale_ and min_ are stored in float64, but computed in the precision of each column
+        self.scale_, self.min_ = np.empty(len(self.columns_)), np.empty(len(self.columns_))
+        scale_dtypes = np.array([str(dtype) for dtype in self.scale_dtypes_])
+        for dtype in set(self.scale_dtypes_):
+            columns = scale_dtypes == str(dtype)
+            self.scale_[columns], self.min_[columns] = _min_max_parameters(self.data_min_[columns].astype(dtype),
+                                                                           self.data_max_[columns].astype(dtype))
+        return self
+
+    def _scale_dtype(self, df, col) -> np.dtype:
+        if col not in self.classes_ and df[col].dtype in (np.float32, np.float16):
+            return df[col].dtype
+        return np.dtype(np.float64)
+
+    def _label(self, df, out: np.ndarray = None) -> np.ndarray:
+        """Writes the columns of df in a (len(df), n_columns) float64 array, categories replaced by their codes."""
+        import pandas as pd
+
+        if out is None:
+            out = np.empty((len(df), len(self.columns_)), dtype=np.float64)
+        for j, col in enumerate(self.columns_):
+            values = df[col].to_numpy()
+            if col in self.classes_:
+                codes = pd.Index(self.classes_[col]).get_indexer(values)
+                if (codes < 0).any():
+                    raise ValueError(f"y contains previously unseen labels: {np.unique(values[codes < 0])}")
+                out[:, j] = codes
+            else:
+                out[:, j] = values
+        return out
+
+    def transform(self, df, out: np.ndarray = None) -> np.ndarray:
+        """Transforms df into out, a preallocated (len(df), n_columns) array, or a new array of type dtype.
+
+        The scaling is done in float64, except for float32 and float16 columns of df, as MinMaxScaler does,
+        so a float32 output is the float64 one rounded."""
+        if out is None:
+            out = np.empty((len(df), len(self.columns_)), dtype=self.dtype)
+        assert out.shape == (len(df), len(self.columns_)), "out must have one row per row of df and one column per column"
+
+        block = self._label(df, out if out.dtype == np.float64 else None)
+        block *= self.scale_
+        block += self.min_
+        for j, col in enumerate(self.columns_):
+            dtype = self._scale_dtype(df, col)
+            if dtype != np.float64:
+                values = df[col].to_numpy(dtype=dtype, copy=True)
+                values *= self.scale_[j:j + 1].astype(self.scale_dtypes_[j])
+                values += self.min_[j:j + 1].astype(self.scale_dtypes_[j])
+                block[:, j] = values
+        if block is not out:
+            out[...] = block
+        return out
+
+    def transform_chunks(self, chunks: Iterable, n_rows: int, out: np.ndarray = None) -> np.ndarray:
+        """Transforms an iterable of DataFrame chunks of n_rows rows in total into one array."""
+        if out is None:
+            out = np.empty((n_rows, len(self.columns_)), dtype=self.dtype)
+        start = 0
+        for df in chunks:
+            self.transform(df, out[start:start + len(df)])
+            start += len(df)
+        assert start == n_rows, f"The chunks have {start} rows instead of {n_rows}"
+        return out
+
+# Cell
+from typing import Dict, Tuple
+
+def _column_tables(featurizer) -> Iterator[Tuple]:
+    """Yields the name, the categories or None, the scale and min, and the dtype in which the scaling is done
+    of each column of a fitted featurizer."""
+    if isinstance(featurizer, ColumnarFeaturizer):
+        for j, col in enumerate(featurizer.columns_):
+            yield col, featurizer.classes_.get(col), featurizer.scale_[j], featurizer.min_[j], featurizer.scale_dtypes_[j]
+    else:
+        for col, pipeline in featurizer.pipelines.transformer_list:
+            steps = dict(pipeline.steps)
+            classes = steps["label_encoding"].classes_ if "label_encoding" in steps else None
+            min_max = steps["min_max"]
+            yield col, classes, min_max.scale_[0], min_max.min_[0], min_max.scale_.dtype
+
+class FeatureLookup:
+    """Featurizer compiled into plain lookup tables, to featurize one record without pandas nor sklearn.
+
+    Each slot holds its column, and either a dict from each category of the column to its scaled code, or
+    the scale and min of the column, with the numpy type of the column if it was fitted as float32 or float16,
+    None otherwise. Values of such columns are cast to that type before scaling, as MinMaxScaler does on data
+    of the fitted types, so that Python floats give the same features. Calling it on a dict record gives the
+    list of features, in the order of the slots, e.g. the slots expected by
+    HomomorphicTreeFeaturizer.encrypt_features."""
+    def __init__(self, slots: List[Tuple]):
+        self.slots = slots
+
+    def __call__(self, record: Dict) -> List[float]:
+        try:
+            return [0. if column is None else table[record[column]] if table is not None
+                    else record[column] * scale + min_ if dtype is None
+                    else float(dtype(record[column]) * scale + min_)
+                    for column, table, scale, min_, dtype in self.slots]
+        except KeyError:
+            self._check(record)
+            raise
+
+    def _check(self, record: Dict):
+        for column, table, _, _, _ in self.slots:
+            if column is None:
+                continue
+            if column not in record:
+                raise ValueError(f"Missing column {column}")
+            if table is not None and record[column] not in table:
+                raise ValueError(f"y contains previously unseen labels: {[record[column]]} in column {column}")
+
+    def transform(self, records: List[Dict]) -> np.ndarray:
+        return np.array([self(record) for record in records])
+
+def compile_featurizer(featurizer, comparator: np.ndarray = None) -> FeatureLookup:
+    """Compiles a fitted Featurizer or ColumnarFeaturizer into a FeatureLookup.
+
+    With comparator, the slots are the ones of HomomorphicTreeFeaturizer.featurize, i.e. the features
+    permuted by comparator, and 0 where comparator is -1. Otherwise they are the columns of the featurizer.
+    Features are the ones of transform on a one row DataFrame built from the record, with the columns in
+    the types the featurizer was fitted on."""
+    columns = []
+    for col, classes, scale, min_, dtype in _column_tables(featurizer):
+        table = None
+        if classes is not None:
+            # Same computation as MinMaxScaler on the codes of LabelEncoder
+            table = dict(zip(classes.tolist(), (np.arange(len(classes), dtype=np.float64) * scale + min_).tolist()))
+        if classes is None and np.dtype(dtype) in (np.float32, np.float16):
+            dtype = np.dtype(dtype).type
+            columns.append((col, None, dtype(scale), dtype(min_), dtype))
+        else:
+            columns.append((col, table, float(scale), float(min_), None))
+
+    if comparator is None:
+        return FeatureLookup(columns)
+    return FeatureLookup([columns[j] if j != -1 else (None, None, 0., 0., None) for j in comparator])
+
+# Cell
+def test_columnar_featurizer(df, categorical_columns: List[str], path: Union[str, Path], chunk_size: int = 100):
+    """Tests if a ColumnarFeaturizer fitted on df, or on the chunks of df saved as a CSV file at path, gives the
+    same features as a Featurizer fitted on the same data, bit for bit"""
+    import pandas as pd
+    from fastcore.test import test_eq
+
+    features = Featurizer(categorical_columns).fit(df).transform(df)
+    featurizer = ColumnarFeaturizer(categorical_columns).fit(df)
+    test_eq(featurizer.transform(df), features)
+    test_eq(ColumnarFeaturizer(categorical_columns, np.float32).fit(df).transform(df), features.astype(np.float32))
+
+    # Columns read from a CSV file may not have the types of df
+    df.to_csv(path, index=False)
+    csv_df = pd.read_csv(path)
+    csv_features = Featurizer(categorical_columns).fit(csv_df).transform(csv_df)
+
+    featurizer = ColumnarFeaturizer(categorical_columns).fit_chunks(read_chunks(path, chunk_size))
+    test_eq(featurizer.transform(csv_df), csv_features)
+    test_eq(featurizer.transform_chunks(read_chunks(path, chunk_size), len(csv_df)), csv_features)
+
+# Cell
+def test_feature_lookup(featurizer, df, comparator: np.ndarray = None):
+    """Tests if the FeatureLookup of a fitted featurizer gives, on the records of df, the features of transform,
+    permuted by comparator if given"""
+    from fastcore.test import test_eq
+
+    features = featurizer.transform(df)
+    if comparator is not None:
+        features = np.where(comparator == -1, 0., features[:, comparator])
+    test_eq(compile_featurizer(featurizer, comparator).transform(df.to_dict("records")), features)
\ No newline at end of file
@@ -0,0 +1,154 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/10_profiling.ipynb (unless otherwise specified).
+
+__all__ = ['OperationProfile', 'CountingEvaluator', 'CountingEncoder']
+
+# Cell
+import math
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import tenseal.sealapi as seal
+
+# Cell
+def _operation_name(name: str) -> str:
+    """Groups the variants of an operation, e.g. rotate_vector_inplace is counted as rotate_vector."""
+    return name[:-len("_inplace")] if name.endswith("_inplace") else name
+
+def _ciphertext_bytes(ctx: seal.Ciphertext) -> int:
+    """Size in memory of a ciphertext, i.e. its polynomials of 64 bits coefficients."""
+    return 8 * ctx.size() * ctx.poly_modulus_degree() * ctx.coeff_modulus_size()
+
+class OperationProfile:
+    """Record of the SEAL operations of an evaluation, filled by CountingEvaluator and CountingEncoder.
+
+    Operations are counted with their wall time for each step of the evaluation. At the end of each
+    step, the level, i.e. the number of rescales left, and the scale of its output are recorded.
+    The ciphertexts seen by the operations are tracked until they are garbage collected, to
+    know how many ciphertexts, and how many bytes, are alive during the evaluation.
+    """
+    def __init__(self):
+        self.operations: Dict[str, Dict[str, List]] = {}
+        self.stages: List[dict] = []
+        self.current_stage = None
+
+        self.live = {}
+        self.live_bytes = 0
+        self.peak_live_ciphertexts = 0
+        self.peak_live_bytes = 0
+
+        self.lock = threading.Lock()
+
+    def count(self, name: str, seconds: float):
+        with self.lock:
+            stage = self.operations.setdefault(self.current_stage, {})
+            count = stage.setdefault(_operation_name(name), [0, 0.])
+            count[0] += 1
+            count[1] += seconds
+
+    def track(self, ctx: seal.Ciphertext):
+        """Tracks a ciphertext until it is garbage collected, and updates the peak of live ciphertexts."""
+        with self.lock:
+            key = id(ctx)
+            if key not in self.live:
+                self.live[key] = weakref.ref(ctx, lambda _: self.live.pop(key, None))
+
+            # Ciphertexts change size when rescaled or relinearized, so the live bytes are computed again
+            self.live_bytes = sum(_ciphertext_bytes(ref()) for ref in list(self.live.values()) if ref() is not None)
+            self.peak_live_ciphertexts = max(self.peak_live_ciphertexts, len(self.live))
+            self.peak_live_bytes = max(self.peak_live_bytes, self.live_bytes)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Attributes the operations done inside the block to the step name."""
+        previous, self.current_stage = self.current_stage, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({"stage": name, "seconds": time.perf_counter() - start})
+            self.current_stage = previous
+
+    def wrap_stage(self, name: str, f: Callable) -> Callable:
+        """Wraps a step of an evaluator, to record its operations and the level and scale of its output."""
+        def wrapped(*args, **kwargs):
+            with self.stage(name):
+                output = f(*args, **kwargs)
+            ctx = output[0] if isinstance(output, list) else output
+            self.stages[-1].update(level=ctx.coeff_modulus_size() - 1, scale_bits=math.log2(ctx.scale),
+                                   live_ciphertexts=len(self.live), live_bytes=self.live_bytes)
+            return output
+        return wrapped
+
+    def totals(self) -> Dict[str, List]:
+        """Returns the count and wall time of each operation, summed over all steps."""
+        totals = {}
+        for operations in self.operations.values():
+            for name, (count, seconds) in operations.items():
+                total = totals.setdefault(name, [0, 0.])
+                total[0] += count
+                total[1] += seconds
+        return totals
+
+    def to_dict(self) -> dict:
+        return {"stages": self.stages,
+                "operations": {str(stage): {name: {"count": count, "seconds": seconds}
+                                            for name, (count, seconds) in operations.items()}
+                               for stage, operations in self.operations.items()},
+                "peak_live_ciphertexts": self.peak_live_ciphertexts,
+                "peak_live_bytes": self.peak_live_bytes}
+
+    def __str__(self):
+        lines = []
+        for stage in self.stages:
+            lines.append(f"{stage['stage']}: {stage['seconds'] * 1000:.1f} ms, level {stage.get('level')}, "
+                         f"scale 2^{stage.get('scale_bits', 0):.1f}, {stage.get('live_ciphertexts')} live ciphertexts")
+            for name, (count, seconds) in sorted(self.operations.get(stage["stage"], {}).items()):
+                lines.append(f"    {name}: {count} in {seconds * 1000:.1f} ms")
+        lines.append(f"Peak of {self.peak_live_ciphertexts} live ciphertexts, "
+                     f"{self.peak_live_bytes / 2**20:.1f} MB")
+        return "\n".join(lines)
+
+# Cell
+class CountingEvaluator:
+    """Wrapper of a seal.Evaluator which records each operation, and the ciphertexts it uses, in a profile."""
+    def __init__(self, evaluator: seal.Evaluator, profile: OperationProfile):
+        self.evaluator = evaluator
+        self.profile = profile
+
+    def __getattr__(self, name):
+        f = getattr(self.evaluator, name)
+        if not callable(f):
+            return f
+
+        def counted(*args):
+            start = time.perf_counter()
+            output = f(*args)
+            self.profile.count(name, time.perf_counter() - start)
+
+            for arg in args + (output,):
+                if isinstance(arg, seal.Ciphertext):
+                    self.profile.track(arg)
+            return output
+        return counted
+
+class CountingEncoder:
+    """Wrapper of a seal.CKKSEncoder which records each encoding in a profile."""
+    def __init__(self, encoder: seal.CKKSEncoder, profile: OperationProfile):
+        self.encoder = encoder
+        self.profile = profile
+
+    def slot_count(self) -> int:
+        return self.encoder.slot_count()
+
+    def __getattr__(self, name):
+        f = getattr(self.encoder, name)
+
+        def counted(*args):
+            start = time.perf_counter()
+            output = f(*args)
+            self.profile.count(name, time.perf_counter() - start)
+            return output
+        return counted
\ No newline at end of file
@@ -1,11 +1,15 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/02_seal_helper.ipynb (unless otherwise specified).
 
 __all__ = ['print_vector', 'print_ptx', 'print_ctx', 'print_range_ptx', 'print_range_ctx', 'float_to_ctx', 'vrep',
-           'create_seal_globals', 'append_globals_to_builtins', 'save_seal_globals', 'load_seal_globals']
+           'EncryptionPlan', 'galois_elements', 'create_seal_globals', 'append_globals_to_builtins',
+           'save_seal_globals', 'load_seal_globals', 'PlaintextCache', 'seal_to_bytes', 'seal_from_bytes',
+           'mod_switch_to_last_inplace', 'compression_mode', 'raw_size', 'serialization_report',
+           'print_serialization_report', 'COMPRESSION_MODES']
 
 # Cell
 import tenseal.sealapi as seal
-from typing import List
+import numpy as np
+from typing import List, Tuple
 
 # Cell
 def print_vector(vec, print_size=4, prec=3):
@@ -68,9 +72,53 @@ def vrep(x, n):
     return output
 
 # Cell
-def create_seal_globals(globals: dict, poly_modulus_degree: int, moduli: List[int], PRECISION_BITS: int,
-                       use_local=True, use_symmetric_key=False):
-    """Creates SEAL context variables and populates the globals with it."""
+class EncryptionPlan:
+    """CKKS parameters needed by a computation, as returned by plan_encryption_parameters.
+
+    moduli are the bit sizes of the coefficient modulus chain: a first prime holding the
+    integer part of the outputs, depth primes of PRECISION_BITS, and the special prime.
+    galois_steps are the rotation steps of the computation, None meaning all the power of two steps.
+    """
+    def __init__(self, poly_modulus_degree: int, moduli: List[int], PRECISION_BITS: int, depth: int, slots: int,
+                 galois_steps: List[int] = None):
+        self.poly_modulus_degree = poly_modulus_degree
+        self.moduli = moduli
+        self.PRECISION_BITS = PRECISION_BITS
+        self.depth = depth
+        self.slots = slots
+        self.galois_steps = galois_steps
+
+    def __repr__(self):
+        return (f"EncryptionPlan(poly_modulus_degree={self.poly_modulus_degree}, moduli={self.moduli}, "
+                f"PRECISION_BITS={self.PRECISION_BITS}, depth={self.depth}, slots={self.slots}, "
+                f"galois_steps={self.galois_steps})")
+
+def galois_elements(steps: List[int], poly_modulus_degree: int) -> List[int]:
+    """Returns the Galois elements of rotations by the given steps, as computed by SEAL for CKKS."""
+    m = 2 * poly_modulus_degree
+    half = poly_modulus_degree // 2
+
+    elements = []
+    for step in steps:
+        assert abs(step) < half, f"Rotation step {step} is out of range for {half} slots"
+        step = step if step >= 0 else half + step
+        elements.append(pow(3, step, m) if step else m - 1)
+    return elements
+
+def create_seal_globals(globals: dict, poly_modulus_degree: int, moduli: List[int] = None, PRECISION_BITS: int = None,
+                       use_local=True, use_symmetric_key=False, galois_steps: List[int] = None):
+    """Creates SEAL context variables and populates the globals with it.
+
+    poly_modulus_degree can also be an EncryptionPlan, which then gives moduli, PRECISION_BITS and
+    galois_steps. If galois_steps is given, e.g. from the rotation_steps of an evaluator, only the
+    Galois keys of these steps are generated, instead of the ones of every power of two step."""
+    if isinstance(poly_modulus_degree, EncryptionPlan):
+        plan = poly_modulus_degree
+        poly_modulus_degree, moduli, PRECISION_BITS = plan.poly_modulus_degree, plan.moduli, plan.PRECISION_BITS
+        if galois_steps is None:
+            galois_steps = plan.galois_steps
+    assert moduli is not None and PRECISION_BITS is not None, "moduli and PRECISION_BITS must be given without a plan"
+
     parms = seal.EncryptionParameters(seal.SCHEME_TYPE.CKKS)
     parms.set_poly_modulus_degree(poly_modulus_degree)
     parms.set_coeff_modulus(seal.CoeffModulus.Create(
@@ -87,12 +135,16 @@ def create_seal_globals(globals: dict, poly_modulus_degree: int, moduli: List[in
     globals["public_key"] = keygen.public_key()
     globals["secret_key"] = keygen.secret_key()
 
+    # Keys are generated from Galois elements, as a list of positive steps could be taken for elements
+    galois_args = () if galois_steps is None else (galois_elements(galois_steps, poly_modulus_degree),)
+    globals["galois_steps"] = galois_steps
+
     if use_local:
         globals["relin_keys"] = keygen.relin_keys_local()
-        globals["galois_keys"] = keygen.galois_keys_local()
+        globals["galois_keys"] = keygen.galois_keys_local(*galois_args)
     else:
         globals["relin_keys"] = keygen.relin_keys()
-        globals["galois_keys"] = keygen.galois_keys()
+        globals["galois_keys"] = keygen.galois_keys(*galois_args)
 
     if use_symmetric_key:
         globals["encryptor"] = seal.Encryptor(context, globals["secret_key"])
@@ -118,7 +170,11 @@ def append_globals_to_builtins(globals, builtins):
 # Cell
 from pathlib import Path
 
-def save_seal_globals(globals, path:Path = Path("seal"), save_pk = False, save_sk = False):
+def save_seal_globals(globals, path:Path = Path("seal"), save_pk = False, save_sk = False, verbose = False):
+    """Saves the SEAL globals needed by the server, and optionally the keys of the client.
+
+    Keys generated with use_local=False are seeded, which halves their size on disk.
+    If verbose, the size and the saving of each file are printed."""
     parms = globals["parms"]
 
     public_key = globals["public_key"]
@@ -134,13 +190,29 @@ def save_seal_globals(globals, path:Path = Path("seal"), save_pk = False, save_s
     relin_keys.save(str(path/"relin_keys"))
     galois_keys.save(str(path/"galois_keys"))
 
+    # The steps of the Galois keys are kept, so that the loader knows which rotations are available
+    galois_steps = globals.get("galois_steps")
+    if galois_steps is not None:
+        (path/"galois_steps").write_text(" ".join(str(step) for step in galois_steps))
+
     if save_pk:
         public_key.save(str(path/"public_key"))
     if save_sk:
         secret_key.save(str(path/"secret_key"))
 
-def load_seal_globals(globals, path:Path = Path("seal"), load_pk:bool = False, load_sk:bool = False):
-    """Loads and populates SEAL globals from saved files."""
+    if verbose:
+        objects = {"relin_keys": relin_keys, "galois_keys": galois_keys}
+        if save_pk:
+            objects["public_key"] = public_key
+        if save_sk:
+            objects["secret_key"] = secret_key
+        print_serialization_report(objects, {name: path/name for name in objects})
+
+def load_seal_globals(globals, path:Path = Path("seal"), load_pk:bool = False, load_sk:bool = False,
+                      load_galois_keys:bool = True):
+    """Loads and populates SEAL globals from saved files.
+
+    Clients, which only encrypt and decrypt, can skip the Galois keys with load_galois_keys=False."""
     if not path.exists():
         raise FileNotFoundError("Path not found")
 
@@ -165,11 +237,196 @@ def load_seal_globals(globals, path:Path = Path("seal"), load_pk:bool = False, l
     relin_keys = seal.RelinKeys()
     relin_keys.load(context, str(path/"relin_keys"))
 
-    galois_keys = seal.GaloisKeys()
-    galois_keys.load(context, str(path/"galois_keys"))
-
     globals["relin_keys"] = relin_keys
-    globals["galois_keys"] = galois_keys
+
+    if load_galois_keys:
+        galois_keys = seal.GaloisKeys()
+        galois_keys.load(context, str(path/"galois_keys"))
+        globals["galois_keys"] = galois_keys
+
+    if (path/"galois_steps").exists():
+        globals["galois_steps"] = [int(step) for step in (path/"galois_steps").read_text().split()]
+    else:
+        globals["galois_steps"] = None
 
     globals["evaluator"] = seal.Evaluator(context)
-    globals["encoder"] = seal.CKKSEncoder(context)
\ No newline at end of file
+    globals["encoder"] = seal.CKKSEncoder(context)
+
+# Cell
+import threading
+
+class PlaintextCache:
+    """Cache of plaintexts, encoded once at the exact level where they are consumed.
+
+    Plaintexts are keyed by a hashable key and by the parms_id of the ciphertext they are combined with.
+    Once every key has been used, no encoding nor modulus switching of plaintexts is done anymore.
+    As they are only kept at the level they are used, plaintexts also take less memory.
+    """
+    def __init__(self, encoder: seal.CKKSEncoder, evaluator: seal.Evaluator, scale: float):
+        self.encoder = encoder
+        self.evaluator = evaluator
+        self.scale = scale
+        self.plaintexts = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, parms_id, value=None) -> seal.Plaintext:
+        """Returns the plaintext of value at parms_id, encoding it if needed.
+
+        If value is None, the key is a scalar which is the value to encode."""
+        cache_key = (key, tuple(parms_id))
+        ptx = self.plaintexts.get(cache_key)
+
+        if ptx is None:
+            with self.lock:
+                ptx = self.plaintexts.get(cache_key)
+                if ptx is None:
+                    value = key if value is None else value
+                    if not np.isscalar(value):
+                        value = list(value)
+
+                    ptx = seal.Plaintext()
+                    self.encoder.encode(value, self.scale, ptx)
+                    self.evaluator.mod_switch_to_inplace(ptx, parms_id)
+                    self.plaintexts[cache_key] = ptx
+        return ptx
+
+    def items(self) -> List[Tuple[Tuple, seal.Plaintext]]:
+        """Returns the ((key, parms_id), plaintext) pairs of the cache."""
+        return list(self.plaintexts.items())
+
+    def add(self, key, parms_id, ptx: seal.Plaintext):
+        """Adds a plaintext encoded elsewhere, e.g. loaded from a file."""
+        self.plaintexts[(key, tuple(parms_id))] = ptx
+
+    def view(self, encoder: seal.CKKSEncoder, evaluator: seal.Evaluator) -> "PlaintextCache":
+        """Returns a cache sharing the plaintexts of this one, but encoding with another encoder and evaluator,
+        e.g. the ones of an instrumented evaluation."""
+        cache = PlaintextCache(encoder, evaluator, self.scale)
+        cache.plaintexts = self.plaintexts
+        cache.lock = self.lock
+        return cache
+
+    def __len__(self):
+        return len(self.plaintexts)
+
+    def clear(self):
+        self.plaintexts = {}
+
+# Cell
+import os
+import tempfile
+import threading
+
+class _ScratchFile:
+    """File kept in memory when possible, through which SEAL objects are saved and loaded.
+
+    It is a memfd on Linux, opened by its /proc/self/fd path, otherwise a file in /dev/shm or
+    in the temporary directory. It is removed when its owner thread ends."""
+    def __init__(self):
+        self.pid = os.getpid()
+        if hasattr(os, "memfd_create"):
+            self.fd = os.memfd_create("cryptotree")
+            self.path, self.is_memfd = f"/proc/self/fd/{self.fd}", True
+        else:
+            self.fd, self.path = tempfile.mkstemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+            self.is_memfd = False
+
+    def __del__(self):
+        # A forked child must not close or remove the file of its parent
+        if self.pid != os.getpid():
+            return
+        os.close(self.fd)
+        if not self.is_memfd:
+            os.remove(self.path)
+
+# Each thread of each process has its own file, so that concurrent requests do not overwrite each other
+_scratch = threading.local()
+
+def _scratch_path() -> str:
+    scratch = getattr(_scratch, "file", None)
+    if scratch is None or scratch.pid != os.getpid():
+        scratch = _scratch.file = _ScratchFile()
+    return scratch.path
+
+def seal_to_bytes(obj) -> bytes:
+    """Serializes a SEAL object, e.g. a ciphertext, to bytes.
+
+    The SEAL bindings can only save objects to a path, not to a buffer, so the object goes through
+    a file of the calling thread, reused from one call to the next. It is kept in memory on Linux
+    with memfd_create, or in /dev/shm, and only elsewhere is it written to disk."""
+    path = _scratch_path()
+    obj.save(path)
+    with open(path, "rb") as f:
+        return f.read()
+
+def seal_from_bytes(cls, context: seal.SEALContext, data: bytes):
+    """Deserializes a SEAL object of a given class, e.g. seal.Ciphertext, from bytes.
+
+    As for seal_to_bytes, the bytes go through the in-memory file of the calling thread."""
+    path = _scratch_path()
+    with open(path, "wb") as f:
+        f.write(data)
+    obj = cls()
+    obj.load(context, path)
+    return obj
+
+# Cell
+import struct
+
+def mod_switch_to_last_inplace(ctx: seal.Ciphertext, evaluator: seal.Evaluator, context: seal.SEALContext):
+    """Mod switches a ciphertext to the last level, where it is the smallest, before sending it.
+
+    Decryption only needs the first prime, so results lose nothing by dropping the other ones."""
+    if ctx.parms_id() != context.last_parms_id():
+        evaluator.mod_switch_to_inplace(ctx, context.last_parms_id())
+    return ctx
+
+# Header written by SEAL in front of every serialized object
+_SEAL_HEADER = struct.Struct("<HBBBBHQ")
+COMPRESSION_MODES = {0: "none", 1: "zlib", 2: "zstd"}
+
+def compression_mode(data: bytes) -> str:
+    """Returns the compression mode of a serialized SEAL object, read from its header."""
+    magic, header_size, major, minor, compr_mode, reserved, size = _SEAL_HEADER.unpack_from(data)
+    return COMPRESSION_MODES.get(compr_mode, "unknown")
+
+def raw_size(obj) -> int:
+    """Size in bytes of the coefficients of a SEAL object, i.e. without compression nor seed.
+
+    Returns None for objects whose coefficients are not accessible, such as seeded Serializable objects."""
+    if isinstance(obj, seal.Ciphertext):
+        return obj.size() * obj.coeff_modulus_size() * obj.poly_modulus_degree() * 8
+    elif isinstance(obj, seal.PublicKey):
+        return raw_size(obj.data())
+    elif isinstance(obj, (seal.RelinKeys, seal.GaloisKeys)):
+        return sum(raw_size(key) for keys in obj.data() for key in keys)
+    else:
+        return None
+
+def _size_row(n_bytes: int, header: bytes, obj) -> dict:
+    raw = raw_size(obj)
+    return {"bytes": n_bytes, "compression": compression_mode(header), "raw_bytes": raw,
+            "saving": None if raw is None else 1 - n_bytes / raw}
+
+def serialization_report(objects: dict, paths: dict = None) -> dict:
+    """Returns, for each named SEAL object, its serialized size, its compression mode, its raw size
+    and the saving compared to the raw size.
+
+    If the objects are already saved, paths gives their files, which avoids serializing them again."""
+    report = {}
+    for name, obj in objects.items():
+        if paths is not None and name in paths:
+            with open(paths[name], "rb") as f:
+                header = f.read(_SEAL_HEADER.size)
+            report[name] = _size_row(os.path.getsize(paths[name]), header, obj)
+        else:
+            data = seal_to_bytes(obj)
+            report[name] = _size_row(len(data), data, obj)
+    return report
+
+def print_serialization_report(objects: dict, paths: dict = None):
+    for name, row in serialization_report(objects, paths).items():
+        line = f"{name}: {row['bytes'] / 2**20:.2f} MB ({row['compression']})"
+        if row["raw_bytes"] is not None:
+            line += f", raw {row['raw_bytes'] / 2**20:.2f} MB, saving {100 * row['saving']:.0f}%"
+        print(line)
\ No newline at end of file
@@ -0,0 +1,289 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/07_serving.ipynb (unless otherwise specified).
+
+__all__ = ['EvaluationServer', 'write_frame', 'read_frame', 'STATUS_OK', 'STATUS_ERROR', 'AsyncEvaluationServer',
+           'EvaluationClient']
+
+# Cell
+import multiprocessing as mp
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Tuple
+import asyncio
+import struct
+
+import tenseal.sealapi as seal
+
+from .seal_helper import seal_to_bytes, seal_from_bytes, mod_switch_to_last_inplace
+from .container import CiphertextReader, CiphertextWriter
+
+# Cell
+# State of a worker process, loaded once by _init_worker
+_worker = {}
+
+def _init_worker(load_evaluator: Callable, args: Tuple):
+    """Loads the SEAL context and the evaluator of a worker process."""
+    context, evaluator = load_evaluator(*args)
+    _worker["context"] = context
+    _worker["evaluator"] = evaluator
+
+def _compute(ctx: seal.Ciphertext) -> seal.Ciphertext:
+    """Evaluates a ciphertext, and mod switches the output to the last level to shrink it."""
+    evaluator = _worker["evaluator"]
+    output = evaluator(ctx)
+    return mod_switch_to_last_inplace(output, evaluator.evaluator, _worker["context"])
+
+def _evaluate(data: bytes) -> bytes:
+    """Evaluates a serialized ciphertext and returns the serialized output."""
+    ctx = seal_from_bytes(seal.Ciphertext, _worker["context"], data)
+    output = _compute(ctx)
+    return seal_to_bytes(output)
+
+def _evaluate_file(paths: Tuple[str, str]) -> str:
+    """Evaluates the ciphertext saved at the input path, and saves the output at the output path."""
+    input_path, output_path = paths
+
+    ctx = seal.Ciphertext()
+    ctx.load(_worker["context"], str(input_path))
+    output = _compute(ctx)
+    output.save(str(output_path))
+    return output_path
+
+# Cell
+class EvaluationServer:
+    """Pool of worker processes evaluating ciphertexts.
+
+    Each worker calls load_evaluator(*args) once at startup, which must return the SEAL context
+    and a ready evaluator, e.g. a HomomorphicTreeEvaluator. As SEAL objects cannot be pickled,
+    load_evaluator must load them itself, for instance with load_seal_globals, and be a module
+    level function. Requests are sent to whichever worker is idle.
+    """
+    def __init__(self, load_evaluator: Callable, args: Tuple = (), n_workers: int = None):
+        self.n_workers = n_workers or mp.cpu_count()
+        self.pool = mp.Pool(self.n_workers, initializer=_init_worker, initargs=(load_evaluator, args))
+
+    def submit(self, data: bytes, callback: Callable = None, error_callback: Callable = None):
+        """Submits a serialized ciphertext, and returns an AsyncResult of the serialized output."""
+        return self.pool.apply_async(_evaluate, (data,), callback=callback, error_callback=error_callback)
+
+    def submit_file(self, input_path: Path, output_path: Path,
+                    callback: Callable = None, error_callback: Callable = None):
+        """Submits a saved ciphertext, and returns an AsyncResult of the output path."""
+        return self.pool.apply_async(_evaluate_file, ((str(input_path), str(output_path)),),
+                                     callback=callback, error_callback=error_callback)
+
+    def map(self, datas: Iterable[bytes]) -> Iterator[bytes]:
+        """Evaluates serialized ciphertexts, and yields the outputs in the same order."""
+        return self.pool.imap(_evaluate, datas, chunksize=1)
+
+    def map_files(self, paths: Iterable[Tuple[Path, Path]]) -> Iterator[str]:
+        """Evaluates (input path, output path) pairs, and yields the output paths as they are done."""
+        paths = ((str(input_path), str(output_path)) for input_path, output_path in paths)
+        return self.pool.imap_unordered(_evaluate_file, paths, chunksize=1)
+
+    def evaluate_container(self, input_path: Path, output_path: Path, follow=False) -> int:
+        """Evaluates the ciphertexts of a container file on the workers, and appends the outputs to
+        another container with the same request ids, in the input order. Returns the number of requests."""
+        request_ids = []
+
+        def records(reader):
+            for request_id, data in (reader.follow() if follow else reader):
+                request_ids.append(request_id)
+                yield bytes(data)
+
+        with CiphertextReader(input_path) as reader, CiphertextWriter(output_path) as writer:
+            for i, output in enumerate(self.map(records(reader))):
+                writer.append(request_ids[i], output)
+        return len(request_ids)
+
+    def close(self):
+        """Waits for the pending requests and stops the workers."""
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+# Cell
+# A frame is a header (request id, status, payload length) followed by the payload
+_HEADER = struct.Struct("!QBQ")
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+def write_frame(writer: asyncio.StreamWriter, request_id: int, payload: bytes, status: int = STATUS_OK):
+    """Writes a length-prefixed frame, the caller must await writer.drain()."""
+    writer.write(_HEADER.pack(request_id, status, len(payload)))
+    writer.write(payload)
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    """Reads a frame and returns (request id, status, payload), or None at the end of the stream."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise
+        return None
+    request_id, status, length = _HEADER.unpack(header)
+    payload = await reader.readexactly(length)
+    return request_id, status, payload
+
+# Cell
+class AsyncEvaluationServer:
+    """Serves an EvaluationServer over a TCP or Unix socket.
+
+    Clients send frames with a serialized ciphertext, and receive a frame with the same request id
+    containing the serialized output, or an error message. Requests of a connection are evaluated
+    concurrently by the workers and answered as soon as they are done, so several requests can be
+    in flight on the same connection. Once max_in_flight requests of a connection are pending, the
+    server stops reading from it until one is answered, which pushes back on the client.
+    """
+    def __init__(self, server: EvaluationServer, max_in_flight: int = None):
+        self.server = server
+        self.max_in_flight = max_in_flight or 2 * server.n_workers
+
+    async def evaluate(self, data: bytes) -> bytes:
+        """Evaluates a serialized ciphertext on the workers without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def set_result(output):
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(output))
+
+        def set_exception(e):
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_exception(e))
+
+        self.server.submit(data, callback=set_result, error_callback=set_exception)
+        return await future
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Reads the requests of a connection, and writes back the answers in completion order."""
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def answer(request_id, data):
+            try:
+                output, status = await self.evaluate(data), STATUS_OK
+            except Exception as e:
+                output, status = repr(e).encode(), STATUS_ERROR
+            try:
+                async with write_lock:
+                    write_frame(writer, request_id, output, status)
+                    await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                in_flight.release()
+
+        try:
+            while True:
+                await in_flight.acquire()
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                request_id, _, data = frame
+                task = asyncio.ensure_future(answer(request_id, data))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            for task in tasks:
+                task.cancel()
+        finally:
+            writer.close()
+
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        return await asyncio.start_unix_server(self.handle_connection, str(path))
+
+# Cell
+class EvaluationClient:
+    """Client of an AsyncEvaluationServer.
+
+    evaluate can be called concurrently, each request gets its own id and responses are matched
+    to requests as they arrive, whatever their order. At most max_in_flight requests are sent
+    without an answer, further calls wait.
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_in_flight: int = 16):
+        self.reader = reader
+        self.writer = writer
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.write_lock = asyncio.Lock()
+        self.pending = {}
+        self.next_id = 0
+        self.receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect_tcp(cls, host: str = "127.0.0.1", port: int = 8765, max_in_flight: int = 16):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, max_in_flight)
+
+    @classmethod
+    async def connect_unix(cls, path: str, max_in_flight: int = 16):
+        reader, writer = await asyncio.open_unix_connection(str(path))
+        return cls(reader, writer, max_in_flight)
+
+    async def _receive(self):
+        """Dispatches the responses to the pending requests."""
+        error = ConnectionError("Connection closed by the server")
+        try:
+            while True:
+                frame = await read_frame(self.reader)
+                if frame is None:
+                    break
+                request_id, status, payload = frame
+                future = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(payload.decode()))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = e
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    async def evaluate(self, data: bytes) -> bytes:
+        """Sends a serialized ciphertext and returns the serialized output."""
+        async with self.in_flight:
+            if self.receiver.done():
+                raise ConnectionError("Connection closed")
+            request_id = self.next_id
+            self.next_id += 1
+
+            future = asyncio.get_running_loop().create_future()
+            self.pending[request_id] = future
+
+            async with self.write_lock:
+                write_frame(self.writer, request_id, data)
+                await self.writer.drain()
+            return await future
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.receiver
+        finally:
+            self.receiver.cancel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
\ No newline at end of file
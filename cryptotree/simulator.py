@@ -0,0 +1,319 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/11_simulator.ipynb (unless otherwise specified).
+
+__all__ = ['CKKSSimulator', 'SimulatedEncoder', 'SimulatedEncryptor', 'SimulatedDecryptor', 'SimulatedEvaluator',
+           'test_simulator']
+
+# Cell
+import math
+import weakref
+from typing import Union
+
+import numpy as np
+import tenseal.sealapi as seal
+
+from .seal_helper import EncryptionPlan
+
+# Cell
+class CKKSSimulator:
+    """Plaintext simulation of the CKKS computations done with SEAL, on whole datasets at once.
+
+    The simulator provides an encoder, an encryptor, a decryptor and an evaluator with the interface of
+    the SEAL ones, so that a HomomorphicTreeEvaluator and a HomomorphicTreeFeaturizer built with them run
+    unchanged. Ciphertexts and plaintexts are still seal.Ciphertext and seal.Plaintext objects, which hold
+    the parms_id, the scale and the size exactly as SEAL would, but their slots are kept in numpy arrays,
+    with one row per sample. Encrypting a 2-D array of features thus evaluates the whole dataset in one pass.
+
+    The checks of SEAL are reproduced, i.e. levels and scales must match when adding, the scale must fit
+    in the modulus, rescaling divides the scale by the actual prime dropped, and forcing the scale of
+    a ciphertext changes the value it decrypts to. If galois_keys is given to the evaluator as a list
+    of rotation steps, rotations by other steps fail, as with missing Galois keys.
+
+    slot_count can be smaller than the real number of slots to save memory, which gives the same results
+    as long as the evaluator uses a batch size of 1 and rotations never bring back slots past slot_count,
+    which is the case with slot_count equal to the stride of the evaluator.
+
+    If noise, Gaussian errors like the ones of CKKS are added: the fresh noise of SEAL, of standard
+    deviation 3.2 in each coefficient, at encryption, and the rounding error of each rescale, whose
+    product with a ternary secret key has a standard deviation of sqrt((1 + 2N/3) / 12) in each coefficient.
+    A slot gets sqrt(N) times the error of a coefficient, divided by the scale. Key switching errors are neglected.
+    """
+    def __init__(self, context: seal.SEALContext, slot_count: int = None, noise=False, seed: int = None):
+        self.context = context
+        self.poly_modulus_degree = context.first_context_data().parms().poly_modulus_degree()
+        self.slot_count = slot_count if slot_count else self.poly_modulus_degree // 2
+
+        self.noise_enabled = noise
+        self.encryption_noise_std = 3.2
+        self.rescale_noise_std = math.sqrt((1 + 2 * self.poly_modulus_degree / 3) / 12)
+        self.rng = np.random.default_rng(seed)
+
+        # Slots of the ciphertexts and plaintexts, with the scale they were computed with, by id as
+        # plaintexts are not hashable. Entries are removed when their object is garbage collected.
+        self.values = {}
+        self.refs = {}
+
+        self.encoder = SimulatedEncoder(self)
+        self.encryptor = SimulatedEncryptor(self)
+        self.decryptor = SimulatedDecryptor(self)
+        self.evaluator = SimulatedEvaluator(self)
+
+    @classmethod
+    def from_plan(cls, plan: EncryptionPlan, slot_count: int = None, noise=False, seed: int = None):
+        """Creates a simulator for the parameters of a plan, without generating any key."""
+        parms = seal.EncryptionParameters(seal.SCHEME_TYPE.CKKS)
+        parms.set_poly_modulus_degree(plan.poly_modulus_degree)
+        parms.set_coeff_modulus(seal.CoeffModulus.Create(plan.poly_modulus_degree, plan.moduli))
+        context = seal.SEALContext.Create(parms, True, seal.SEC_LEVEL_TYPE.TC128)
+        return cls(context, slot_count, noise, seed)
+
+    def get(self, obj: Union[seal.Ciphertext, seal.Plaintext]) -> np.ndarray:
+        """Returns the slots of a ciphertext or a plaintext, as decrypted with its current scale."""
+        values, scale = self.values[id(obj)]
+        return values if scale == obj.scale else values * (scale / obj.scale)
+
+    def set(self, obj: Union[seal.Ciphertext, seal.Plaintext], values: np.ndarray, scale: float = None):
+        key = id(obj)
+        if key not in self.refs:
+            self.refs[key] = weakref.ref(obj, lambda _: self._remove(key))
+        self.values[key] = (values, obj.scale if scale is None else scale)
+
+    def _remove(self, key: int):
+        self.values.pop(key, None)
+        self.refs.pop(key, None)
+
+    def copy(self, source, destination):
+        """Gives destination the slots of source, as computed with the scale of source."""
+        values, scale = self.values[id(source)]
+        self.set(destination, values, scale)
+
+    def noise(self, shape, scale: float, std: float) -> np.ndarray:
+        """Error of the slots for an error of standard deviation std in each coefficient."""
+        if not self.noise_enabled:
+            return 0.
+        return self.rng.normal(0., std * math.sqrt(self.poly_modulus_degree) / scale, shape)
+
+    def decrypt(self, ctx: seal.Ciphertext) -> np.ndarray:
+        """Returns the slots of a ciphertext, with one row per sample."""
+        return self.get(ctx)
+
+    def evaluate(self, tree_evaluator, featurizer, X: np.ndarray, chunk_size: int = 10000) -> np.ndarray:
+        """Simulates the encrypted evaluation of each row of X, and returns the scores of shape (n_rows, n_classes).
+
+        tree_evaluator and featurizer must have been created with the encoder, evaluator and encryptor of the
+        simulator, and tree_evaluator must do the reduction. Rows are processed chunk_size at a time."""
+        assert tree_evaluator.do_reduction, "The evaluator must do the reduction to output scores"
+        n_classes = len(tree_evaluator.w2)
+
+        scores = np.empty((len(X), n_classes))
+        for start in range(0, len(X), chunk_size):
+            outputs = tree_evaluator(featurizer.encrypt(X[start:start + chunk_size]))
+            scores[start:start + chunk_size] = self.decrypt(outputs)[:, :n_classes]
+        return scores
+
+# Cell
+class SimulatedEncoder:
+    """Simulation of seal.CKKSEncoder, which encodes vectors, or 2-D arrays of one vector per sample."""
+    def __init__(self, simulator: CKKSSimulator):
+        self.simulator = simulator
+        # Only used to give plaintexts their parms_id and scale
+        self.encoder = seal.CKKSEncoder(simulator.context)
+
+    def slot_count(self) -> int:
+        return self.simulator.slot_count
+
+    def encode(self, values, scale: float, ptx: seal.Plaintext):
+        self.encoder.encode(0., scale, ptx)
+
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim > 0:
+            assert values.shape[-1] <= self.simulator.slot_count, \
+                f"{values.shape[-1]} values do not fit in {self.simulator.slot_count} slots"
+            padding = [(0, 0)] * (values.ndim - 1) + [(0, self.simulator.slot_count - values.shape[-1])]
+            values = np.pad(values, padding)
+        self.simulator.set(ptx, values)
+
+    def decode_double(self, ptx: seal.Plaintext) -> np.ndarray:
+        return self.simulator.get(ptx)
+
+class SimulatedEncryptor:
+    """Simulation of seal.Encryptor, for both public and symmetric keys."""
+    def __init__(self, simulator: CKKSSimulator):
+        self.simulator = simulator
+
+    def encrypt(self, ptx: seal.Plaintext, ctx: seal.Ciphertext = None):
+        if ctx is None:
+            ctx = seal.Ciphertext()
+        ctx.resize(self.simulator.context, ptx.parms_id(), 2)
+        ctx.scale = ptx.scale
+
+        # Ciphertexts always have one row per sample
+        values = self.simulator.get(ptx)
+        if np.ndim(values) == 0:
+            values = np.full(self.simulator.slot_count, values)
+        values = np.atleast_2d(values)
+        self.simulator.set(ctx, values + self.simulator.noise(values.shape, ctx.scale, self.simulator.encryption_noise_std))
+        return ctx
+
+    encrypt_symmetric = encrypt
+
+class SimulatedDecryptor:
+    """Simulation of seal.Decryptor."""
+    def __init__(self, simulator: CKKSSimulator):
+        self.simulator = simulator
+
+    def decrypt(self, ctx: seal.Ciphertext, ptx: seal.Plaintext):
+        ptx.scale = ctx.scale
+        self.simulator.copy(ctx, ptx)
+
+# Cell
+class SimulatedEvaluator:
+    """Simulation of the operations of seal.Evaluator used by the homomorphic evaluation.
+
+    Operations fail with the ValueError raised by SEAL in the same situation."""
+    def __init__(self, simulator: CKKSSimulator):
+        self.simulator = simulator
+        self.context = simulator.context
+        # Plaintexts are mod switched for real, as they are only encoded once
+        self.evaluator = seal.Evaluator(simulator.context)
+
+    def _context_data(self, obj):
+        return self.context.get_context_data(obj.parms_id())
+
+    def _output(self, destination: seal.Ciphertext, parms_id, size: int, scale: float, values: np.ndarray):
+        """Sets the metadata and the slots of the destination of an operation."""
+        if destination.parms_id() != parms_id or destination.size() != size:
+            destination.resize(self.context, parms_id, size)
+        destination.scale = scale
+        self.simulator.set(destination, values)
+
+    def _check_same_level(self, x, y, names: str):
+        if x.parms_id() != y.parms_id():
+            raise ValueError(f"{names} parameter mismatch")
+
+    def _check_same_scale(self, x, y):
+        if not math.isclose(x.scale, y.scale, rel_tol=1e-10):
+            raise ValueError("scale mismatch")
+
+    def _check_scale_bound(self, obj, scale: float):
+        if math.log2(scale) >= self._context_data(obj).total_coeff_modulus_bit_count():
+            raise ValueError("scale out of bounds")
+
+    def add(self, x: seal.Ciphertext, y: seal.Ciphertext, destination: seal.Ciphertext):
+        self._check_same_level(x, y, "encrypted1 and encrypted2")
+        self._check_same_scale(x, y)
+        self._output(destination, x.parms_id(), max(x.size(), y.size()), x.scale,
+                     self.simulator.get(x) + self.simulator.get(y))
+
+    def add_inplace(self, x: seal.Ciphertext, y: seal.Ciphertext):
+        self.add(x, y, x)
+
+    def sub(self, x: seal.Ciphertext, y: seal.Ciphertext, destination: seal.Ciphertext):
+        self._check_same_level(x, y, "encrypted1 and encrypted2")
+        self._check_same_scale(x, y)
+        self._output(destination, x.parms_id(), max(x.size(), y.size()), x.scale,
+                     self.simulator.get(x) - self.simulator.get(y))
+
+    def sub_inplace(self, x: seal.Ciphertext, y: seal.Ciphertext):
+        self.sub(x, y, x)
+
+    def add_plain(self, x: seal.Ciphertext, ptx: seal.Plaintext, destination: seal.Ciphertext):
+        self._check_same_level(x, ptx, "encrypted and plain")
+        self._check_same_scale(x, ptx)
+        self._output(destination, x.parms_id(), x.size(), x.scale, self.simulator.get(x) + self.simulator.get(ptx))
+
+    def add_plain_inplace(self, x: seal.Ciphertext, ptx: seal.Plaintext):
+        self.add_plain(x, ptx, x)
+
+    def multiply(self, x: seal.Ciphertext, y: seal.Ciphertext, destination: seal.Ciphertext):
+        self._check_same_level(x, y, "encrypted1 and encrypted2")
+        scale = x.scale * y.scale
+        self._check_scale_bound(x, scale)
+        self._output(destination, x.parms_id(), x.size() + y.size() - 1, scale,
+                     self.simulator.get(x) * self.simulator.get(y))
+
+    def multiply_inplace(self, x: seal.Ciphertext, y: seal.Ciphertext):
+        self.multiply(x, y, x)
+
+    def square(self, x: seal.Ciphertext, destination: seal.Ciphertext):
+        self.multiply(x, x, destination)
+
+    def square_inplace(self, x: seal.Ciphertext):
+        self.multiply(x, x, x)
+
+    def multiply_plain(self, x: seal.Ciphertext, ptx: seal.Plaintext, destination: seal.Ciphertext):
+        self._check_same_level(x, ptx, "encrypted and plain")
+        scale = x.scale * ptx.scale
+        self._check_scale_bound(x, scale)
+        self._output(destination, x.parms_id(), x.size(), scale, self.simulator.get(x) * self.simulator.get(ptx))
+
+    def multiply_plain_inplace(self, x: seal.Ciphertext, ptx: seal.Plaintext):
+        self.multiply_plain(x, ptx, x)
+
+    def relinearize_inplace(self, x: seal.Ciphertext, relin_keys=None):
+        self._output(x, x.parms_id(), 2, x.scale, self.simulator.get(x))
+
+    def relinearize(self, x: seal.Ciphertext, relin_keys, destination: seal.Ciphertext):
+        self._output(destination, x.parms_id(), 2, x.scale, self.simulator.get(x))
+
+    def rescale_to_next(self, x: seal.Ciphertext, destination: seal.Ciphertext):
+        context_data = self._context_data(x)
+        if context_data.chain_index() == 0:
+            raise ValueError("end of modulus switching chain reached")
+
+        prime = context_data.parms().coeff_modulus()[-1].value()
+        scale = x.scale / prime
+        values = self.simulator.get(x)
+        self._output(destination, context_data.next_context_data().parms_id(), x.size(), scale,
+                     values + self.simulator.noise(np.shape(values), scale, self.simulator.rescale_noise_std))
+
+    def rescale_to_next_inplace(self, x: seal.Ciphertext):
+        self.rescale_to_next(x, x)
+
+    def mod_switch_to(self, x, parms_id, destination):
+        if isinstance(x, seal.Plaintext):
+            self.evaluator.mod_switch_to(x, parms_id, destination)
+            self.simulator.copy(x, destination)
+            return
+
+        if self.context.get_context_data(parms_id).chain_index() > self._context_data(x).chain_index():
+            raise ValueError("cannot switch to higher level modulus")
+        self._output(destination, parms_id, x.size(), x.scale, self.simulator.get(x))
+
+    def mod_switch_to_inplace(self, x, parms_id):
+        if isinstance(x, seal.Plaintext):
+            self.evaluator.mod_switch_to_inplace(x, parms_id)
+        else:
+            self.mod_switch_to(x, parms_id, x)
+
+    def mod_switch_to_next_inplace(self, x):
+        self.mod_switch_to_inplace(x, self._context_data(x).next_context_data().parms_id())
+
+    def rotate_vector(self, x: seal.Ciphertext, steps: int, galois_keys, destination: seal.Ciphertext):
+        """Rotates the slots to the left by steps. galois_keys can be the list of available steps."""
+        if isinstance(galois_keys, (list, tuple, set)) and steps != 0 and steps not in galois_keys:
+            raise ValueError(f"Galois key not present for step {steps}")
+        self._output(destination, x.parms_id(), x.size(), x.scale, np.roll(self.simulator.get(x), -steps, axis=-1))
+
+    def rotate_vector_inplace(self, x: seal.Ciphertext, steps: int, galois_keys):
+        self.rotate_vector(x, steps, galois_keys, x)
+
+# Cell
+def test_simulator(plan: EncryptionPlan, model, neural_model, activation_coeffs, polynomial_evaluator,
+                   X: np.ndarray, eps=1e-3):
+    """Tests if the noiseless simulation of the homomorphic evaluation of model with the parameters of plan gives,
+    on every row of X, the scores of neural_model, the torch model it was built from"""
+    import torch
+    from fastcore.test import test_close
+    from .cryptotree import HomomorphicTreeEvaluator, HomomorphicTreeFeaturizer
+
+    simulator = CKKSSimulator.from_plan(plan, slot_count=plan.slots)
+    scale = 2. ** plan.PRECISION_BITS
+    tree_evaluator = HomomorphicTreeEvaluator.from_model(model, activation_coeffs, polynomial_evaluator,
+                                                         simulator.evaluator, simulator.encoder, None,
+                                                         plan.galois_steps, scale, batch_size=1)
+    featurizer = HomomorphicTreeFeaturizer(model.return_comparator(), simulator.encoder, simulator.encryptor, scale)
+    scores = simulator.evaluate(tree_evaluator, featurizer, X)
+
+    with torch.no_grad():
+        expected = neural_model(torch.tensor(X).float()).numpy()
+    test_close(scores, expected, eps)
\ No newline at end of file
@@ -0,0 +1,161 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: nbs/12_training.ipynb (unless otherwise specified).
+
+__all__ = ['chunk_slices', 'row_chunk_size_for_memory', 'chunked_forward', 'chunked_backward', 'fit_streaming',
+           'StreamingDataset', 'test_chunked']
+
+# Cell
+from pathlib import Path
+from typing import Callable, Iterator, List, Sequence, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import IterableDataset, get_worker_info
+
+from .tree import NeuralRandomForest
+from .preprocessing import read_chunks
+
+# Cell
+def chunk_slices(n: int, chunk_size: int = None) -> List[slice]:
+    """Splits range(n), e.g. the rows of a batch or the trees of a forest, in contiguous chunks of at most chunk_size."""
+    if chunk_size is None:
+        return [slice(0, n)]
+    assert chunk_size > 0, "chunk_size must be positive"
+    return [slice(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+
+def row_chunk_size_for_memory(neural_rf: NeuralRandomForest, max_bytes: int, tree_chunk_size: int = None,
+                              training: bool = True) -> int:
+    """Returns the number of rows whose comparisons and matches fit in max_bytes for a chunk of trees.
+
+    Each row of a chunk of t trees holds t * (n_nodes + n_leaves) float32 values for the comparisons and the
+    matches. When training, autograd also keeps the inputs of the activations, which doubles it."""
+    n_trees = neural_rf.n_trees if tree_chunk_size is None else min(tree_chunk_size, neural_rf.n_trees)
+    n_nodes = neural_rf.comparator_bias.shape[0]
+    bytes_per_row = 4 * n_trees * (n_nodes + neural_rf.n_leaves_max) * (2 if training else 1)
+    row_chunk_size = max_bytes // bytes_per_row
+    assert row_chunk_size > 0, f"A single row needs {bytes_per_row} bytes, reduce tree_chunk_size"
+    return int(row_chunk_size)
+
+# Cell
+def chunked_forward(neural_rf: NeuralRandomForest, x: torch.Tensor,
+                    row_chunk_size: int = None, tree_chunk_size: int = None) -> torch.Tensor:
+    """Computes the outputs of the forest by chunks of rows and chunks of trees.
+
+    Only the comparisons and matches of row_chunk_size rows and tree_chunk_size trees are held at once.
+    No graph is kept, so this is meant for inference, chunked_backward being the training counterpart."""
+    with torch.no_grad():
+        outputs = []
+        for rows in chunk_slices(len(x), row_chunk_size):
+            output = neural_rf.bias.expand(rows.stop - rows.start, -1).clone()
+            for trees in chunk_slices(neural_rf.n_trees, tree_chunk_size):
+                output += neural_rf.tree_outputs(x[rows], trees)
+            outputs.append(output)
+        return torch.cat(outputs)
+
+def chunked_backward(neural_rf: NeuralRandomForest, x: torch.Tensor, y: torch.Tensor, loss_func: Callable,
+                     row_chunk_size: int = None, tree_chunk_size: int = None) -> float:
+    """Accumulates in the .grad of the parameters the gradient of loss_func(neural_rf(x), y), by chunks.
+
+    loss_func must average over the rows, as nn.CrossEntropyLoss does, so that the losses of the chunks of
+    rows are weighted by their size. When the trees are chunked, the outputs are first computed without
+    graph, the gradient of the loss with respect to them is taken, then each chunk of trees is computed
+    again with its graph and backpropagated with that gradient. The gradient is thus the exact one, for
+    the price of computing the forward twice. Returns the loss."""
+    chunks = chunk_slices(neural_rf.n_trees, tree_chunk_size)
+    total_loss = 0.
+    for rows in chunk_slices(len(x), row_chunk_size):
+        x_rows, y_rows = x[rows], y[rows]
+        weight = len(x_rows) / len(x)
+
+        if len(chunks) == 1:
+            loss = loss_func(neural_rf(x_rows), y_rows) * weight
+            loss.backward()
+        else:
+            outputs = chunked_forward(neural_rf, x_rows, tree_chunk_size=tree_chunk_size).requires_grad_()
+            loss = loss_func(outputs, y_rows) * weight
+            grad_outputs, = torch.autograd.grad(loss, outputs)
+
+            for i, trees in enumerate(chunks):
+                output = neural_rf.tree_outputs(x_rows, trees)
+                if i == 0:
+                    output = output + neural_rf.bias.expand_as(output)
+                output.backward(grad_outputs)
+        total_loss += loss.item()
+    return total_loss
+
+def fit_streaming(neural_rf: NeuralRandomForest, batches: Iterator, optimizer: torch.optim.Optimizer,
+                  loss_func: Callable = nn.CrossEntropyLoss(), epochs: int = 1,
+                  row_chunk_size: int = None, tree_chunk_size: int = None) -> List[float]:
+    """Fine-tunes a forest on an iterable of (x, y) batches, e.g. a StreamingDataset, with chunked_backward.
+
+    The gradients of the chunks of a batch are accumulated before each optimizer step, so the batch size
+    sets the optimization, and row_chunk_size and tree_chunk_size set the peak memory. Returns the loss of
+    each batch."""
+    losses = []
+    neural_rf.train()
+    for epoch in range(epochs):
+        for x, y in batches:
+            optimizer.zero_grad()
+            losses.append(chunked_backward(neural_rf, x, y, loss_func, row_chunk_size, tree_chunk_size))
+            optimizer.step()
+    return losses
+
+# Cell
+def _default_transform(df, target: str):
+    x = torch.tensor(df.drop(columns=[target]).to_numpy(dtype=np.float32))
+    y = torch.tensor(df[target].to_numpy(dtype=np.int64))
+    return x, y
+
+class StreamingDataset(IterableDataset):
+    """Dataset of (x, y) batches read from CSV or Parquet files one chunk at a time.
+
+    Only one chunk of chunk_size rows is in memory at once, whatever the size of the files. transform turns
+    a pandas DataFrame chunk into the (x, y) tensors, e.g. with a fitted ColumnarFeaturizer, and defaults to
+    all the columns but target as float32 features. Batches are given as is, so it is used with
+    DataLoader(dataset, batch_size=None), and with several workers, each worker reads its own chunks.
+    Parquet files need pyarrow."""
+    def __init__(self, paths: Union[str, Path, Sequence[Union[str, Path]]], target: str = None,
+                 chunk_size: int = 4096, transform: Callable = None, columns: List[str] = None,
+                 **read_kwargs):
+        self.paths = [Path(paths)] if isinstance(paths, (str, Path)) else [Path(path) for path in paths]
+        assert transform is not None or target is not None, "Either target or transform must be given"
+        self.target = target
+        self.chunk_size = chunk_size
+        self.transform = transform
+        self.columns = columns
+        self.read_kwargs = read_kwargs
+
+    def __iter__(self):
+        worker = get_worker_info()
+        chunks = (chunk for path in self.paths
+                  for chunk in read_chunks(path, self.chunk_size, self.columns, **self.read_kwargs))
+        for i, df in enumerate(chunks):
+            if worker is not None and i % worker.num_workers != worker.id:
+                continue
+            if self.transform is not None:
+                yield self.transform(df)
+            else:
+                yield _default_transform(df, self.target)
+
+# Cell
+def test_chunked(neural_rf: NeuralRandomForest, x: torch.Tensor, y: torch.Tensor,
+                 row_chunk_size: int = None, tree_chunk_size: int = None, eps=1e-5):
+    """Tests if chunked_forward gives the outputs of the forest on x, and if chunked_backward gives the loss and
+    accumulates the gradients of the cross entropy with y, computed on the whole batch at once"""
+    from fastcore.test import test_close
+
+    loss_func = nn.CrossEntropyLoss()
+    with torch.no_grad():
+        outputs = neural_rf(x)
+    test_close(chunked_forward(neural_rf, x, row_chunk_size, tree_chunk_size), outputs, eps)
+
+    neural_rf.zero_grad()
+    loss = loss_func(neural_rf(x), y)
+    loss.backward()
+    grads = {name: p.grad.clone() for name, p in neural_rf.named_parameters()}
+
+    neural_rf.zero_grad()
+    chunked_loss = chunked_backward(neural_rf, x, y, loss_func, row_chunk_size, tree_chunk_size)
+    test_close(chunked_loss, loss.item(), eps)
+    for name, p in neural_rf.named_parameters():
+        test_close(p.grad, grads[name], eps)
\ No newline at end of file
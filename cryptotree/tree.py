@@ -1,8 +1,10 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/01_tree.ipynb (unless otherwise specified).
 
-__all__ = ['NeuralTreeMaker', 'NeuralDecisionTree', 'DEFAULT_POLYNOMIAL_DEGREE', 'DEFAULT_DILATATION_FACTOR',
-           'DEFAULT_BOUND', 'raise_error_wrong_tree', 'SigmoidTreeMaker', 'TanhTreeMaker', 'check_output_range',
-           'register_output_check', 'pad_tensor', 'pad_neural_tree', 'NeuralRandomForest', 'CrossEntropyLabelSmoothing']
+__all__ = ['PolynomialActivation', 'NeuralTreeMaker', 'NeuralDecisionTree', 'DEFAULT_POLYNOMIAL_DEGREE',
+           'DEFAULT_DILATATION_FACTOR', 'DEFAULT_BOUND', 'raise_error_wrong_tree', 'SigmoidTreeMaker', 'TanhTreeMaker',
+           'check_output_range', 'register_output_check', 'pad_tensor', 'pad_neural_tree', 'make_trees_weights',
+           'NeuralRandomForest', 'SparseNeuralRandomForest', 'CrossEntropyLabelSmoothing', 'test_batched_forest',
+           'test_sparse_forest']
 
 # Cell
 import numpy as np
@@ -27,6 +29,30 @@ DEFAULT_POLYNOMIAL_DEGREE = 16
 DEFAULT_DILATATION_FACTOR = 16
 DEFAULT_BOUND = 1.0
 
+class PolynomialActivation(nn.Module):
+    """Torch activation evaluating a Chebyshev series with the Clenshaw recurrence.
+
+    It gives the same values as calling the numpy Chebyshev, but stays in torch, keeps the gradient,
+    and can be compiled with TorchScript."""
+    coef: List[float]
+
+    def __init__(self, chebyshev: Chebyshev):
+        super(PolynomialActivation, self).__init__()
+        self.coef = [float(c) for c in chebyshev.coef]
+        # Maps the domain of the series to [-1, 1]
+        offset, scale = chebyshev.mapparms()
+        self.offset = float(offset)
+        self.scale = float(scale)
+
+    def forward(self, x):
+        x = self.offset + self.scale * x
+        two_x = 2 * x
+        b1 = torch.full_like(x, self.coef[-1])
+        b2 = torch.zeros_like(x)
+        for i in range(len(self.coef) - 2, 0, -1):
+            b1, b2 = torch.addcmul(self.coef[i] - b2, two_x, b1), b1
+        return torch.addcmul(self.coef[0] - b2, x, b1)
+
 class NeuralTreeMaker:
     """Base class to """
     def __init__(self,
@@ -36,15 +62,17 @@ class NeuralTreeMaker:
                  create_classifier_head: Callable,
                  dilatation_factor : float = DEFAULT_DILATATION_FACTOR,
                  use_polynomial : bool = False,
-                 polynomial_degree : int = DEFAULT_POLYNOMIAL_DEGREE, bound: float = DEFAULT_BOUND):
+                 polynomial_degree : int = DEFAULT_POLYNOMIAL_DEGREE, bound: float = DEFAULT_BOUND,
+                 create_tree_weights: Callable = None):
 
         # first we need to define the activation used
         activation_fn = lambda x: activation(x * dilatation_factor)
         if use_polynomial:
             domain = [-bound, bound]
             activation_fn_numpy = lambda x: activation_fn(torch.tensor(x))
-            self.activation = Chebyshev.interpolate(activation_fn_numpy,deg=polynomial_degree,domain=domain)
-            self.coeffs = Polynomial.cast(self.activation).coef
+            chebyshev = Chebyshev.interpolate(activation_fn_numpy,deg=polynomial_degree,domain=domain)
+            self.activation = PolynomialActivation(chebyshev)
+            self.coeffs = Polynomial.cast(chebyshev).coef
         else:
             self.activation = activation_fn
             self.coeffs = None
@@ -52,6 +80,8 @@ class NeuralTreeMaker:
         self.create_linear_leaf_matcher = create_linear_leaf_matcher
         self.create_regression_head = create_regression_head
         self.create_classifier_head = create_classifier_head
+        # Optional vectorized function returning the weights of make_tree, used to convert large forests
+        self.create_tree_weights = create_tree_weights
 
     def make_tree(self, tree: BaseDecisionTree):
         if is_classifier(tree):
@@ -61,6 +91,13 @@ class NeuralTreeMaker:
         neural_tree = NeuralDecisionTree(tree, self.activation, self.create_linear_leaf_matcher, create_head)
         return neural_tree
 
+    def make_tree_weights(self, tree: BaseDecisionTree):
+        """Returns the weights w0, b0, w1, b1, w2, b2 of the neural tree of make_tree, without building it if
+        the tree maker has a vectorized create_tree_weights."""
+        if self.create_tree_weights is not None and is_classifier(tree):
+            return self.create_tree_weights(tree)
+        return self.make_tree(tree).return_weights()
+
 class NeuralDecisionTree(nn.Module):
     """Base class of Neural Decision Trees."""
     def __init__(self, tree: BaseDecisionTree,
@@ -101,7 +138,7 @@ class NeuralDecisionTree(nn.Module):
         return w0, b0, w1, b1, w2, b2
 
 # Cell
-from .activations import sigmoid_linear_leaf_matcher, sigmoid_classification_head
+from .activations import sigmoid_linear_leaf_matcher, sigmoid_classification_head, sigmoid_tree_weights
 
 def raise_error_wrong_tree(*args,**kwargs):
     raise Exception("Wrong supervised tree used")
@@ -115,6 +152,8 @@ class SigmoidTreeMaker(NeuralTreeMaker):
         create_linear_leaf_matcher = partial(sigmoid_linear_leaf_matcher,eps=eps)
         create_classifier_head = sigmoid_classification_head
         create_regression_head = raise_error_wrong_tree
+        # sigmoid_linear_leaf_matcher always uses eps=0.5
+        create_tree_weights = sigmoid_tree_weights
 
         super().__init__(activation,
                  create_linear_leaf_matcher,
@@ -122,10 +161,11 @@ class SigmoidTreeMaker(NeuralTreeMaker):
                  create_classifier_head,
                  dilatation_factor,
                  use_polynomial,
-                 polynomial_degree)
+                 polynomial_degree,
+                 create_tree_weights=create_tree_weights)
 
 # Cell
-from .activations import tanh_linear_leaf_matcher, tanh_classification_head
+from .activations import tanh_linear_leaf_matcher, tanh_classification_head, tanh_tree_weights
 
 class TanhTreeMaker(NeuralTreeMaker):
     def __init__(self, dilatation_factor : float = DEFAULT_DILATATION_FACTOR,
@@ -136,6 +176,7 @@ class TanhTreeMaker(NeuralTreeMaker):
         create_linear_leaf_matcher = partial(tanh_linear_leaf_matcher,eps=eps)
         create_classifier_head = tanh_classification_head
         create_regression_head = raise_error_wrong_tree
+        create_tree_weights = partial(tanh_tree_weights, eps=eps)
 
         super().__init__(activation,
                  create_linear_leaf_matcher,
@@ -143,7 +184,8 @@ class TanhTreeMaker(NeuralTreeMaker):
                  create_classifier_head,
                  dilatation_factor,
                  use_polynomial,
-                 polynomial_degree)
+                 polynomial_degree,
+                 create_tree_weights=create_tree_weights)
 
 # Cell
 def check_output_range(m, i, o, threshold=1):
@@ -194,17 +236,104 @@ def pad_neural_tree(neural_tree, n_nodes_max, n_leaves_max):
     neural_tree.head.bias.data = b2
 
 # Cell
+from concurrent.futures import ProcessPoolExecutor
+
+def make_trees_weights(trees: List[BaseDecisionTree], tree_maker: NeuralTreeMaker, n_jobs: int = 1) -> List:
+    """Returns the weights w0, b0, w1, b1, w2, b2 of the neural tree of each tree, with n_jobs processes."""
+    if n_jobs > 1:
+        # The tree maker holds lambdas and cannot be sent to other processes, but its create_tree_weights can
+        assert tree_maker.create_tree_weights is not None, "Parallel conversion needs create_tree_weights"
+        with ProcessPoolExecutor(n_jobs) as executor:
+            return list(executor.map(tree_maker.create_tree_weights, trees,
+                                     chunksize=max(1, len(trees) // (4 * n_jobs))))
+    return [tree_maker.make_tree_weights(tree) for tree in trees]
+
+def _stack_tree_weights(tree_weights: List, n_nodes_max: int, n_leaves_max: int) -> List[torch.Tensor]:
+    """Fills the padded comparator, matcher and head tensors of a forest, and their biases, from the
+    weights w0, b0, w1, b1, w2, b2 of each tree."""
+    n_trees = len(tree_weights)
+    d = tree_weights[0][0].shape[1]
+    c = tree_weights[0][4].shape[0]
+
+    comparator = np.zeros((d, n_nodes_max, n_trees), dtype=np.float32)
+    comparator_bias = np.zeros((n_nodes_max, n_trees), dtype=np.float32)
+    matcher = np.zeros((n_leaves_max, n_nodes_max, n_trees), dtype=np.float32)
+    matcher_bias = np.zeros((n_leaves_max, n_trees), dtype=np.float32)
+    head = np.zeros((c, n_leaves_max, n_trees), dtype=np.float32)
+    head_bias = np.zeros((c, n_trees), dtype=np.float32)
+
+    for t, (w0, b0, w1, b1, w2, b2) in enumerate(tree_weights):
+        n_nodes, n_leaves = len(b0), len(b1)
+        comparator[:, :n_nodes, t] = w0.T
+        comparator_bias[:n_nodes, t] = b0
+        matcher[:n_leaves, :n_nodes, t] = w1
+        matcher_bias[:n_leaves, t] = b1
+        head[:, :n_leaves, t] = w2
+        head_bias[:, t] = b2
+
+    return [torch.from_numpy(w) for w in [comparator, comparator_bias, matcher, matcher_bias, head, head_bias]]
+
 class NeuralRandomForest(nn.Module):
     def __init__(self, trees: List[BaseDecisionTree],
                  tree_maker: NeuralTreeMaker,
                  weights: torch.Tensor = None, trainable_weights:bool = False,
-                 bias: torch.Tensor = None, trainable_bias:bool = False):
+                 bias: torch.Tensor = None, trainable_bias:bool = False,
+                 batched: bool = False, n_jobs: int = 1):
+        """Creates a forest from sklearn trees, each one converted by the tree maker.
 
+        If batched, the weights of each tree are computed with the vectorized make_tree_weights of the
+        tree maker, without creating one NeuralDecisionTree per tree, and neural_trees is None.
+        n_jobs processes then convert the trees in parallel."""
         super(NeuralRandomForest, self).__init__()
 
         self.n_trees = len(trees)
         self.activation = tree_maker.activation
 
+        if batched:
+            tree_weights = make_trees_weights(trees, tree_maker, n_jobs)
+
+            n_nodes_max = max(len(weights_[1]) for weights_ in tree_weights)
+            n_leaves_max = max(len(weights_[3]) for weights_ in tree_weights)
+            self.n_leaves_max = n_leaves_max
+            self.neural_trees = None
+
+            comparator, comparator_bias, matcher, matcher_bias, head, head_bias = \
+                _stack_tree_weights(tree_weights, n_nodes_max, n_leaves_max)
+        else:
+            comparator, comparator_bias, matcher, matcher_bias, head, head_bias = self._make_neural_trees(trees, tree_maker)
+
+        self.register_parameter("comparator", nn.Parameter(comparator))
+        self.register_parameter("comparator_bias", nn.Parameter(comparator_bias))
+        self.register_parameter("matcher", nn.Parameter(matcher))
+        self.register_parameter("matcher_bias", nn.Parameter(matcher_bias))
+        self.register_parameter("head", nn.Parameter(head))
+        self.register_parameter("head_bias", nn.Parameter(head_bias))
+
+        self._register_output_weights(head.shape[0], weights, trainable_weights, bias, trainable_bias)
+
+    def _register_output_weights(self, c: int, weights: torch.Tensor = None, trainable_weights: bool = False,
+                                 bias: torch.Tensor = None, trainable_bias: bool = False):
+        """Registers the weights of the trees and the bias of the output, by default averaging the trees."""
+        if not torch.is_tensor(weights):
+            weights = torch.ones(self.n_trees) * (1. / self.n_trees)
+
+        if trainable_weights:
+            weights = nn.Parameter(weights)
+            self.register_parameter("weights", weights)
+        else:
+            self.register_buffer("weights", weights)
+
+        if not torch.is_tensor(bias):
+            bias = torch.zeros(c)
+
+        if trainable_bias:
+            bias = nn.Parameter(bias)
+            self.register_parameter("bias",bias)
+        else:
+            self.register_buffer("bias",bias)
+
+    def _make_neural_trees(self, trees: List[BaseDecisionTree], tree_maker: NeuralTreeMaker) -> List[torch.Tensor]:
+        """Creates one padded NeuralDecisionTree per tree, and returns their weights stacked along the last dimension."""
         # First we need to create the neural trees
         neural_trees = []
         n_nodes = []
@@ -230,52 +359,23 @@ class NeuralRandomForest(nn.Module):
         comparators = [neural_tree.comparator.weight.data.unsqueeze(-1) for neural_tree in neural_trees]
         comparator = torch.cat(comparators, dim=-1)
         comparator = comparator.permute(1,0,2)
-        comparator = nn.Parameter(comparator)
-        self.register_parameter("comparator", comparator)
 
         comparator_bias = [neural_tree.comparator.bias.data.unsqueeze(-1) for neural_tree in neural_trees]
         comparator_bias = torch.cat(comparator_bias, dim=-1)
-        comparator_bias = nn.Parameter(comparator_bias)
-        self.register_parameter("comparator_bias", comparator_bias)
 
         matchers = [neural_tree.matcher.weight.data.unsqueeze(-1) for neural_tree in neural_trees]
         matcher = torch.cat(matchers, dim=-1)
-        matcher = nn.Parameter(matcher)
-        self.register_parameter("matcher", matcher)
 
         matcher_bias = [neural_tree.matcher.bias.data.unsqueeze(-1) for neural_tree in neural_trees]
         matcher_bias = torch.cat(matcher_bias, dim=-1)
-        matcher_bias = nn.Parameter(matcher_bias)
-        self.register_parameter("matcher_bias",matcher_bias)
 
         heads = [neural_tree.head.weight.data.unsqueeze(-1) for neural_tree in neural_trees]
         head = torch.cat(heads, dim=-1)
-        head = nn.Parameter(head)
-        self.register_parameter("head", head)
 
         head_bias = [neural_tree.head.bias.data.unsqueeze(-1) for neural_tree in neural_trees]
         head_bias = torch.cat(head_bias, dim=-1)
-        head_bias = nn.Parameter(head_bias)
-        self.register_parameter("head_bias", head_bias)
-
-        if not torch.is_tensor(weights):
-            weights = torch.ones(self.n_trees) * (1. / self.n_trees)
-
-        if trainable_weights:
-            weights = nn.Parameter(weights)
-            self.register_parameter("weights", weights)
-        else:
-            self.register_buffer("weights", weights)
-
-        if not torch.is_tensor(bias):
-            c = neural_tree.head.weight.data.shape[0]
-            bias = torch.zeros(c)
 
-        if trainable_bias:
-            bias = nn.Parameter(bias)
-            self.register_parameter("bias",bias)
-        else:
-            self.register_buffer("bias",bias)
+        return [comparator, comparator_bias, matcher, matcher_bias, head, head_bias]
 
     def forward(self, x):
         comparisons = self.compare(x)
@@ -284,22 +384,33 @@ class NeuralRandomForest(nn.Module):
 
         return outputs
 
-    def compare(self, x):
-        comparisons = torch.einsum("kj,jil->kil",x,self.comparator) + self.comparator_bias.unsqueeze(0)
+    def compare(self, x, trees: slice = slice(None)):
+        comparisons = torch.einsum("kj,jil->kil",x,self.comparator[..., trees]) + self.comparator_bias[:, trees].unsqueeze(0)
         comparisons = self.activation(comparisons)
         return comparisons
 
-    def match(self, comparisons):
-        matches = torch.einsum("kjl,ijl->kil",comparisons, self.matcher) + self.matcher_bias
+    def match(self, comparisons, trees: slice = slice(None)):
+        matches = torch.einsum("kjl,ijl->kil",comparisons, self.matcher[..., trees]) + self.matcher_bias[:, trees]
         matches = self.activation(matches)
         return matches
 
+    def vote(self, matches, trees: slice = slice(None)):
+        """Returns the weighted sum of the outputs of the trees, without the bias of the forest."""
+        outputs = torch.einsum("kjl,cjl->kcl",matches,self.head[..., trees]) + self.head_bias[:, trees]
+        outputs = (outputs * self.weights[trees].expand_as(outputs)).sum(dim=-1)
+        return outputs
+
     def decide(self, matches):
-        outputs = torch.einsum("kjl,cjl->kcl",matches,self.head) + self.head_bias
-        outputs = (outputs * self.weights.expand_as(outputs)).sum(dim=-1)
+        outputs = self.vote(matches)
         outputs = outputs + self.bias.expand_as(outputs)
         return outputs
 
+    def tree_outputs(self, x, trees: slice = slice(None)):
+        """Returns the contribution of a contiguous chunk of trees to the outputs. The outputs of the forest
+        are the sum of the contributions of its chunks plus the bias, so only the comparisons and matches of
+        the chunk are held in memory."""
+        return self.vote(self.match(self.compare(x, trees), trees), trees)
+
     def get_weight_and_bias(self, module:str):
         weight = getattr(self, module)
         bias = getattr(self, module + "_bias")
@@ -328,6 +439,174 @@ class NeuralRandomForest(nn.Module):
 
         return W0, B0, W1, B1, W2, B2
 
+# Cell
+def _sparse_tree_weights(tree_weights: List, n_nodes_max: int, n_leaves_max: int) -> List[torch.Tensor]:
+    """Extracts the non-zero weights of each tree: the feature and the weight of each comparison, and the
+    nodes of the path of each leaf with their weights, padded to the longest path of the forest."""
+    n_trees = len(tree_weights)
+    c = tree_weights[0][4].shape[0]
+
+    paths = []
+    for w0, b0, w1, b1, w2, b2 in tree_weights:
+        assert ((w0 != 0).sum(axis=1) <= 1).all(), "Comparator rows must be one-hot, as built by create_linear_node_comparator"
+        leaves, nodes = np.nonzero(w1)
+        # Position of each node in the path of its leaf, as np.nonzero sorts by leaf
+        positions = np.arange(len(leaves)) - np.searchsorted(leaves, leaves)
+        paths.append((leaves, nodes, positions))
+    max_depth = max(max(len(positions) and positions.max() + 1, 1) for _, _, positions in paths)
+
+    feature_index = np.zeros((n_nodes_max, n_trees), dtype=np.int64)
+    comparator = np.zeros((n_nodes_max, n_trees), dtype=np.float32)
+    comparator_bias = np.zeros((n_nodes_max, n_trees), dtype=np.float32)
+    path_nodes = np.zeros((n_leaves_max, max_depth, n_trees), dtype=np.int64)
+    path_mask = np.zeros((n_leaves_max, max_depth, n_trees), dtype=np.float32)
+    matcher = np.zeros((n_leaves_max, max_depth, n_trees), dtype=np.float32)
+    matcher_bias = np.zeros((n_leaves_max, n_trees), dtype=np.float32)
+    head = np.zeros((c, n_leaves_max, n_trees), dtype=np.float32)
+    head_bias = np.zeros((c, n_trees), dtype=np.float32)
+
+    for t, ((w0, b0, w1, b1, w2, b2), (leaves, nodes, positions)) in enumerate(zip(tree_weights, paths)):
+        n_nodes, n_leaves = len(b0), len(b1)
+        feature_index[:n_nodes, t] = np.abs(w0).argmax(axis=1)
+        comparator[:n_nodes, t] = w0[np.arange(n_nodes), feature_index[:n_nodes, t]]
+        comparator_bias[:n_nodes, t] = b0
+
+        path_nodes[leaves, positions, t] = nodes
+        path_mask[leaves, positions, t] = 1
+        matcher[leaves, positions, t] = w1[leaves, nodes]
+        matcher_bias[:n_leaves, t] = b1
+
+        head[:, :n_leaves, t] = w2
+        head_bias[:, t] = b2
+
+    return [torch.from_numpy(w) for w in [feature_index, comparator, comparator_bias, path_nodes, path_mask,
+                                          matcher, matcher_bias, head, head_bias]]
+
+class SparseNeuralRandomForest(NeuralRandomForest):
+    """NeuralRandomForest which only stores the weights of the decision paths.
+
+    As each comparison looks at a single feature, the comparator is a gather of the features of the nodes,
+    multiplied by a weight per node, minus the thresholds. As each leaf only depends on the nodes of its path,
+    the matcher is a sparse matrix with the weights of the path of each leaf. Memory and FLOPs of the forward,
+    and of fine-tuning, then grow with the number of nodes on paths instead of features times padded nodes.
+
+    comparator and matcher are the weights of the nodes and of the paths, of shapes (n_nodes, n_trees) and
+    (n_leaves, max_depth, n_trees), so that freeze_layer and unfreeze_layer work as for NeuralRandomForest,
+    and return_weights gives the dense weights, e.g. to build a HomomorphicNeuralRandomForest.
+    """
+    def __init__(self, trees: List[BaseDecisionTree],
+                 tree_maker: NeuralTreeMaker,
+                 weights: torch.Tensor = None, trainable_weights:bool = False,
+                 bias: torch.Tensor = None, trainable_bias:bool = False,
+                 n_jobs: int = 1):
+        self._init_from_tree_weights(make_trees_weights(trees, tree_maker, n_jobs), tree_maker.activation,
+                                     weights, trainable_weights, bias, trainable_bias)
+
+    @classmethod
+    def from_dense(cls, neural_rf: NeuralRandomForest) -> "SparseNeuralRandomForest":
+        """Converts a NeuralRandomForest, whose comparator must still be one-hot, keeping its tree weights and bias."""
+        forest = cls.__new__(cls)
+        tree_weights = list(zip(*neural_rf.return_weights()))
+        forest._init_from_tree_weights(tree_weights, neural_rf.activation,
+                                       neural_rf.weights.data.clone(), isinstance(neural_rf.weights, nn.Parameter),
+                                       neural_rf.bias.data.clone(), isinstance(neural_rf.bias, nn.Parameter))
+        return forest
+
+    def _init_from_tree_weights(self, tree_weights: List, activation: Callable,
+                                weights: torch.Tensor = None, trainable_weights: bool = False,
+                                bias: torch.Tensor = None, trainable_bias: bool = False):
+        super(NeuralRandomForest, self).__init__()
+
+        self.n_trees = len(tree_weights)
+        self.activation = activation
+        self.n_features = tree_weights[0][0].shape[1]
+        self.n_nodes_max = max(len(b0) for _, b0, _, _, _, _ in tree_weights)
+        self.n_leaves_max = max(len(b1) for _, _, _, b1, _, _ in tree_weights)
+        self.neural_trees = None
+
+        feature_index, comparator, comparator_bias, path_nodes, path_mask, matcher, matcher_bias, head, head_bias = \
+            _sparse_tree_weights(tree_weights, self.n_nodes_max, self.n_leaves_max)
+
+        self.register_buffer("feature_index", feature_index)
+        self.register_buffer("path_nodes", path_nodes)
+        self.register_buffer("path_mask", path_mask)
+        # The matcher is applied as a sparse (n_leaves * n_trees, n_nodes * n_trees) matrix, whose values are
+        # the weights of the paths, taken in the order of its coalesced indices
+        n_leaves, max_depth, n_trees = path_nodes.shape
+        leaves, positions, trees = torch.nonzero(path_mask, as_tuple=True)
+        rows, columns = leaves * n_trees + trees, path_nodes[leaves, positions, trees] * n_trees + trees
+        order = torch.argsort(rows * self.n_nodes_max * n_trees + columns)
+        self.register_buffer("path_indices", torch.stack([rows[order], columns[order]]))
+        self.register_buffer("path_positions", ((leaves * max_depth + positions) * n_trees + trees)[order])
+
+        self.register_parameter("comparator", nn.Parameter(comparator))
+        self.register_parameter("comparator_bias", nn.Parameter(comparator_bias))
+        self.register_parameter("matcher", nn.Parameter(matcher))
+        self.register_parameter("matcher_bias", nn.Parameter(matcher_bias))
+        self.register_parameter("head", nn.Parameter(head))
+        self.register_parameter("head_bias", nn.Parameter(head_bias))
+
+        self._register_output_weights(head.shape[0], weights, trainable_weights, bias, trainable_bias)
+
+    def compare(self, x, trees: slice = slice(None)):
+        feature_index = self.feature_index[:, trees]
+        features = x.index_select(1, feature_index.flatten()).view(-1, *feature_index.shape)
+        comparisons = features * self.comparator[:, trees] + self.comparator_bias[:, trees]
+        comparisons = self.activation(comparisons)
+        return comparisons
+
+    def match(self, comparisons, trees: slice = slice(None)):
+        n_leaves, _, n_trees = self.path_nodes.shape
+        path_indices, path_positions = self.path_indices, self.path_positions
+        start, stop, _ = trees.indices(n_trees)
+        if stop - start < n_trees:
+            # Keeps the paths of the chunk of trees, with the indices of a forest of stop - start trees
+            tree = path_indices[0] % n_trees
+            in_chunk = (tree >= start) & (tree < stop)
+            tree = tree[in_chunk] - start
+            path_indices = torch.stack([path_indices[0, in_chunk] // n_trees * (stop - start) + tree,
+                                        path_indices[1, in_chunk] // n_trees * (stop - start) + tree])
+            path_positions = path_positions[in_chunk]
+            n_trees = stop - start
+
+        matcher = torch.sparse_coo_tensor(path_indices, self.matcher.flatten()[path_positions],
+                                          (n_leaves * n_trees, self.n_nodes_max * n_trees),
+                                          is_coalesced=True, check_invariants=False)
+        matches = torch.sparse.mm(matcher, comparisons.reshape(len(comparisons), -1).t())
+        matches = matches.view(n_leaves, n_trees, -1).permute(2, 0, 1) + self.matcher_bias[:, trees]
+        matches = self.activation(matches)
+        return matches
+
+    def dense_weights(self) -> List[torch.Tensor]:
+        """Returns the comparator and the matcher with the dense shapes of NeuralRandomForest."""
+        n_leaves, max_depth, n_trees = self.path_nodes.shape
+        nodes = torch.arange(self.n_nodes_max).view(-1, 1)
+        trees = torch.arange(n_trees)
+
+        comparator = torch.zeros(self.n_features, self.n_nodes_max, n_trees)
+        comparator[self.feature_index, nodes, trees] = self.comparator.data
+
+        matcher = torch.zeros(n_leaves, self.n_nodes_max, n_trees)
+        leaves = torch.arange(n_leaves).view(-1, 1, 1).expand_as(self.path_nodes)
+        on_path = self.path_mask.bool()
+        matcher[leaves[on_path], self.path_nodes[on_path], trees.expand_as(self.path_nodes)[on_path]] = \
+            self.matcher.data[on_path]
+        return comparator, matcher
+
+    def return_weights(self):
+        comparator, matcher = self.dense_weights()
+
+        W0 = list(comparator.permute(2,1,0).numpy())
+        B0 = list(self.comparator_bias.data.permute(1,0).numpy())
+
+        W1 = list(matcher.permute(2,0,1).numpy())
+        B1 = list(self.matcher_bias.data.permute(1,0).numpy())
+
+        W2 = list(self.head.data.permute(2,0,1).numpy())
+        B2 = list(self.head_bias.data.permute(1,0).numpy())
+
+        return W0, B0, W1, B1, W2, B2
+
 # Cell
 import torch.nn.functional as F
 
@@ -354,4 +633,45 @@ class CrossEntropyLabelSmoothing(nn.Module):
         n = mask.sum()
 
         loss = (mask * loss).sum() / n
-        return loss
\ No newline at end of file
+        return loss
+
+# Cell
+def test_batched_forest(trees: List[BaseDecisionTree], tree_maker: NeuralTreeMaker, n_jobs: int = 1):
+    """Tests if a forest converted with batched weights, by n_jobs processes, has the same parameters, bit for bit,
+    as the forest converted tree by tree"""
+    from fastcore.test import test_eq
+
+    state = NeuralRandomForest(trees, tree_maker).state_dict()
+    batched_state = NeuralRandomForest(trees, tree_maker, batched=True, n_jobs=n_jobs).state_dict()
+
+    test_eq(list(batched_state), list(state))
+    for name, tensor in state.items():
+        test_eq(batched_state[name], tensor)
+
+# Cell
+def test_sparse_forest(neural_rf: NeuralRandomForest, x: torch.Tensor, y: torch.Tensor, eps=1e-5):
+    """Tests if the SparseNeuralRandomForest of a forest gives the same outputs on x, and the same gradients
+    of the cross entropy with y for the weights it stores, as the forest"""
+    from fastcore.test import test_close
+
+    sparse_rf = SparseNeuralRandomForest.from_dense(neural_rf)
+    outputs = []
+    for forest in [neural_rf, sparse_rf]:
+        forest.zero_grad()
+        output = forest(x)
+        nn.CrossEntropyLoss()(output, y).backward()
+        outputs.append(output.detach())
+    test_close(outputs[1], outputs[0], eps)
+
+    # Gradients of the dense comparator and matcher at the weights of the nodes and of the paths
+    nodes = torch.arange(sparse_rf.n_nodes_max).view(-1, 1)
+    trees = torch.arange(sparse_rf.n_trees)
+    test_close(sparse_rf.comparator.grad, neural_rf.comparator.grad[sparse_rf.feature_index, nodes, trees], eps)
+
+    leaves = torch.arange(sparse_rf.n_leaves_max).view(-1, 1, 1)
+    on_path = sparse_rf.path_mask.bool()
+    test_close(sparse_rf.matcher.grad[on_path],
+               neural_rf.matcher.grad[leaves, sparse_rf.path_nodes, trees][on_path], eps)
+
+    for name in ["comparator_bias", "matcher_bias", "head", "head_bias"]:
+        test_close(getattr(sparse_rf, name).grad, getattr(neural_rf, name).grad, eps)
\ No newline at end of file
@@ -6,10 +6,13 @@ import pickle
 
 import tenseal.sealapi as seal
 from pathlib import Path
+import asyncio
 
 import pickle
-from cryptotree.preprocessing import Featurizer, ColumnSelector, Reshaper
+from cryptotree.preprocessing import Featurizer, ColumnSelector, Reshaper, compile_featurizer
 from cryptotree.cryptotree import HomomorphicTreeFeaturizer
+from cryptotree.seal_helper import seal_to_bytes, seal_from_bytes
+from cryptotree.serving import EvaluationClient
 
 from config import PRECISION_BITS
 
@@ -61,14 +64,13 @@ scale = pow(2.0, PRECISION_BITS)
 pipe = pickle.load(open("preprocess/pipe.pkl", "rb"))
 homomorphic_featurizer = HomomorphicTreeFeaturizer.load("preprocess/homomorphic_featurizer.pkl",
 encoder, encryptor, scale, use_symmetric_key=True)
+# Maps a record straight to the slots of the ciphertext, without pandas nor sklearn on each query
+featurize = compile_featurizer(pipe, homomorphic_featurizer.comparator)
 
 file_name = st.text_input("Input file name", value="data.ctx")
 
 if st.button("Encrypt"):
-    row = {key : [value] for key,value in data.items()}
-    row = pd.DataFrame(row)
-    x = pipe.transform(row).reshape(-1)
-    ctx = homomorphic_featurizer.encrypt(x)
+    ctx = homomorphic_featurizer.encrypt_features(featurize(data), seeded=True)
 
     path = Path("input")
     if not path.exists():
@@ -81,10 +83,23 @@ st.header("III - Decrypting the result")
 output_file_name = st.text_input("Output file name", value="data.ctx")
 st.write("Probability of having a salary > 50k : ")
 
+async def evaluate_remote(ctx, host, port):
+    async with await EvaluationClient.connect_tcp(host, port) as client:
+        output = await client.evaluate(seal_to_bytes(ctx))
+    return seal_from_bytes(seal.Ciphertext, context, output)
+
+use_server = st.checkbox("Send the encrypted data to a running server instead of using files")
+host = st.text_input("Server host", value="127.0.0.1")
+port = st.number_input("Server port", value=8765)
+
 output_path = Path("output")
 if st.button("Decrypt"):
-    ctx = seal.Ciphertext()
-    ctx.load(context, str(output_path/output_file_name))
+    if use_server:
+        ctx = homomorphic_featurizer.encrypt_features(featurize(data), seeded=True)
+        ctx = asyncio.run(evaluate_remote(ctx, host, int(port)))
+    else:
+        ctx = seal.Ciphertext()
+        ctx.load(context, str(output_path/output_file_name))
     ptx = seal.Plaintext()
     decryptor.decrypt(ctx, ptx)
 
@@ -0,0 +1,25 @@
+"""Compilation of the evaluator.
+
+Builds the evaluator from the model, encodes all its plaintexts by evaluating an encryption
+of zeros, and saves it in the model folder, from where the server loads it at startup.
+"""
+
+from cryptotree.seal_helper import load_seal_globals
+from server import build_evaluator, COMPILED_EVALUATOR_PATH
+
+import tenseal.sealapi as seal
+
+if __name__ == "__main__":
+    seal_globals = {}
+    load_seal_globals(seal_globals, load_pk=True)
+
+    tree_evaluator = build_evaluator(seal_globals)
+
+    ptx = seal.Plaintext()
+    seal_globals["encoder"].encode([0.] * seal_globals["encoder"].slot_count(), tree_evaluator.scale, ptx)
+    ctx = seal.Ciphertext()
+    seal_globals["encryptor"].encrypt(ptx, ctx)
+
+    tree_evaluator.compile(ctx)
+    tree_evaluator.save(COMPILED_EVALUATOR_PATH, seal_globals["context"])
+    print(f"Evaluator compiled with {len(tree_evaluator.plaintext_cache)} plaintexts, saved at {COMPILED_EVALUATOR_PATH}")
@@ -2,12 +2,25 @@
 
 This will create the SEAL globals used during computation, such as the public key,
 secret key, the relinearization keys, and the Galois keys, and save them in the
-seal folder.
+seal folder. The encryption parameters are the smallest ones fitting the model.
 """
 
+from cryptotree.cryptotree import plan_encryption_parameters
+from cryptotree.polynomials import polyeval_odd_even
 from cryptotree.seal_helper import create_seal_globals, save_seal_globals
-from config import poly_modulus_degree, moduli, PRECISION_BITS
+from cryptotree.tree import SigmoidTreeMaker
+from config import PRECISION_BITS, UPPER_BITS, dilatation_factor, degree
+
+import pickle
 
 if __name__ == "__main__":
-    create_seal_globals(globals(), poly_modulus_degree, moduli, PRECISION_BITS, use_local=False)
-    save_seal_globals(globals(), save_pk=True, save_sk=True)
\ No newline at end of file
+    h_rf = pickle.load(open("model/h_rf.pkl", "rb"))
+    sigmoid_tree_maker = SigmoidTreeMaker(use_polynomial=True,
+                                      dilatation_factor=dilatation_factor, polynomial_degree=degree)
+
+    plan = plan_encryption_parameters(h_rf, sigmoid_tree_maker.coeffs, polyeval_odd_even,
+                                      PRECISION_BITS, UPPER_BITS)
+    print(plan)
+
+    create_seal_globals(globals(), plan, use_local=False)
+    save_seal_globals(globals(), save_pk=True, save_sk=True, verbose=True)
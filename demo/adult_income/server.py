@@ -1,48 +1,105 @@
-from cryptotree.cryptotree import HomomorphicNeuralRandomForest, HomomorphicTreeEvaluator
-from cryptotree.polynomials import polyeval_tree
+"""Evaluation server.
+
+Starts a pool of worker processes, each loading the SEAL globals and the model once.
+With --port or --socket, serialized ciphertexts are received over a TCP or Unix socket
+and the outputs are sent back on the same connection. With --container, all the ciphertexts
+of a container file are evaluated into an output container. Otherwise, file names are read from
+the standard input, or given as arguments, and evaluated from input/<name> to output/<name>.
+"""
+
+from cryptotree.cryptotree import HomomorphicTreeEvaluator
+from cryptotree.polynomials import polyeval_odd_even
 from cryptotree.seal_helper import load_seal_globals
+from cryptotree.serving import EvaluationServer, AsyncEvaluationServer
 from cryptotree.tree import SigmoidTreeMaker
 
-from config import PRECISION_BITS
+from config import PRECISION_BITS, dilatation_factor, degree
 
+import argparse
+import asyncio
 import pickle
-import tenseal.sealapi as seal
+import sys
 from pathlib import Path
 
-print("Loading SEAL globals ...")
-load_seal_globals(globals())
-print("Loading done.")
-
-scale = pow(2.0, PRECISION_BITS)
-
-print("Loading model ...")
-h_rf = pickle.load(open("model/h_rf.pkl", "rb"))
-dilatation_factor = 16
-polynomial_degree = dilatation_factor
-
-sigmoid_tree_maker = SigmoidTreeMaker(use_polynomial=True,
-                                  dilatation_factor=dilatation_factor, polynomial_degree=polynomial_degree)
-tree_evaluator = HomomorphicTreeEvaluator.from_model(h_rf, sigmoid_tree_maker.coeffs, 
-                                                   polyeval_tree, evaluator, encoder, relin_keys, galois_keys, 
-                                                   scale)
-print("Loading done.")
-print("Ready to compute.")
-
-keep = True
-ctx = seal.Ciphertext()
-input_path = Path("input")
-output_path = Path("output")
-if not input_path.exists():
-    input_path.mkdir()
-if not output_path.exists():
-    output_path.mkdir()
-
-while keep:
-    file = input("Input file name : ")
-    if not file:
-        keep = False
-    ctx.load(context, str(input_path/file))
-    print(f"Computing result on {file}")
-    output = tree_evaluator(ctx)
-    print(f"Computation done, saving file at {output_path/file}")
-    output.save(str(output_path/file))
\ No newline at end of file
+COMPILED_EVALUATOR_PATH = Path("model/evaluator.cte")
+
+def build_evaluator(seal_globals):
+    """Builds the evaluator from the model, and the activation from its Chebyshev approximation."""
+    scale = pow(2.0, PRECISION_BITS)
+
+    h_rf = pickle.load(open("model/h_rf.pkl", "rb"))
+
+    sigmoid_tree_maker = SigmoidTreeMaker(use_polynomial=True,
+                                      dilatation_factor=dilatation_factor, polynomial_degree=degree)
+    tree_evaluator = HomomorphicTreeEvaluator.from_model(h_rf, sigmoid_tree_maker.coeffs,
+                                                       polyeval_odd_even, seal_globals["evaluator"],
+                                                       seal_globals["encoder"], seal_globals["relin_keys"],
+                                                       seal_globals["galois_keys"], scale)
+    return tree_evaluator
+
+def load_evaluator():
+    """Loads the SEAL globals and the evaluator, which is done once in each worker.
+
+    The evaluator compiled by compile_evaluator.py is used if there is one, which skips the
+    model and the encoding of the plaintexts."""
+    seal_globals = {}
+    load_seal_globals(seal_globals)
+
+    if COMPILED_EVALUATOR_PATH.exists():
+        tree_evaluator = HomomorphicTreeEvaluator.load(COMPILED_EVALUATOR_PATH, seal_globals["context"],
+                                                       seal_globals["evaluator"], seal_globals["encoder"],
+                                                       seal_globals["relin_keys"], seal_globals["galois_keys"])
+    else:
+        tree_evaluator = build_evaluator(seal_globals)
+    return seal_globals["context"], tree_evaluator
+
+async def serve(server, args):
+    async_server = AsyncEvaluationServer(server)
+    if args.socket:
+        socket_server = await async_server.start_unix(args.socket)
+    else:
+        socket_server = await async_server.start_tcp(args.host, args.port)
+    print(f"Listening on {args.socket or f'{args.host}:{args.port}'}")
+    async with socket_server:
+        await socket_server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="*", help="Files of the input folder to evaluate")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes, one per core by default")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on with --port")
+    parser.add_argument("--port", type=int, default=None, help="Serve ciphertexts over TCP on this port")
+    parser.add_argument("--socket", default=None, help="Serve ciphertexts over a Unix socket at this path")
+    parser.add_argument("--container", nargs=2, metavar=("INPUT", "OUTPUT"), default=None,
+                        help="Evaluate every ciphertext of a container file into an output container")
+    args = parser.parse_args()
+
+    input_path = Path("input")
+    output_path = Path("output")
+    if not input_path.exists():
+        input_path.mkdir()
+    if not output_path.exists():
+        output_path.mkdir()
+
+    print("Loading workers ...")
+    with EvaluationServer(load_evaluator, n_workers=args.workers) as server:
+        print(f"Ready to compute with {server.n_workers} workers.")
+
+        if args.port or args.socket:
+            asyncio.run(serve(server, args))
+        elif args.container:
+            n_requests = server.evaluate_container(*args.container)
+            print(f"Computation done for {n_requests} requests, saved at {args.container[1]}")
+        elif args.files:
+            for output_file in server.map_files((input_path/file, output_path/file) for file in args.files):
+                print(f"Computation done, saved at {output_file}")
+        else:
+            print("Input file name : ")
+            for line in sys.stdin:
+                file = line.strip()
+                if not file:
+                    break
+                print(f"Computing result on {file}")
+                server.submit_file(input_path/file, output_path/file,
+                                   callback=lambda output_file: print(f"Computation done, saved at {output_file}"),
+                                   error_callback=lambda e: print(f"Computation failed : {e}"))